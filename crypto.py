@@ -12,14 +12,20 @@
 
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad
+from functools import lru_cache
 import binascii
+import numpy as np
+
+ZERO_IV = bytes(16)
+
+# Keyring file key ID used when a frame's ID has no key of its own
+DEFAULT_KEY_ID = "default"
 
 def hex_to_bytes(hex_str):
     try:
         return binascii.unhexlify(hex_str)
     except binascii.Error:
-        print("Error: Entrada no válida. Asegúrate de que sea hexadecimal.")
-        exit(1)
+        raise ValueError("Entrada no válida. Asegúrate de que sea hexadecimal.")
 
 def parse_key_input(key_input):
     key_input = key_input.strip()
@@ -31,12 +37,11 @@ def parse_key_input(key_input):
             key_bytes = bytes(int(b.strip(), 16) for b in bytes_list)
             return key_bytes
         except ValueError:
-            exit(1)
+            raise ValueError("Entrada no válida. Formato esperado: 0xAA, 0xBB, ...")
     else:
         # Hex plano
         if len(key_input) != 32:
-            print("Error: La clave debe tener 32 caracteres hexadecimales (16 bytes).")
-            exit(1)
+            raise ValueError("La clave debe tener 32 caracteres hexadecimales (16 bytes).")
         return hex_to_bytes(key_input)
 
 def encrypt_aes( payload: bytearray, key_hex: str ):
@@ -53,12 +58,90 @@ def encrypt_aes( payload: bytearray, key_hex: str ):
         print(f"Error al encriptar: {e}")
     return cipher_payload
 
+@lru_cache(maxsize=None)
+def ecb_cipher(key_hex: str):
+    # Key parsed and expanded once. ECB objects keep no chaining state,
+    # so one can be shared by every frame and thread using the key.
+    return AES.new(parse_key_input(key_hex), AES.MODE_ECB)
+
+def cbc_decrypt_blocks(ecb, payloads, iv=ZERO_IV):
+    """CBC decrypt equal length payloads with a single cipher call.
+
+    P[i] = D(C[i]) ^ C[i-1], with C[-1] = iv for every payload.
+    """
+    data = b"".join(payloads)
+    length = len(payloads[0])
+    cipher = np.frombuffer(data, dtype=np.uint8).reshape(len(payloads), length)
+    plain = np.frombuffer(ecb.decrypt(data), dtype=np.uint8).reshape(len(payloads), length).copy()
+    plain[:, :AES.block_size] ^= np.frombuffer(iv, dtype=np.uint8)
+    plain[:, AES.block_size:] ^= cipher[:, :-AES.block_size]
+    return [row.tobytes() for row in plain]
+
 def decrypt_aes(payload: bytearray, key_hex: str) -> bytes:
-    key = parse_key_input(key_hex)
-    iv = bytes([0] * 16)  # IV de 16 bytes en cero
     try:
-        cipher = AES.new(key, AES.MODE_CBC, iv)
-        decrypted_payload = cipher.decrypt(payload)
+        decrypted_payload = cbc_decrypt_blocks(ecb_cipher(key_hex), [bytes(payload)])[0]
     except Exception as e:
         print(f"Error al desencriptar: {e}")
     return decrypted_payload
+
+class Keyring():
+    """AES keys by key ID, expanded once when loaded.
+
+    Key IDs are integers taken from the frame header (see the decoder's
+    key selection); a DEFAULT_KEY_ID key, if any, covers every other ID.
+    """
+    def __init__(self):
+        self.ciphers = {}
+
+    def add(self, key_id, key_hex):
+        self.ciphers[key_id] = ecb_cipher(key_hex)
+
+    @classmethod
+    def single(cls, key_hex):
+        keyring = cls()
+        keyring.add(DEFAULT_KEY_ID, key_hex)
+        return keyring
+
+    @classmethod
+    def load(cls, path):
+        """Read a keyring file, one "<key id> <key>" pair per line.
+
+        The key ID is a number (decimal or 0x hex) or "default", the key
+        32 hex characters or "0xAA, 0xBB, ..." as for the other functions
+        here. Blank lines and lines starting with # are ignored.
+        """
+        keyring = cls()
+        with open(path) as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                fields = line.split(None, 1)
+                if len(fields) != 2:
+                    raise ValueError(f"{path}:{lineno}: expected <key id> <key>")
+                try:
+                    key_id = fields[0] if fields[0] == DEFAULT_KEY_ID else int(fields[0], 0)
+                    keyring.add(key_id, fields[1])
+                except ValueError as e:
+                    raise ValueError(f"{path}:{lineno}: {e}")
+        return keyring
+
+    def cipher(self, key_id):
+        return self.ciphers.get(key_id, self.ciphers.get(DEFAULT_KEY_ID))
+
+    def decrypt_batch(self, payloads, key_ids, iv=ZERO_IV):
+        """Decrypt many payloads, one cipher call per key and payload length.
+
+        Returns the plaintexts in order, None for payloads without a key.
+        Payload lengths must be multiples of the AES block size.
+        """
+        out = [None] * len(payloads)
+        groups = {}
+        for i, (payload, key_id) in enumerate(zip(payloads, key_ids)):
+            ecb = self.cipher(key_id)
+            if ecb is not None:
+                groups.setdefault((id(ecb), len(payload)), (ecb, []))[1].append(i)
+        for ecb, idx in groups.values():
+            for i, plain in zip(idx, cbc_decrypt_blocks(ecb, [payloads[i] for i in idx], iv)):
+                out[i] = plain
+        return out
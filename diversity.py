@@ -0,0 +1,196 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 19:10:27
+
+ Diversity combining of the frames of several receivers.
+
+ Every receiver (antenna or SDR) sends its own PDU stream. Copies of the
+ same frame are found by their channel bits rather than by time: frames
+ of the same kind that arrive within the window and differ in at most
+ COPY_MAX_DISTANCE of their hard bits are grouped, one copy per receiver.
+ Receivers cut the frame at their own ASM match, so a copy may be slipped
+ by a few bits: it is aligned first, at the shift within SLIP_MARGIN bits
+ that best matches the group's reference, the best copy by ASM score or,
+ from three copies on, their bitwise majority vote. A group is closed once
+ every receiver has sent its copy or the window is over.
+
+ The copies of a group are ranked best first: by the ASM score from the
+ PDU header (legacy PDUs have none and come last), or, with three copies
+ or more, by their distance to the majority vote, which estimates the bit
+ errors Viterbi would have to correct. After the copies comes a combined
+ one, aligned to the best copy: the soft symbols of all copies summed and
+ scaled back to 8 bits, or the majority vote of three or more hard
+ copies. The decoder tries the next one only when the previous failed.
+
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from pdu_format import unpack_pdu, pack_pdu, FLAG_SOFT, FLAG_MARGIN, SLIP_MARGIN
+
+
+# Seconds a group waits for the copies of the other receivers
+COMBINE_WINDOW = 0.2
+# Largest fraction of differing hard bits between two copies of a frame,
+# different frames differ in about half of them
+COPY_MAX_DISTANCE = 0.35
+
+
+# Bits around the middle of the frame used to find the shift of a copy
+ALIGN_WINDOW = 1024
+
+
+def shifted(values, shift, fill):
+    # values[k + shift] at k, fill where that falls outside values
+    out = np.full(len(values), fill, dtype=values.dtype)
+    if shift >= 0:
+        out[:len(values) - shift] = values[shift:]
+    else:
+        out[-shift:] = values[:shift]
+    return out
+
+
+class CopyGroup():
+    def __init__(self, nbits, soft, deadline):
+        self.nbits = nbits
+        self.soft = soft
+        self.deadline = deadline
+        # (source, datagram, meta, hard bits, soft symbols or None, shift to the first copy)
+        self.copies = []
+
+    def add(self, source, datagram, meta, bits, symbols, shift=0):
+        self.copies.append((source, datagram, meta, bits, symbols, shift))
+
+    def has_source(self, source):
+        return any(copy[0] == source for copy in self.copies)
+
+    def best(self):
+        return min(self.copies, key=lambda copy: copy[2].asm_score)
+
+    def signs(self, copy, shift=0):
+        # Hard bits of a copy as -1/+1, aligned to the first copy shifted by shift, 0 where unknown
+        return shifted(copy[3].astype(np.int8) * 2 - 1, copy[5] + shift, 0)
+
+    def reference(self):
+        """-1/+1 per bit of the first copy's alignment: the best copy, or the majority vote from three copies."""
+        best = self.signs(self.best())
+        if len(self.copies) < 3:
+            return best
+        votes = np.sum([self.signs(copy) for copy in self.copies], axis=0, dtype=np.int32)
+        # Ties go to the best copy
+        return np.sign(2 * votes + best).astype(np.int8)
+
+    def align(self, bits):
+        """(shift, fraction of differing bits) of the alignment of bits that best matches the reference."""
+        ref = self.reference()
+        signs = bits.astype(np.int8) * 2 - 1
+        # Every shift on a window around the middle, then the whole frame at the best one
+        length = min(ALIGN_WINDOW, self.nbits - 2 * SLIP_MARGIN)
+        if length > 0:
+            lo = (self.nbits - length) // 2
+            windows = sliding_window_view(signs[lo - SLIP_MARGIN:lo + SLIP_MARGIN + length], length)
+            differ = np.count_nonzero(windows != ref[lo:lo + length], axis=1)
+            shift = int(np.argmin(differ)) - SLIP_MARGIN
+        else:
+            shift = 0
+        product = ref * shifted(signs, shift, 0)
+        return shift, np.count_nonzero(product < 0) / max(1, np.count_nonzero(product))
+
+    def distance(self, copy, reference):
+        # Differing hard bits to the reference, aligned
+        return np.count_nonzero(reference * self.signs(copy) < 0)
+
+    def ranked(self):
+        """The datagrams to try, best copy first, then the combined copy if there is one."""
+        if len(self.copies) >= 3:
+            reference = self.reference()
+            order = sorted(self.copies, key=lambda copy: (self.distance(copy, reference), copy[2].asm_score))
+        else:
+            order = sorted(self.copies, key=lambda copy: copy[2].asm_score)
+        attempts = [copy[1] for copy in order]
+        combined = self.combined(order[0])
+        if combined is not None:
+            attempts.append(combined)
+        return attempts
+
+    def combined(self, best):
+        # Aligned to the best copy, which the datagram is built from
+        meta, shift = best[2], -best[5]
+        margin = SLIP_MARGIN if meta.flags & FLAG_MARGIN else 0
+        if self.soft and len(self.copies) >= 2:
+            # Offset binary soft symbols, summed around the 128 midpoint without saturating,
+            # then scaled back so the strongest sum just fits in 8 bits
+            total = np.sum([shifted(copy[4].astype(np.int32) - 128, copy[5] + shift, 0) for copy in self.copies],
+                           axis=0)
+            peak = np.abs(total).max()
+            if peak > 127:
+                total = np.rint(total * (127 / peak)).astype(np.int32)
+            symbols = (total + 128).astype(np.uint8)
+            return pack_pdu(symbols >> 7, meta.seq, meta.offset, meta.timestamp, meta.asm_score,
+                            soft=symbols, margin=margin)
+        if len(self.copies) >= 3:
+            votes = np.sum([self.signs(copy, shift) for copy in self.copies], axis=0, dtype=np.int32)
+            bits = (2 * votes + self.signs(best, shift) > 0).astype(np.uint8)
+            return pack_pdu(bits, meta.seq, meta.offset, meta.timestamp, meta.asm_score, margin=margin)
+        return None
+
+
+class DiversityCombiner():
+    """Groups the copies of every frame received by sources receivers."""
+    def __init__(self, sources, window=COMBINE_WINDOW, max_distance=COPY_MAX_DISTANCE):
+        self.sources = sources
+        self.window = window
+        self.max_distance = max_distance
+        self.groups = []
+        # Datagrams that could not be parsed, passed on alone for the decoder to report
+        self.singles = []
+
+        self.frames = 0
+        self.copies = 0
+
+    def push(self, source, datagram, now):
+        try:
+            meta, frame = unpack_pdu(datagram)
+        except ValueError:
+            self.singles.append(([datagram], 1))
+            return
+        soft = bool(meta.flags & FLAG_SOFT)
+        if soft:
+            symbols = np.frombuffer(frame, dtype=np.uint8, count=meta.nbits)
+            bits = symbols >> 7
+        else:
+            symbols = None
+            bits = np.unpackbits(np.frombuffer(frame, dtype=np.uint8), count=meta.nbits)
+        self.copies += 1
+
+        for group in self.groups:
+            if group.nbits != meta.nbits or group.soft != soft or group.has_source(source):
+                continue
+            shift, distance = group.align(bits)
+            if distance <= self.max_distance:
+                group.add(source, datagram, meta, bits, symbols, shift)
+                return
+        group = CopyGroup(meta.nbits, soft, now + self.window)
+        group.add(source, datagram, meta, bits, symbols)
+        self.groups.append(group)
+        self.frames += 1
+
+    def pop_ready(self, now, flush=False):
+        """(datagrams to try, number of copies) of the groups that are complete or out of time."""
+        ready = self.singles
+        self.singles = []
+        waiting = []
+        for group in self.groups:
+            if flush or len(group.copies) >= self.sources or now >= group.deadline:
+                ready.append((group.ranked(), len(group.copies)))
+            else:
+                waiting.append(group)
+        self.groups = waiting
+        return ready
+
+    def next_deadline(self):
+        return min((group.deadline for group in self.groups), default=None)
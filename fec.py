@@ -25,6 +25,12 @@ import hashlib
 import hmac
 import ctypes
 import codecs
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 VITERBI_RATE = 2
 VITERBI_TAIL = 1
@@ -33,8 +39,13 @@ VITERBI_CONSTRAINT = 7
 BITS_PER_BYTE = 8
 MAX_FEC_LENGTH = 255
 
+# Soft symbols are one byte per channel bit, 0 = strong zero, 255 = strong one
+SOFT_MAX = 255
+
 RS_LENGTH = 32
 RS_BLOCK_LENGTH = 255
+# Codewords per interleaved block, see fec/rs_interleave.h
+RS_MAX_DEPTH = 8
 ASM_LENGTH = 4
 
 HMAC_LENGTH = 2
@@ -46,6 +57,21 @@ CSP_OVERHEAD = 4
 SHORT_FRAME_LIMIT = 25
 LONG_FRAME_LIMIT = 86
 
+# decode_batch steps and per frame status codes, see fec/frame.h
+FRAME_VITERBI = 0x01
+FRAME_RANDOMIZE = 0x02
+FRAME_RS = 0x04
+FRAME_SOFT = 0x08
+FRAME_ERASURES = 0x10
+
+FRAME_OK = 0
+FRAME_ASM_MISMATCH = 1
+FRAME_RS_FAILED = 2
+
+# Per frame timing slots of decode_batch(stage_ns=...)
+FRAME_STAGE_NAMES = ("viterbi", "asm", "derandomize", "rs")
+FRAME_STAGES = len(FRAME_STAGE_NAMES)
+
 path = os.path.dirname(os.path.abspath(__file__))
 bbfec = ctypes.CDLL(path + "/bbfec.so")
 
@@ -59,12 +85,24 @@ bbfec.init_viterbi.restype = ctypes.c_int
 bbfec.update_viterbi.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_uint16]
 bbfec.update_viterbi.restype = ctypes.c_int
 
+bbfec.update_viterbi_soft.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_uint16]
+bbfec.update_viterbi_soft.restype = ctypes.c_int
+
 bbfec.chainback_viterbi.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_uint, ctypes.c_uint]
 bbfec.chainback_viterbi.restype = ctypes.c_int
 
 bbfec.delete_viterbi.argtypes = [ctypes.c_void_p]
 bbfec.delete_viterbi.restype = None
 
+bbfec.viterbi_set_impl.argtypes = [ctypes.c_int]
+bbfec.viterbi_set_impl.restype = ctypes.c_int
+
+bbfec.viterbi_get_impl.argtypes = []
+bbfec.viterbi_get_impl.restype = ctypes.c_int
+
+bbfec.viterbi_impl_name.argtypes = [ctypes.c_int]
+bbfec.viterbi_impl_name.restype = ctypes.c_char_p
+
 bbfec.encode_viterbi.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
 bbfec.encode_viterbi.restype = None
 
@@ -72,9 +110,27 @@ bbfec.encode_viterbi.restype = None
 bbfec.encode_rs.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
 bbfec.encode_rs.restype = None
 
-bbfec.decode_rs.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int, ctypes.c_int]
+bbfec.decode_rs.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_int), ctypes.c_int, ctypes.c_int]
 bbfec.decode_rs.restype = ctypes.c_int
 
+bbfec.encode_rs_interleaved.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.c_int]
+bbfec.encode_rs_interleaved.restype = None
+
+bbfec.decode_rs_interleaved.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+bbfec.decode_rs_interleaved.restype = ctypes.c_int
+
+bbfec.rs_syndromes_batch.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_char_p]
+bbfec.rs_syndromes_batch.restype = ctypes.c_int
+
+bbfec.rs_syndrome_set_impl.argtypes = [ctypes.c_int]
+bbfec.rs_syndrome_set_impl.restype = ctypes.c_int
+
+bbfec.rs_syndrome_get_impl.argtypes = []
+bbfec.rs_syndrome_get_impl.restype = ctypes.c_int
+
+bbfec.rs_syndrome_impl_name.argtypes = [ctypes.c_int]
+bbfec.rs_syndrome_impl_name.restype = ctypes.c_char_p
+
 # randomizer
 bbfec.ccsds_generate_sequence.argtypes = [ctypes.c_char_p, ctypes.c_int]
 bbfec.ccsds_generate_sequence.restype = None
@@ -82,24 +138,51 @@ bbfec.ccsds_generate_sequence.restype = None
 bbfec.ccsds_xor_sequence.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
 bbfec.ccsds_xor_sequence.restype = None
 
+# frame
+bbfec.decode_frames.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                ctypes.c_uint32, ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_int,
+                                ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+                                ctypes.c_void_p]
+bbfec.decode_frames.restype = ctypes.c_int
+
 TESTDATA = codecs.decode("8c2f7e0d72a97361da9181deee8eea10ea62ced991e7ecd66b25cbea5932fcce4933694bf5839cbe4ab4e63e95421d1bf2af1d0c6d51952ae696ad85a138cef6a1b1dbeb1880399b86e8b03109846a15e255", "hex")
 
 
 class PacketHandler():
-    def __init__(self, key=None, viterbi=True, rs=True, randomize=True):
-        self.ccsds_sequence = ctypes.create_string_buffer(MAX_FEC_LENGTH)
+    def __init__(self, key=None, viterbi=True, rs=True, randomize=True, erasures=False, interleave=1):
+        if not 1 <= interleave <= RS_MAX_DEPTH:
+            raise ValueError("Interleaving depth must be 1 to {0}".format(RS_MAX_DEPTH))
+        # RS codewords per frame, byte interleaved
+        self.interleave = interleave
+        self.fec_length = MAX_FEC_LENGTH * interleave
+
+        self.ccsds_sequence = ctypes.create_string_buffer(self.fec_length)
 
-        bbfec.ccsds_generate_sequence(self.ccsds_sequence, MAX_FEC_LENGTH)
+        bbfec.ccsds_generate_sequence(self.ccsds_sequence, self.fec_length)
 
-        self.vp = bbfec.create_viterbi((MAX_FEC_LENGTH + ASM_LENGTH) * BITS_PER_BYTE)
+        self.vp = bbfec.create_viterbi((self.fec_length + ASM_LENGTH) * BITS_PER_BYTE)
+        # Extra Viterbi instances and threads for decode_batch(threads=...), made on first use
+        self.thread_vps = []
+        self.pool = None
+        self.pool_size = 0
 
         self.key = hashlib.sha1(codecs.encode(key, "ascii")).digest()[:HMAC_KEY_LENGTH] if key else None
         self.viterbi = viterbi
         self.rs = rs
         self.randomize = randomize
+        # Retry failed RS blocks with unreliable bytes erased (decode_batch only)
+        self.erasures = erasures
 
     def __del__(self):
-        bbfec.delete_viterbi(self.vp)
+        if getattr(self, "pool", None):
+            self.pool.shutdown()
+            self.pool = None
+        for vp in getattr(self, "thread_vps", []):
+            bbfec.delete_viterbi(vp)
+        self.thread_vps = []
+        if getattr(self, "vp", None):
+            bbfec.delete_viterbi(self.vp)
+            self.vp = None
 
     # def hexdump(self, src, length=16):
     #     filt = "".join([(len(repr(chr(x))) == 3) and chr(x) or "." for x in range(256)])
@@ -126,8 +209,18 @@ class PacketHandler():
 
 
     def tx_frame_length(self, data):
+        if self.interleave > 1:
+            # Every codeword carries the same share, shortened to fit the data
+            return -(-(SIZE_LENGTH + data) // self.interleave) * self.interleave
         return SIZE_LENGTH + CSP_OVERHEAD + (SHORT_FRAME_LIMIT if (data - CSP_OVERHEAD) <= SHORT_FRAME_LIMIT else LONG_FRAME_LIMIT)
 
+    def decode_rs(self, data_mutable, rx_length):
+        # rx_length bytes of interleaved codewords, corrected in place
+        pad = RS_BLOCK_LENGTH - int(rx_length) // self.interleave
+        if self.interleave == 1:
+            return bbfec.decode_rs(data_mutable, None, 0, int(pad))
+        return bbfec.decode_rs_interleaved(data_mutable, self.interleave, int(pad), None)
+
     def hmac_append(self, data):
         size = len(data) - CSP_OVERHEAD + HMAC_LENGTH
         hmkey = hmac.new(self.key, data[:CSP_OVERHEAD + size], hashlib.sha1).digest()[:HMAC_LENGTH]
@@ -146,7 +239,10 @@ class PacketHandler():
         return data[:CSP_OVERHEAD + size]
 
 
-    def decode_viterbi(self, data):
+    def decode_viterbi(self, data, soft=False):
+        if soft:
+            return self.decode_viterbi_soft(data)
+
         rx_length = int(len(data))
         data_mutable = ctypes.create_string_buffer(data)
         bit_corr = 0
@@ -159,9 +255,27 @@ class PacketHandler():
             bit_corr = bbfec.chainback_viterbi(self.vp, data_mutable, int(rx_length * BITS_PER_BYTE), int(0))
             
         return data_mutable, bit_corr, byte_corr
-    
-    
-    def decode_fec(self, data):
+
+
+    def decode_viterbi_soft(self, symbols):
+        # One soft symbol byte per channel bit, so the output is 8 times smaller
+        if not self.viterbi:
+            raise Exception("Soft symbols require Viterbi decoding")
+
+        symbols = bytes(symbols)
+        data_mutable = ctypes.create_string_buffer(len(symbols) // BITS_PER_BYTE)
+        byte_corr = 0
+
+        rx_length = (len(symbols) / BITS_PER_BYTE / VITERBI_RATE) - VITERBI_TAIL
+        bbfec.init_viterbi(self.vp, 0)
+        bbfec.update_viterbi_soft(self.vp, symbols, int((rx_length * BITS_PER_BYTE) + (VITERBI_CONSTRAINT - 1)))
+        bit_corr = bbfec.chainback_viterbi(self.vp, data_mutable, int(rx_length * BITS_PER_BYTE), int(0))
+
+        return data_mutable, bit_corr, byte_corr
+
+
+    def decode_fec(self, data, eras_pos=None):
+        # eras_pos: optional byte positions in data known to be unreliable
         rx_length = int(len(data))
         payload_mutable = ctypes.create_string_buffer(data)
         bit_corr = 0
@@ -172,8 +286,15 @@ class PacketHandler():
 
         if self.rs:
             pad = RS_BLOCK_LENGTH - RS_LENGTH - (rx_length - RS_LENGTH)
-            byte_corr = bbfec.decode_rs(payload_mutable, None, 0, int(pad))
-            rx_length = rx_length - RS_LENGTH
+            if eras_pos:
+                if self.interleave > 1:
+                    raise Exception("Erasure positions need interleaving depth 1")
+                # decode_rs() takes positions in the full codeword and writes the error locations back
+                eras = (ctypes.c_int * RS_LENGTH)(*[pos + pad for pos in eras_pos[:RS_LENGTH]])
+                byte_corr = bbfec.decode_rs(payload_mutable, eras, min(len(eras_pos), RS_LENGTH), int(pad))
+            else:
+                byte_corr = self.decode_rs(payload_mutable, rx_length)
+            rx_length = rx_length - RS_LENGTH * self.interleave
             if byte_corr == -1:
                 raise Exception("Reed-Solomon decoding error")
 
@@ -196,24 +317,107 @@ class PacketHandler():
             bbfec.ccsds_xor_sequence(data_mutable, self.ccsds_sequence, int(rx_length))
 
         if self.rs:
-            pad = RS_BLOCK_LENGTH - RS_LENGTH - (rx_length - RS_LENGTH)
-            byte_corr = bbfec.decode_rs(data_mutable, None, 0, int(pad))
-            rx_length = rx_length - RS_LENGTH
+            byte_corr = self.decode_rs(data_mutable, rx_length)
+            rx_length = rx_length - RS_LENGTH * self.interleave
             if byte_corr == -1:
                 raise Exception("Reed-Solomon decoding error")
 
         return data_mutable, bit_corr, byte_corr
 
 
+    def decode_batch(self, frames, soft=False, asm_word=0, asm_threshold=0, block_len=None, stage_ns=None,
+                     threads=1, depth=None):
+        """Decode N received frames in one native call.
+
+        frames is a (N, frame_len) uint8 array holding packed frames, or one
+        soft symbol per channel bit when soft is set. Each frame runs
+        Viterbi, the ASM check against asm_word, derandomization and RS
+        decoding of the block_len bytes following the ASM (by default
+        RS_BLOCK_LENGTH per interleaved codeword). depth overrides the
+        handler's interleaving depth, e.g. for short frames of one codeword
+        next to interleaved long ones. With erasures enabled,
+        codewords RS cannot decode are retried with the bytes the Viterbi
+        decoder was least sure of marked as erasures.
+
+        With threads > 1 the batch is split over that many threads, each
+        with its own Viterbi instance; the native code runs without the GIL.
+
+        Returns (blocks, bit_corr, byte_corr, asm_matches, status) as arrays,
+        blocks being (N, block_len) and only valid where status is FRAME_OK.
+
+        If stage_ns, a (N, FRAME_STAGES) uint64 array, is given it is filled
+        with the nanoseconds each frame spent in every FRAME_STAGE_NAMES step.
+        """
+        frames = np.ascontiguousarray(frames, dtype=np.uint8)
+        if frames.ndim != 2:
+            raise ValueError("frames must be a (N, frame_len) array")
+        nframes, frame_len = frames.shape
+        if depth is None:
+            depth = self.interleave
+        if not 1 <= depth <= self.interleave:
+            raise ValueError("Interleaving depth must be 1 to {0}".format(self.interleave))
+        if block_len is None:
+            block_len = RS_BLOCK_LENGTH * depth
+
+        if soft and not self.viterbi:
+            raise Exception("Soft symbols require Viterbi decoding")
+
+        flags = (FRAME_VITERBI if self.viterbi else 0) | (FRAME_RANDOMIZE if self.randomize else 0) | \
+                (FRAME_RS if self.rs else 0) | (FRAME_SOFT if soft else 0) | \
+                (FRAME_ERASURES if self.erasures else 0)
+
+        blocks = np.empty((nframes, block_len), dtype=np.uint8)
+        bit_corr = np.empty(nframes, dtype=np.intc)
+        byte_corr = np.empty(nframes, dtype=np.intc)
+        asm_matches = np.empty(nframes, dtype=np.intc)
+        status = np.empty(nframes, dtype=np.intc)
+        if stage_ns is not None and (stage_ns.shape != (nframes, FRAME_STAGES) or stage_ns.dtype != np.uint64
+                                     or not stage_ns.flags.c_contiguous):
+            raise ValueError("stage_ns must be a contiguous ({0}, {1}) uint64 array".format(nframes, FRAME_STAGES))
+
+        def run(vp, lo, hi):
+            return bbfec.decode_frames(vp, frames[lo:hi].ctypes.data, hi - lo, frame_len, flags,
+                                       asm_word, asm_threshold, self.ccsds_sequence, block_len, depth,
+                                       blocks[lo:hi].ctypes.data, bit_corr[lo:hi].ctypes.data,
+                                       byte_corr[lo:hi].ctypes.data, asm_matches[lo:hi].ctypes.data,
+                                       status[lo:hi].ctypes.data,
+                                       stage_ns[lo:hi].ctypes.data if stage_ns is not None else None)
+
+        threads = max(1, min(threads, nframes))
+        if threads > 1:
+            while len(self.thread_vps) < threads - 1:
+                self.thread_vps.append(bbfec.create_viterbi((self.fec_length + ASM_LENGTH) * BITS_PER_BYTE))
+            if self.pool_size < threads:
+                if self.pool:
+                    self.pool.shutdown()
+                self.pool = ThreadPoolExecutor(max_workers=threads)
+                self.pool_size = threads
+            bounds = [nframes * k // threads for k in range(threads + 1)]
+            rets = list(self.pool.map(run, [self.vp] + self.thread_vps[:threads - 1], bounds[:-1], bounds[1:]))
+        elif nframes:
+            rets = [run(self.vp, 0, nframes)]
+        else:
+            rets = []
+        if any(ret < 0 for ret in rets):
+            raise ValueError("Invalid frame batch of {0} x {1} bytes".format(nframes, frame_len))
+
+        return blocks, bit_corr, byte_corr, asm_matches, status
+
+
     def encode(self, data):
         tx_length = self.tx_frame_length(len(data))
+        if tx_length > (RS_BLOCK_LENGTH - RS_LENGTH) * self.interleave:
+            raise ValueError("{0} bytes do not fit in {1} codewords".format(len(data), self.interleave))
         data = struct.pack(">H", len(data) - CSP_OVERHEAD) + data
-        data_mutable = ctypes.create_string_buffer(data, MAX_FEC_LENGTH)
+        data_mutable = ctypes.create_string_buffer(data, self.fec_length)
 
         if self.rs:
-            pad = RS_BLOCK_LENGTH - RS_LENGTH - tx_length
-            bbfec.encode_rs(data_mutable, ctypes.cast(ctypes.byref(data_mutable, tx_length), ctypes.POINTER(ctypes.c_char)), pad)
-            tx_length += RS_LENGTH
+            pad = RS_BLOCK_LENGTH - RS_LENGTH - tx_length // self.interleave
+            if self.interleave == 1:
+                bbfec.encode_rs(data_mutable, ctypes.cast(ctypes.byref(data_mutable, tx_length), ctypes.POINTER(ctypes.c_char)), pad)
+            else:
+                bbfec.encode_rs_interleaved(data_mutable, self.interleave, pad)
+            tx_length += RS_LENGTH * self.interleave
 
         if self.randomize:
             bbfec.ccsds_xor_sequence(data_mutable, self.ccsds_sequence, tx_length)
@@ -235,7 +439,236 @@ class PacketHandler():
         data = self.encode(data)
         return data
 
+def stress_test(threads=8, frames=256, rounds=4, seed=0):
+    """Decode the same noisy frames from several threads at once.
+
+    Every thread owns its own PacketHandler (and so its own Viterbi
+    instance); results must be bit-exact with a single threaded pass.
+    """
+    rng = random.Random(seed)
+    ec = PacketHandler(None)
+    encoded = []
+    for _ in range(frames):
+        size = rng.randint(CSP_OVERHEAD + 1, CSP_OVERHEAD + LONG_FRAME_LIMIT - SIZE_LENGTH)
+        frame = bytearray(ec.frame(bytes(rng.getrandbits(8) for _ in range(size))))
+        for bit in rng.sample(range(len(frame) * BITS_PER_BYTE), 6):
+            frame[bit // BITS_PER_BYTE] ^= 0x80 >> (bit % BITS_PER_BYTE)
+        encoded.append(bytes(frame))
+
+    def run(handler):
+        results = []
+        for frame in encoded:
+            try:
+                data, bit_corr, byte_corr = handler.deframe(frame)
+                results.append((data.raw, bit_corr, byte_corr))
+            except Exception as e:
+                results.append((str(e), -1, -1))
+        return results
+
+    reference = run(ec)
+    local = threading.local()
+
+    def worker(_):
+        if not hasattr(local, "ec"):
+            local.ec = PacketHandler(None)
+        return run(local.ec)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        mismatches = sum(result != reference for result in pool.map(worker, range(threads * rounds)))
+
+    print("Stress test: {0} threads, {1} frames x {2} runs, {3} mismatching runs".format(
+        threads, frames, threads * rounds, mismatches))
+    return mismatches == 0
+
+
+def interleave_test(frames=32, seed=0):
+    """Round trip every interleaving depth through encode() and decode_batch().
+
+    Each RS-only frame gets a burst of 16 * depth corrupted bytes, which
+    interleaving must spread to at most 16 per codeword. Full frames (ASM
+    and Viterbi) with random bit errors go through decode_batch() on two
+    threads and must give the same block as decode_fec() of the clean one.
+    At the deepest interleaving the full frames are then sent again with
+    1% of their channel bits flipped, and bit_corr must count them all.
+    """
+    rng = random.Random(seed)
+    failures = 0
+    asm_word = 0xe15ae893
+    for depth in range(1, RS_MAX_DEPTH + 1):
+        rs_only = PacketHandler(None, viterbi=False, interleave=depth)
+        full = PacketHandler(None, interleave=depth)
+        if depth == 1:
+            size = CSP_OVERHEAD + LONG_FRAME_LIMIT - SIZE_LENGTH
+        else:
+            size = (RS_BLOCK_LENGTH - RS_LENGTH) * depth - SIZE_LENGTH - rng.randint(0, depth * 8)
+        payloads = [bytes(rng.getrandbits(8) for _ in range(size)) for _ in range(frames)]
+
+        burst_ok = 0
+        encoded = []
+        for payload in payloads:
+            block = bytearray(rs_only.frame(payload))
+            encoded.append(bytes(block))
+            start = rng.randrange(len(block) - RS_LENGTH // 2 * depth + 1)
+            for pos in range(start, start + RS_LENGTH // 2 * depth):
+                block[pos] ^= rng.randint(1, 255)
+            try:
+                data, _, _ = rs_only.deframe(bytes(block))
+                burst_ok += data.raw[SIZE_LENGTH:SIZE_LENGTH + size] == payload
+            except Exception:
+                pass
+
+        block_len = len(encoded[0])
+        channel = []
+        for block in encoded:
+            frame = ctypes.create_string_buffer(struct.pack("<I", asm_word) + block, 2 * (ASM_LENGTH + block_len) + 2)
+            bbfec.encode_viterbi(frame, frame, (ASM_LENGTH + block_len) * BITS_PER_BYTE)
+            frame = bytearray(frame.raw)
+            for bit in rng.sample(range(len(frame) * BITS_PER_BYTE), 4 * depth):
+                frame[bit // BITS_PER_BYTE] ^= 0x80 >> (bit % BITS_PER_BYTE)
+            channel.append(bytes(frame))
+        blocks, _, _, _, status = full.decode_batch(np.frombuffer(b"".join(channel), dtype=np.uint8).reshape(frames, -1),
+                                                    asm_word=asm_word, asm_threshold=26, block_len=block_len, threads=2)
+        reference = [full.decode_fec(block)[0].raw[:block_len] for block in encoded]
+        batch_ok = sum(status[k] == FRAME_OK and blocks[k].tobytes() == reference[k] for k in range(frames))
+
+        failures += (frames - burst_ok) + (frames - batch_ok)
+        print("Depth {0}: {1:4d} byte frames, burst of {2:3d} bytes {3}/{4}, decode_batch {5}/{4}".format(
+            depth, block_len, RS_LENGTH // 2 * depth, burst_ok, frames, batch_ok))
+
+    # Corrected bits past what 8-bit path metrics can hold, only the symbols Viterbi reads
+    nsymbols = ((ASM_LENGTH + block_len) * BITS_PER_BYTE + VITERBI_CONSTRAINT - 1) * VITERBI_RATE
+    noisy = []
+    injected = []
+    for block in encoded:
+        frame = ctypes.create_string_buffer(struct.pack("<I", asm_word) + block, 2 * (ASM_LENGTH + block_len) + 2)
+        bbfec.encode_viterbi(frame, frame, (ASM_LENGTH + block_len) * BITS_PER_BYTE)
+        frame = bytearray(frame.raw)
+        flipped = rng.sample(range(nsymbols), nsymbols // 100)
+        for bit in flipped:
+            frame[bit // BITS_PER_BYTE] ^= 0x80 >> (bit % BITS_PER_BYTE)
+        noisy.append(bytes(frame))
+        injected.append(len(flipped))
+    blocks, bit_corr, _, _, status = full.decode_batch(np.frombuffer(b"".join(noisy), dtype=np.uint8).reshape(frames, -1),
+                                                       asm_word=asm_word, asm_threshold=26, block_len=block_len)
+    counted = sum(status[k] == FRAME_OK and blocks[k].tobytes() == reference[k] and bit_corr[k] == injected[k]
+                  for k in range(frames))
+    failures += frames - counted
+    print("Depth {0}: 1% channel bit errors, decode_batch with exact bit_corr {1}/{2}".format(depth, counted, frames))
+    return failures == 0
+
+
+def viterbi_benchmark(frames=2000, seed=0):
+    """Decoded Mbit/s on one core for every butterfly implementation the CPU supports."""
+    rng = random.Random(seed)
+    ec = PacketHandler(None)
+    frame = bytearray(ec.frame(bytes(rng.getrandbits(8) for _ in range(CSP_OVERHEAD + LONG_FRAME_LIMIT - SIZE_LENGTH))))
+    for bit in rng.sample(range(len(frame) * BITS_PER_BYTE), 6):
+        frame[bit // BITS_PER_BYTE] ^= 0x80 >> (bit % BITS_PER_BYTE)
+    frame = bytes(frame)
+    nbits = (len(frame) // VITERBI_RATE - VITERBI_TAIL) * BITS_PER_BYTE
+
+    default = bbfec.viterbi_get_impl()
+    reference = None
+    exact = True
+    impl = 0
+    while bbfec.viterbi_impl_name(impl) is not None:
+        name = bbfec.viterbi_impl_name(impl).decode()
+        if bbfec.viterbi_set_impl(impl) != 0:
+            print("{0:>6}: not supported by this CPU".format(name))
+            impl += 1
+            continue
+
+        data, bit_corr, _ = ec.decode_viterbi(frame)
+        result = (data.raw, bit_corr)
+        reference = reference or result
+        exact &= result == reference
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            ec.decode_viterbi(frame)
+        elapsed = time.perf_counter() - start
+
+        print("{0:>6}: {1:8.2f} Mbit/s{2}{3}".format(name, frames * nbits / elapsed / 1e6,
+            " (default)" if impl == default else "", "" if result == reference else " MISMATCH"))
+        impl += 1
+
+    bbfec.viterbi_set_impl(default)
+    return exact
+
+
+def rs_benchmark(blocks=2000, seed=0):
+    """Syndrome and decode_rs() time per codeword for every syndrome implementation the CPU supports.
+
+    Every implementation must give the same syndromes as the original loop
+    ("ref") on clean and corrupted codewords of random shortened lengths.
+    """
+    rng = random.Random(seed)
+
+    def codeword(pad, errors):
+        data = bytes(rng.getrandbits(8) for _ in range(RS_BLOCK_LENGTH - RS_LENGTH - pad))
+        parity = ctypes.create_string_buffer(RS_LENGTH)
+        bbfec.encode_rs(data, parity, pad)
+        block = bytearray(data + parity.raw)
+        for pos in rng.sample(range(len(block)), errors):
+            block[pos] ^= rng.randint(1, 255)
+        return bytes(block)
+
+    # Full length blocks for timing, one per table
+    clean = [codeword(0, 0) for _ in range(blocks)]
+    noisy = [codeword(0, 8) for _ in range(blocks)]
+    # Random pads and error counts for checking
+    checks = [codeword(pad, rng.choice((0, 0, 1, 16, 17))) for pad in (rng.randint(0, 222) for _ in range(blocks))]
+
+    def syndromes(group):
+        out = ctypes.create_string_buffer(len(group) * RS_LENGTH)
+        pad = RS_BLOCK_LENGTH - len(group[0])
+        bbfec.rs_syndromes_batch(b"".join(group), len(group), pad, out)
+        return out.raw
+
+    def decode(group):
+        for block in group:
+            bbfec.decode_rs(ctypes.create_string_buffer(block, len(block)), None, 0, 0)
+
+    def timed(fn, group):
+        start = time.perf_counter()
+        fn(group)
+        return (time.perf_counter() - start) / len(group) * 1e6
+
+    default = bbfec.rs_syndrome_get_impl()
+    reference = None
+    exact = True
+    impl = 0
+    print("{0:>6}  {1:>16}  {2:>16}  {3:>16}".format("", "syndromes", "decode_rs clean", "decode_rs 8 err"))
+    while bbfec.rs_syndrome_impl_name(impl) is not None:
+        name = bbfec.rs_syndrome_impl_name(impl).decode()
+        if bbfec.rs_syndrome_set_impl(impl) != 0:
+            print("{0:>6}: not supported by this CPU".format(name))
+            impl += 1
+            continue
+
+        result = (syndromes(clean), syndromes(noisy), [syndromes([block]) for block in checks])
+        reference = reference or result
+        exact &= result == reference
+
+        print("{0:>6}: {1:10.3f} us/cw  {2:10.3f} us/cw  {3:10.3f} us/cw{4}{5}".format(name,
+            timed(syndromes, noisy), timed(decode, clean), timed(decode, noisy),
+            " (default)" if impl == default else "", "" if result == reference else " MISMATCH"))
+        impl += 1
+
+    bbfec.rs_syndrome_set_impl(default)
+    return exact
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "stress":
+        sys.exit(0 if stress_test(*(int(arg) for arg in sys.argv[2:])) else 1)
+    if len(sys.argv) > 1 and sys.argv[1] == "interleave":
+        sys.exit(0 if interleave_test(*(int(arg) for arg in sys.argv[2:])) else 1)
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        sys.exit(0 if viterbi_benchmark(*(int(arg) for arg in sys.argv[2:])) else 1)
+    if len(sys.argv) > 1 and sys.argv[1] == "rsbench":
+        sys.exit(0 if rs_benchmark(*(int(arg) for arg in sys.argv[2:])) else 1)
+
     # key = sys.argv[1]
     ec = PacketHandler(None)
     print("Original data:\n{0}\n".format(ec.hexdump(TESTDATA)))
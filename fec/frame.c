@@ -0,0 +1,284 @@
+/*
+ * Batch decoding of received frames in a single call
+ * May be used under the terms of the GNU Lesser General Public License (LGPL)
+ */
+
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#include <limits.h>
+#include <time.h>
+
+#include "viterbi.h"
+#include "randomizer.h"
+#include "rs.h"
+#include "rs_interleave.h"
+#include "frame.h"
+
+#ifndef BITS_PER_BYTE
+#define BITS_PER_BYTE 8
+#endif
+
+static inline uint64_t now_ns(void)
+{
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (uint64_t)ts.tv_sec * 1000000000ull + ts.tv_nsec;
+}
+
+/* Symbol n of a packed, MSB first, channel bit buffer */
+#define CHANNEL_BIT(_p, _n)	(((_p)[(_n) >> 3] >> (7 - ((_n) & 7))) & 1)
+
+/* Unreliability of every decoded byte: how far the received channel
+ * symbols are from the re-encoded decoder output, i.e. the branch
+ * metrics picked up along the survivor path. A decoded bit also shapes
+ * the symbols of the next VITERBI_CONSTRAINT - 1 bits, so those count
+ * towards its byte too. */
+static void byte_costs(const unsigned char *frame, int soft, const unsigned char *data,
+		       int nbytes, unsigned char *channel, int *cost)
+{
+	int i, k, n, d, bit_cost;
+	int nbits = nbytes * BITS_PER_BYTE;
+
+	encode_viterbi(channel, (unsigned char *)data, nbits);
+	memset(cost, 0, nbytes * sizeof(*cost));
+
+	for (i = 0; i < nbits; i++) {
+		bit_cost = 0;
+		for (k = 0; k < VITERBI_RATE; k++) {
+			n = i * VITERBI_RATE + k;
+			if (soft) {
+				/* Only symbols on the wrong side of the threshold, by confidence */
+				d = CHANNEL_BIT(channel, n) ? VITERBI_SOFT_MAX - frame[n] : frame[n];
+				bit_cost += d > VITERBI_SOFT_MAX / 2 ? d - VITERBI_SOFT_MAX / 2 : 0;
+			} else
+				bit_cost += CHANNEL_BIT(channel, n) ^ CHANNEL_BIT(frame, n);
+		}
+		/* Bits i - K + 1 .. i shaped these symbols, they span at most two bytes */
+		cost[i / BITS_PER_BYTE] += bit_cost;
+		k = i - (VITERBI_CONSTRAINT - 1);
+		if (k >= 0 && k / BITS_PER_BYTE != i / BITS_PER_BYTE)
+			cost[k / BITS_PER_BYTE] += bit_cost;
+	}
+}
+
+/* Retry a failed RS block with the least reliable bytes erased, in growing
+ * numbers. cost has one entry per block byte, the largest are erased first
+ * and bytes with zero cost never. Returns decode_rs() of the first success,
+ * or -1. */
+static int decode_rs_erasures(unsigned char *block, int block_len, const int *cost)
+{
+	int order[NN], eras_pos[NROOTS];
+	int i, j, tmp, no_eras, candidates, ret;
+	int pad = NN - block_len;
+
+	/* Candidates by decreasing cost, only the first FRAME_ERASURES_MAX matter */
+	for (i = 0; i < block_len; i++)
+		order[i] = i;
+	candidates = 0;
+	for (i = 0; i < block_len && i < FRAME_ERASURES_MAX; i++) {
+		for (j = i + 1; j < block_len; j++) {
+			if (cost[order[j]] > cost[order[i]]) {
+				tmp = order[i];
+				order[i] = order[j];
+				order[j] = tmp;
+			}
+		}
+		if (cost[order[i]] == 0)
+			break;
+		candidates++;
+	}
+
+	for (no_eras = FRAME_ERASURES_STEP; no_eras < FRAME_ERASURES_MAX + FRAME_ERASURES_STEP; no_eras += FRAME_ERASURES_STEP) {
+		if (no_eras > candidates)
+			no_eras = candidates;
+		if (no_eras == 0)
+			break;
+		for (i = 0; i < no_eras; i++)
+			eras_pos[i] = order[i] + pad;
+		/* decode_rs() leaves the block alone when it fails */
+		ret = decode_rs(block, eras_pos, no_eras, pad);
+		if (ret != -1)
+			return ret;
+		if (no_eras == candidates)
+			break;
+	}
+	return -1;
+}
+
+/* Charge the time since the last mark to stage _s of frame i */
+#define STAGE_MARK(_s)								\
+	do {									\
+		if (stage_ns) {							\
+			uint64_t _t = now_ns();					\
+			stage_ns[(size_t)i * FRAME_STAGES + (_s)] += _t - mark;	\
+			mark = _t;						\
+		}								\
+	} while (0)
+
+/* Decode nframes contiguous received frames of frame_len bytes each
+ * (one byte per channel bit with FRAME_SOFT, packed bits otherwise).
+ *
+ * Every frame goes through the same steps as PacketHandler.decode_viterbi
+ * followed by the ASM check and PacketHandler.decode_fec: the first
+ * FRAME_ASM_LENGTH decoded bytes are compared with asm_word (little endian)
+ * and, if at least asm_threshold bits match, the following block_len bytes
+ * are derandomized, RS decoded and copied to out + i * block_len.
+ *
+ * The block is depth interleaved codewords of block_len / depth bytes
+ * (see rs_interleave.h), each one decoded on its own. byte_corr is their
+ * sum, and a frame fails as soon as one of them does.
+ *
+ * With FRAME_ERASURES (and FRAME_VITERBI) a block that RS cannot decode
+ * is retried with the least reliable bytes, judged by the Viterbi branch
+ * metrics or soft symbols, marked as erasures.
+ *
+ * If stage_ns is not NULL it receives FRAME_STAGES times per frame, in
+ * nanoseconds, for the FRAME_STAGE_* steps. Stages a frame did not reach
+ * are zero. Timing is skipped entirely when it is NULL.
+ *
+ * Returns the number of frames with FRAME_OK status, or -1 on bad arguments.
+ */
+int decode_frames(void *vp, const unsigned char *frames, int nframes, int frame_len, int flags,
+		  uint32_t asm_word, int asm_threshold, char *sequence, int block_len, int depth,
+		  unsigned char *out, int *bit_corr, int *byte_corr, int *asm_matches, int *status,
+		  uint64_t *stage_ns)
+{
+	int i, j, c, ret, ok = 0;
+	int rx_length, nbits, cw_len, pos, have_costs;
+	uint32_t found;
+	uint64_t mark = 0;
+	unsigned char *data, *block, *cw, cw_buf[NN];
+	unsigned char *channel = NULL;
+	int *cost = NULL, block_cost[NN];
+
+	if (frames == NULL || out == NULL || nframes < 0 || frame_len <= 0)
+		return -1;
+	if ((flags & FRAME_VITERBI) && vp == NULL)
+		return -1;
+
+	/* Decoded bytes per frame. Frames are cut without the Viterbi tail, so
+	 * the last VITERBI_TAIL bytes of the block are never decoded: they are
+	 * zeroed and left to RS, anything longer does not fit the frame. */
+	rx_length = (flags & FRAME_SOFT) ? frame_len / BITS_PER_BYTE : frame_len;
+	if (flags & FRAME_VITERBI)
+		rx_length = rx_length / VITERBI_RATE - VITERBI_TAIL;
+	if (depth < 1 || depth > RS_MAX_DEPTH || block_len <= 0 || block_len > depth * NN ||
+	    block_len % depth != 0 ||
+	    FRAME_ASM_LENGTH + block_len > rx_length + ((flags & FRAME_VITERBI) ? VITERBI_TAIL : 0))
+		return -1;
+	cw_len = block_len / depth;
+
+	if ((data = malloc(frame_len + 1)) == NULL)
+		return -1;
+	if ((flags & FRAME_ERASURES) && (flags & FRAME_VITERBI)) {
+		channel = malloc(frame_len + VITERBI_RATE);
+		cost = malloc(frame_len * sizeof(*cost));
+		if (channel == NULL || cost == NULL) {
+			free(channel);
+			free(cost);
+			free(data);
+			return -1;
+		}
+	}
+
+	for (i = 0; i < nframes; i++) {
+		const unsigned char *frame = frames + (size_t)i * frame_len;
+
+		block = out + (size_t)i * block_len;
+		bit_corr[i] = 0;
+		byte_corr[i] = 0;
+		if (stage_ns) {
+			memset(stage_ns + (size_t)i * FRAME_STAGES, 0, FRAME_STAGES * sizeof(*stage_ns));
+			mark = now_ns();
+		}
+
+		/* Viterbi, decoding in place over a copy of the frame like decode_viterbi */
+		if (flags & FRAME_VITERBI) {
+			if (flags & FRAME_SOFT) {
+				memset(data, 0, frame_len / BITS_PER_BYTE + 1);
+				nbits = rx_length * BITS_PER_BYTE;
+				init_viterbi(vp, 0);
+				update_viterbi_soft(vp, (unsigned char *)frame, nbits + VITERBI_CONSTRAINT - 1);
+			} else {
+				memcpy(data, frame, frame_len);
+				nbits = rx_length * BITS_PER_BYTE;
+				init_viterbi(vp, 0);
+				update_viterbi(vp, data, nbits + VITERBI_CONSTRAINT - 1);
+			}
+			bit_corr[i] = chainback_viterbi(vp, data, nbits, 0);
+			/* Not symbols left over from the frame */
+			memset(data + rx_length, 0, VITERBI_TAIL);
+		} else {
+			memcpy(data, frame, frame_len);
+		}
+		STAGE_MARK(FRAME_STAGE_VITERBI);
+
+		/* Attached sync marker */
+		found = (uint32_t)data[0] | (uint32_t)data[1] << 8 |
+			(uint32_t)data[2] << 16 | (uint32_t)data[3] << 24;
+		asm_matches[i] = 32 - __builtin_popcount(found ^ asm_word);
+		if (asm_matches[i] < asm_threshold) {
+			memset(block, 0, block_len);
+			status[i] = FRAME_ASM_MISMATCH;
+			STAGE_MARK(FRAME_STAGE_ASM);
+			continue;
+		}
+
+		memcpy(block, data + FRAME_ASM_LENGTH, block_len);
+		STAGE_MARK(FRAME_STAGE_ASM);
+
+		if (flags & FRAME_RANDOMIZE)
+			ccsds_xor_sequence(block, sequence, block_len);
+		STAGE_MARK(FRAME_STAGE_DERANDOMIZE);
+
+		if (flags & FRAME_RS) {
+			have_costs = 0;
+			for (c = 0; c < depth; c++) {
+				if (depth == 1) {
+					cw = block;
+				} else {
+					cw = cw_buf;
+					rs_deinterleave(block, depth, cw_len, c, cw);
+				}
+				ret = decode_rs(cw, NULL, 0, NN - cw_len);
+				if (ret == -1 && cost != NULL) {
+					/* One Viterbi re-encode serves all the codewords */
+					if (!have_costs) {
+						byte_costs(frame, flags & FRAME_SOFT, data, rx_length, channel, cost);
+						have_costs = 1;
+					}
+					/* Bytes past the decoded ones were never decoded, erase them first */
+					for (j = 0; j < cw_len; j++) {
+						pos = FRAME_ASM_LENGTH + j * depth + c;
+						block_cost[j] = pos < rx_length ? cost[pos] : INT_MAX;
+					}
+					ret = decode_rs_erasures(cw, cw_len, block_cost);
+				}
+				if (ret == -1) {
+					/* The frame is lost anyway, leave the other codewords alone */
+					byte_corr[i] = -1;
+					break;
+				}
+				if (depth > 1 && ret > 0)
+					rs_interleave(block, depth, cw_len, c, cw);
+				byte_corr[i] += ret;
+			}
+			STAGE_MARK(FRAME_STAGE_RS);
+			if (byte_corr[i] == -1) {
+				status[i] = FRAME_RS_FAILED;
+				continue;
+			}
+		}
+
+		status[i] = FRAME_OK;
+		ok++;
+	}
+
+	free(data);
+	free(channel);
+	free(cost);
+
+	return ok;
+}
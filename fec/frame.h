@@ -0,0 +1,43 @@
+/*
+ * Batch decoding of received frames in a single call
+ * May be used under the terms of the GNU Lesser General Public License (LGPL)
+ */
+
+#ifndef _FRAME_H_
+#define _FRAME_H_
+
+#include <stdint.h>
+
+/* Processing steps for decode_frames() */
+#define FRAME_VITERBI		0x01
+#define FRAME_RANDOMIZE		0x02
+#define FRAME_RS		0x04
+#define FRAME_SOFT		0x08
+#define FRAME_ERASURES		0x10
+
+/* Erasure retries erase FRAME_ERASURES_STEP more bytes each time, up to
+ * FRAME_ERASURES_MAX. The rest of the 32 parity symbols stay available
+ * for errors (at least 4 here), which keeps miscorrections rare. */
+#define FRAME_ERASURES_STEP	8
+#define FRAME_ERASURES_MAX	24
+
+/* Per frame status codes */
+#define FRAME_OK		0
+#define FRAME_ASM_MISMATCH	1
+#define FRAME_RS_FAILED		2
+
+#define FRAME_ASM_LENGTH	4
+
+/* Per frame timing slots filled by decode_frames() */
+#define FRAME_STAGE_VITERBI	0
+#define FRAME_STAGE_ASM		1
+#define FRAME_STAGE_DERANDOMIZE	2
+#define FRAME_STAGE_RS		3
+#define FRAME_STAGES		4
+
+int decode_frames(void *vp, const unsigned char *frames, int nframes, int frame_len, int flags,
+		  uint32_t asm_word, int asm_threshold, char *sequence, int block_len, int depth,
+		  unsigned char *out, int *bit_corr, int *byte_corr, int *asm_matches, int *status,
+		  uint64_t *stage_ns);
+
+#endif /* _FRAME_H_ */
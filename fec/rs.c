@@ -8,6 +8,7 @@
 #include <string.h>
 
 #include "rs.h"
+#include "rs_syndrome.h"
 
 /* The guts of the Reed-Solomon encoder, meant to be #included
  * into a function body with the following typedefs, macros and variables supplied
@@ -109,36 +110,20 @@ int decode_rs(unsigned char *data, int *eras_pos, int no_eras, int pad){
 						 * and syndrome poly */
 	unsigned char b[NROOTS+1], t[NROOTS+1], omega[NROOTS+1];
 	unsigned char root[NROOTS], reg[NROOTS+1], loc[NROOTS];
-	int syn_error, count;
+	int count;
 
 	/* form the syndromes; i.e., evaluate data(x) at roots of g(x) */
-	for(i=0;i<NROOTS;i++)
-		s[i] = data[0];
-
-	for(j=1;j<NN-PAD;j++){
-		for(i=0;i<NROOTS;i++){
-			if(s[i] == 0){
-				s[i] = data[j];
-			} else {
-				s[i] = data[j] ^ ALPHA_TO[MODNN(INDEX_OF[s[i]] + (FCR+i)*PRIM)];
-			}
-		}
-	}
-
-	/* Convert syndromes to index form, checking for nonzero condition */
-	syn_error = 0;
-	for(i=0;i<NROOTS;i++){
-		syn_error |= s[i];
-		s[i] = INDEX_OF[s[i]];
-	}
-
-	if (!syn_error) {
+	if (!rs_syndromes(data, pad, s)) {
 		/* if syndrome is zero, data[] is a codeword and there are no
 		 * errors to correct. So return data[] unmodified
 		 */
-		count = 0;
-		goto finish;
+		return 0;
 	}
+
+	/* Convert syndromes to index form */
+	for(i=0;i<NROOTS;i++)
+		s[i] = INDEX_OF[s[i]];
+
 	memset(&lambda[1],0,NROOTS*sizeof(lambda[0]));
 	lambda[0] = 1;
 
@@ -0,0 +1,80 @@
+/*
+ * CCSDS Reed-Solomon symbol interleaving
+ * May be used under the terms of the GNU Lesser General Public License (LGPL)
+ *
+ * Interleaving depth I spreads I codewords over one block, byte by byte,
+ * so a burst of up to 16 * I bytes costs each codeword at most 16. Every
+ * codeword is encoded and decoded on its own with encode_rs()/decode_rs().
+ */
+
+#include <stddef.h>
+
+#include "rs.h"
+#include "rs_interleave.h"
+
+/* Copy codeword c, len bytes, out of an interleaved block */
+void rs_deinterleave(const unsigned char *block, int depth, int len, int c, unsigned char *cw)
+{
+	int j;
+
+	for (j = 0; j < len; j++)
+		cw[j] = block[j * depth + c];
+}
+
+/* Copy codeword c, len bytes, into an interleaved block */
+void rs_interleave(unsigned char *block, int depth, int len, int c, const unsigned char *cw)
+{
+	int j;
+
+	for (j = 0; j < len; j++)
+		block[j * depth + c] = cw[j];
+}
+
+/* block holds depth * (NN - NROOTS - pad) interleaved data bytes, the
+ * depth * NROOTS interleaved parity bytes are written after them */
+void encode_rs_interleaved(unsigned char *block, int depth, int pad)
+{
+	unsigned char cw[NN];
+	int c, k = NN - NROOTS - pad;
+
+	if (depth < 1 || depth > RS_MAX_DEPTH || pad < 0 || pad > NN - NROOTS - 1)
+		return;
+
+	for (c = 0; c < depth; c++) {
+		rs_deinterleave(block, depth, k, c, cw);
+		encode_rs(cw, cw + k, pad);
+		rs_interleave(block, depth, NN - pad, c, cw);
+	}
+}
+
+/* Decode all depth codewords of an interleaved block in place. If byte_corr
+ * is not NULL it receives decode_rs() of every codeword. Returns the total
+ * number of corrected bytes, or -1 if any codeword could not be decoded;
+ * the others are corrected all the same. */
+int decode_rs_interleaved(unsigned char *block, int depth, int pad, int *byte_corr)
+{
+	unsigned char cw[NN];
+	int c, ret, total = 0, failed = 0;
+
+	if (depth < 1 || depth > RS_MAX_DEPTH || pad < 0 || pad > NN - NROOTS - 1)
+		return -1;
+
+	for (c = 0; c < depth; c++) {
+		if (depth == 1) {
+			ret = decode_rs(block, NULL, 0, pad);
+		} else {
+			rs_deinterleave(block, depth, NN - pad, c, cw);
+			ret = decode_rs(cw, NULL, 0, pad);
+			if (ret > 0)
+				rs_interleave(block, depth, NN - pad, c, cw);
+		}
+		if (byte_corr != NULL)
+			byte_corr[c] = ret;
+		if (ret == -1)
+			failed++;
+		else
+			total += ret;
+	}
+
+	return failed ? -1 : total;
+}
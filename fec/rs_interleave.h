@@ -0,0 +1,21 @@
+/*
+ * CCSDS Reed-Solomon symbol interleaving
+ * May be used under the terms of the GNU Lesser General Public License (LGPL)
+ */
+
+#ifndef _RS_INTERLEAVE_H_
+#define _RS_INTERLEAVE_H_
+
+/* Interleaving depths I = 1 .. RS_MAX_DEPTH */
+#define RS_MAX_DEPTH		8
+
+/* An interleaved block of depth I holds I codewords of NN - pad bytes,
+ * byte j of codeword c at j * I + c. The data bytes of all codewords come
+ * first, followed by the parity bytes. */
+void rs_deinterleave(const unsigned char *block, int depth, int len, int c, unsigned char *cw);
+void rs_interleave(unsigned char *block, int depth, int len, int c, const unsigned char *cw);
+
+void encode_rs_interleaved(unsigned char *block, int depth, int pad);
+int decode_rs_interleaved(unsigned char *block, int depth, int pad, int *byte_corr);
+
+#endif /* _RS_INTERLEAVE_H_ */
@@ -0,0 +1,330 @@
+/*
+ * Reed-Solomon syndrome computation for the CCSDS (255,223) code
+ * May be used under the terms of the GNU Lesser General Public License (LGPL)
+ *
+ * Syndrome i is the received block evaluated at root r_i =
+ * alpha^((FCR + i) * PRIM) by Horner's rule. Three implementations give
+ * identical results:
+ *
+ *  ref    the loop from Karn's decoder, a log/antilog lookup and a modulo
+ *         per symbol and root
+ *  table  one 256 entry "multiply by r_i" table per root, a single load
+ *         and xor per symbol and root
+ *  swar   plain 64-bit code for any CPU: the block read a word at a time,
+ *         8 interleaved Horner chains per root, one per byte of the word,
+ *         stepping by r_i^8 through a 256 entry table, then the 8 partial
+ *         sums folded into one. The 8 chains stay in registers, where the
+ *         32 of table spill to memory
+ *  avx2   32 interleaved Horner chains per root in one register, products
+ *         by a constant from two 16 entry nibble tables (pshufb), then the
+ *         32 partial sums folded into one in five halving steps
+ */
+
+#include <string.h>
+#include <stdbool.h>
+#include <stdint.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <immintrin.h>
+#endif
+
+#include "rs.h"
+#include "rs_syndrome.h"
+
+/* Products by r_i */
+static unsigned char syn_mul[NROOTS][256];
+
+/* Nibble tables of the products by r_i^(2^k), k = 0..5: the product of x is
+ * nib[i][k][0][x & 15] ^ nib[i][k][1][x >> 4] */
+#define SYN_POWERS 6
+static unsigned char syn_nib[NROOTS][SYN_POWERS][2][16] __attribute__((aligned(16)));
+
+/* Products by r_i^8 */
+static unsigned char syn_mul8[NROOTS][256];
+
+typedef int (*rs_syndromes_fn)(const unsigned char *, int, unsigned char *);
+
+static int rs_syndromes_ref(const unsigned char *data, int pad, unsigned char *s);
+static int rs_syndromes_table(const unsigned char *data, int pad, unsigned char *s);
+static int rs_syndromes_swar(const unsigned char *data, int pad, unsigned char *s);
+#if defined(__x86_64__) || defined(__i386__)
+static int rs_syndromes_avx2(const unsigned char *data, int pad, unsigned char *s);
+#endif
+
+static const struct {
+	const char *name;
+	rs_syndromes_fn syndromes;
+} impls[RS_SYN_IMPL_COUNT] = {
+	[RS_SYN_IMPL_REF] = {"ref", rs_syndromes_ref},
+	[RS_SYN_IMPL_TABLE] = {"table", rs_syndromes_table},
+	[RS_SYN_IMPL_SWAR] = {"swar", rs_syndromes_swar},
+#if defined(__x86_64__) || defined(__i386__)
+	[RS_SYN_IMPL_AVX2] = {"avx2", rs_syndromes_avx2},
+#else
+	[RS_SYN_IMPL_AVX2] = {"avx2", NULL},
+#endif
+};
+
+/* Selected when the library is loaded, see rs_syndrome_init() */
+static int impl = RS_SYN_IMPL_SWAR;
+
+static unsigned char gf_mul(unsigned char a, unsigned char b)
+{
+	if (a == 0 || b == 0)
+		return 0;
+	return ALPHA_TO[MODNN(INDEX_OF[a] + INDEX_OF[b])];
+}
+
+static bool impl_supported(int i)
+{
+	if (i < 0 || i >= RS_SYN_IMPL_COUNT || impls[i].syndromes == NULL)
+		return false;
+
+#if defined(__x86_64__) || defined(__i386__)
+	__builtin_cpu_init();
+	if (i == RS_SYN_IMPL_AVX2)
+		return __builtin_cpu_supports("avx2");
+#endif
+
+	return true;
+}
+
+static void __attribute__((constructor)) rs_syndrome_init(void)
+{
+	int i, k, x;
+	unsigned char root, power;
+
+	for (i = 0; i < NROOTS; i++) {
+		root = ALPHA_TO[MODNN((FCR + i) * PRIM)];
+		for (x = 0; x < 256; x++)
+			syn_mul[i][x] = gf_mul(root, x);
+
+		power = root;
+		for (k = 0; k < SYN_POWERS; k++) {
+			for (x = 0; x < 16; x++) {
+				syn_nib[i][k][0][x] = gf_mul(power, x);
+				syn_nib[i][k][1][x] = gf_mul(power, x << 4);
+			}
+			power = gf_mul(power, power);
+		}
+
+		/* r_i^8 */
+		power = gf_mul(root, root);
+		power = gf_mul(power, power);
+		power = gf_mul(power, power);
+		for (x = 0; x < 256; x++)
+			syn_mul8[i][x] = gf_mul(power, x);
+	}
+
+	/* swar runs everywhere, only a SIMD version may replace it */
+	for (i = RS_SYN_IMPL_COUNT - 1; i > RS_SYN_IMPL_SWAR; i--)
+		if (impl_supported(i))
+			break;
+	impl = i;
+}
+
+static int rs_syndromes_ref(const unsigned char *data, int pad, unsigned char *s)
+{
+	int i, j, syn_error = 0;
+
+	for (i = 0; i < NROOTS; i++)
+		s[i] = data[0];
+
+	for (j = 1; j < NN - PAD; j++) {
+		for (i = 0; i < NROOTS; i++) {
+			if (s[i] == 0) {
+				s[i] = data[j];
+			} else {
+				s[i] = data[j] ^ ALPHA_TO[MODNN(INDEX_OF[s[i]] + (FCR + i) * PRIM)];
+			}
+		}
+	}
+
+	for (i = 0; i < NROOTS; i++)
+		syn_error |= s[i];
+	return syn_error != 0;
+}
+
+static int rs_syndromes_table(const unsigned char *data, int pad, unsigned char *s)
+{
+	int i, j, syn_error = 0;
+	unsigned char acc[NROOTS];
+
+	for (i = 0; i < NROOTS; i++)
+		acc[i] = data[0];
+
+	/* NROOTS independent chains, the compiler keeps them in flight together */
+	for (j = 1; j < NN - PAD; j++)
+		for (i = 0; i < NROOTS; i++)
+			acc[i] = data[j] ^ syn_mul[i][acc[i]];
+
+	for (i = 0; i < NROOTS; i++) {
+		s[i] = acc[i];
+		syn_error |= acc[i];
+	}
+	return syn_error != 0;
+}
+
+static inline uint64_t load_le64(const unsigned char *p)
+{
+	uint64_t w;
+
+	memcpy(&w, p, 8);
+#if __BYTE_ORDER__ == __ORDER_BIG_ENDIAN__
+	w = __builtin_bswap64(w);
+#endif
+	return w;
+}
+
+static int rs_syndromes_swar(const unsigned char *data, int pad, unsigned char *s)
+{
+	unsigned char buf[NN + 1];
+	const unsigned char *mul, *mul8;
+	uint64_t w;
+	unsigned int a0, a1, a2, a3, a4, a5, a6, a7;
+	int i, q, len = NN - PAD;
+	int nwords = (len + 7) / 8, lead = nwords * 8 - len;
+	unsigned char syn_error = 0;
+
+	/* Leading zeros do not change the polynomial, they align it to whole words */
+	memset(buf, 0, lead);
+	memcpy(buf + lead, data, len);
+
+	for (i = 0; i < NROOTS; i++) {
+		mul = syn_mul[i];
+		mul8 = syn_mul8[i];
+
+		/* Lane m sums the symbols 8q + m, stepping by r_i^8 */
+		w = load_le64(buf);
+		a0 = w & 0xff;
+		a1 = (w >> 8) & 0xff;
+		a2 = (w >> 16) & 0xff;
+		a3 = (w >> 24) & 0xff;
+		a4 = (w >> 32) & 0xff;
+		a5 = (w >> 40) & 0xff;
+		a6 = (w >> 48) & 0xff;
+		a7 = w >> 56;
+		for (q = 1; q < nwords; q++) {
+			w = load_le64(buf + 8 * q);
+			a0 = mul8[a0] ^ (w & 0xff);
+			a1 = mul8[a1] ^ ((w >> 8) & 0xff);
+			a2 = mul8[a2] ^ ((w >> 16) & 0xff);
+			a3 = mul8[a3] ^ ((w >> 24) & 0xff);
+			a4 = mul8[a4] ^ ((w >> 32) & 0xff);
+			a5 = mul8[a5] ^ ((w >> 40) & 0xff);
+			a6 = mul8[a6] ^ ((w >> 48) & 0xff);
+			a7 = mul8[a7] ^ (w >> 56);
+		}
+
+		/* S = sum of lane m times r_i^(7 - m) */
+		a0 = mul[a0] ^ a1;
+		a0 = mul[a0] ^ a2;
+		a0 = mul[a0] ^ a3;
+		a0 = mul[a0] ^ a4;
+		a0 = mul[a0] ^ a5;
+		a0 = mul[a0] ^ a6;
+		a0 = mul[a0] ^ a7;
+
+		s[i] = a0;
+		syn_error |= a0;
+	}
+	return syn_error != 0;
+}
+
+#if defined(__x86_64__) || defined(__i386__)
+
+/* Byte-wise product of v by the constant whose nibble tables are lo/hi */
+#define GF_MUL128(_v, _lo, _hi, _mask)						\
+	_mm_xor_si128(_mm_shuffle_epi8((_lo), _mm_and_si128((_v), (_mask))),	\
+		      _mm_shuffle_epi8((_hi), _mm_and_si128(_mm_srli_epi16((_v), 4), (_mask))))
+
+#define GF_MUL256(_v, _lo, _hi, _mask)						\
+	_mm256_xor_si256(_mm256_shuffle_epi8((_lo), _mm256_and_si256((_v), (_mask))),	\
+			 _mm256_shuffle_epi8((_hi), _mm256_and_si256(_mm256_srli_epi16((_v), 4), (_mask))))
+
+#define NIB(_i, _k, _h)	_mm_load_si128((const __m128i *)syn_nib[_i][_k][_h])
+
+__attribute__((target("avx2")))
+static int rs_syndromes_avx2(const unsigned char *data, int pad, unsigned char *s)
+{
+	unsigned char buf[NN + 1] __attribute__((aligned(32)));
+	const __m256i mask256 = _mm256_set1_epi8(0x0f);
+	const __m128i mask128 = _mm_set1_epi8(0x0f);
+	__m256i v[(NN + 1) / 32], acc, lo, hi;
+	__m128i a;
+	int i, q, len = NN - PAD;
+	int nvec = (len + 31) / 32, lead = nvec * 32 - len;
+	unsigned char syn_error = 0;
+
+	/* Leading zeros do not change the polynomial, they align it to whole vectors */
+	memset(buf, 0, lead);
+	memcpy(buf + lead, data, len);
+	for (q = 0; q < nvec; q++)
+		v[q] = _mm256_load_si256((const __m256i *)(buf + 32 * q));
+
+	for (i = 0; i < NROOTS; i++) {
+		/* Lane m sums the symbols 32q + m, stepping by r_i^32 */
+		lo = _mm256_broadcastsi128_si256(NIB(i, 5, 0));
+		hi = _mm256_broadcastsi128_si256(NIB(i, 5, 1));
+		acc = v[0];
+		for (q = 1; q < nvec; q++)
+			acc = _mm256_xor_si256(GF_MUL256(acc, lo, hi, mask256), v[q]);
+
+		/* S = sum of lane m times r_i^(31 - m): halve the lanes, lane m
+		 * becomes lane m times r_i^(lanes / 2) plus lane m + lanes / 2 */
+		a = _mm256_castsi256_si128(acc);
+		a = _mm_xor_si128(GF_MUL128(a, NIB(i, 4, 0), NIB(i, 4, 1), mask128),
+				  _mm256_extracti128_si256(acc, 1));
+		a = _mm_xor_si128(GF_MUL128(a, NIB(i, 3, 0), NIB(i, 3, 1), mask128), _mm_srli_si128(a, 8));
+		a = _mm_xor_si128(GF_MUL128(a, NIB(i, 2, 0), NIB(i, 2, 1), mask128), _mm_srli_si128(a, 4));
+		a = _mm_xor_si128(GF_MUL128(a, NIB(i, 1, 0), NIB(i, 1, 1), mask128), _mm_srli_si128(a, 2));
+		a = _mm_xor_si128(GF_MUL128(a, NIB(i, 0, 0), NIB(i, 0, 1), mask128), _mm_srli_si128(a, 1));
+
+		s[i] = (unsigned char)_mm_cvtsi128_si32(a);
+		syn_error |= s[i];
+	}
+	return syn_error != 0;
+}
+
+#endif /* __x86_64__ || __i386__ */
+
+int rs_syndromes(const unsigned char *data, int pad, unsigned char *s)
+{
+	return impls[impl].syndromes(data, pad, s);
+}
+
+int rs_syndromes_batch(const unsigned char *blocks, int nblocks, int pad, unsigned char *out)
+{
+	int i, dirty = 0;
+
+	if (pad < 0 || pad > NN - NROOTS - 1)
+		return -1;
+
+	for (i = 0; i < nblocks; i++)
+		dirty += impls[impl].syndromes(blocks + (size_t)i * (NN - pad), pad, out + (size_t)i * NROOTS);
+	return dirty;
+}
+
+/* Force an implementation, mainly for benchmarking.
+ * Returns -1 if the CPU cannot run it. Not thread safe. */
+int rs_syndrome_set_impl(int i)
+{
+	if (!impl_supported(i))
+		return -1;
+
+	impl = i;
+	return 0;
+}
+
+int rs_syndrome_get_impl(void)
+{
+	return impl;
+}
+
+const char *rs_syndrome_impl_name(int i)
+{
+	if (i < 0 || i >= RS_SYN_IMPL_COUNT)
+		return NULL;
+
+	return impls[i].name;
+}
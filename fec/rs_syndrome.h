@@ -0,0 +1,29 @@
+/*
+ * Reed-Solomon syndrome computation for the CCSDS (255,223) code
+ * May be used under the terms of the GNU Lesser General Public License (LGPL)
+ */
+
+#ifndef _RS_SYNDROME_H_
+#define _RS_SYNDROME_H_
+
+/* Syndrome implementations, the best supported one is picked at load time */
+#define RS_SYN_IMPL_REF		0	/* Original per-byte log/antilog loop */
+#define RS_SYN_IMPL_TABLE	1
+#define RS_SYN_IMPL_SWAR	2	/* Portable 64-bit, default without AVX2 */
+#define RS_SYN_IMPL_AVX2	3
+#define RS_SYN_IMPL_COUNT	4
+
+/* Evaluate the NN - pad received symbols at the NROOTS roots of the
+ * generator polynomial. s receives NROOTS syndromes in polynomial form.
+ * Returns 0 when all of them are zero, i.e. data is a codeword. */
+int rs_syndromes(const unsigned char *data, int pad, unsigned char *s);
+
+/* Syndromes of nblocks contiguous blocks of NN - pad bytes, NROOTS bytes
+ * per block in out. Returns the number of blocks with errors. */
+int rs_syndromes_batch(const unsigned char *blocks, int nblocks, int pad, unsigned char *out);
+
+int rs_syndrome_set_impl(int impl);
+int rs_syndrome_get_impl(void);
+const char *rs_syndrome_impl_name(int impl);
+
+#endif /* _RS_SYNDROME_H_ */
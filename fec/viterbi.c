@@ -12,13 +12,10 @@
 #include <limits.h>
 
 #include "viterbi.h"
+#include "viterbi_priv.h"
 
-#ifndef BITS_PER_BYTE
-#define BITS_PER_BYTE 8
-#endif
-
-#define likely(x)       __builtin_expect((x),1)
-#define unlikely(x)     __builtin_expect((x),0)
+#undef MIN
+#define MIN(a,b)	((a) < (b) ? (a) : (b))
 
 /* r=1/2 k=7 convolutional encoder polynomials
  * The NASA-DSN convention is to use V27POLYA inverted, then V27POLYB
@@ -27,11 +24,13 @@
 #define	V27POLYA	0x6d
 #define	V27POLYB	0x4f
 
-#define get_bit(_p, _n) ({_p[(_n) / (uint8_t)BITS_PER_BYTE] >> ((uint8_t)BITS_PER_BYTE - 1 - ((_n) % (uint8_t)BITS_PER_BYTE)) & (uint8_t)0x01;})
+/* Hard decision path metrics are 8 bits wide. They grow by at most 2 per
+ * bit and stay within 63 of each other, so the smallest one is taken off
+ * every VITERBI_RENORM bits (a whole number of symbol bytes) before any
+ * of them can wrap around. */
+#define VITERBI_RENORM	64
 
-typedef union { uint8_t w[64]; } metric_t;
-typedef union { uint8_t w[8];} decision_t;
-typedef union { uint8_t c[32]; } branchtab_t;
+#define get_bit(_p, _n) ({_p[(_n) / (uint8_t)BITS_PER_BYTE] >> ((uint8_t)BITS_PER_BYTE - 1 - ((_n) % (uint8_t)BITS_PER_BYTE)) & (uint8_t)0x01;})
 
 /* We use the CCSDS convention 
  * (see CCSDS 131.0-B-2 TM Synchronization and Channel Coding p3-2) */
@@ -41,19 +40,30 @@ static bool init = false;
 static uint8_t partab[256];
 static bool p_init;
 
-/* State info for Viterbi decoder instance */
-struct v27 {
-    metric_t metrics1;                  /* path metric buffer 1 */
-    metric_t metrics2;                  /* path metric buffer 2 */
-    decision_t *dp;                     /* Pointer to current decision */
-    metric_t *old_metrics,*new_metrics; /* Pointers to path metrics, swapped on every bit */
-    decision_t *decisions;              /* Beginning of decisions for block */
-    uint16_t dlen;                      /* Length of decisions array for block */
+/* Shared read-only tables, filled in once when the library is loaded.
+ * All per-decoder state lives in struct v27, so independent instances
+ * may be used concurrently from several threads. */
+static branchtab_t branchtab[2];
+static branchtab_t soft_branchtab[2];
+
+typedef int (*update_viterbi_fn)(struct v27 *, const branchtab_t *, const uint8_t *, uint16_t);
+
+static const struct {
+    const char *name;
+    update_viterbi_fn update;
+} impls[VITERBI_IMPL_COUNT] = {
+    [VITERBI_IMPL_PORT] = {"port", update_viterbi_port},
+#if defined(__x86_64__) || defined(__i386__)
+    [VITERBI_IMPL_SSE2] = {"sse2", update_viterbi_sse2},
+    [VITERBI_IMPL_AVX2] = {"avx2", update_viterbi_avx2},
+#else
+    [VITERBI_IMPL_SSE2] = {"sse2", NULL},
+    [VITERBI_IMPL_AVX2] = {"avx2", NULL},
+#endif
 };
 
-static branchtab_t branchtab[2];
-static struct v27 v27_local;
-static decision_t decisions_local;
+/* Selected when the library is loaded, see viterbi_tables_init() */
+static int impl = VITERBI_IMPL_PORT;
 
 /* Create 256-entry odd-parity lookup table */
 static void partab_init(void)
@@ -77,9 +87,6 @@ static void partab_init(void)
 
 static inline int parityb(unsigned char x)
 {
-    extern uint8_t partab[256];
-    extern bool p_init;
-
     if (!p_init)
         partab_init();
 
@@ -104,13 +111,21 @@ int init_viterbi(void *p, int starting_state)
     if (p == NULL)
         return -1;
 
-    for (i = 0; i < 64; i++)
+    for (i = 0; i < 64; i++) {
         vp->metrics1.w[i] = 63;
+        vp->smetrics1.w[i] = 63 * VITERBI_SOFT_MAX;
+    }
 
     vp->old_metrics = &vp->metrics1;
     vp->new_metrics = &vp->metrics2;
+    vp->old_smetrics = &vp->smetrics1;
+    vp->new_smetrics = &vp->smetrics2;
     vp->dp = vp->decisions;
+    vp->soft = false;
+    vp->soft_base = 0;
+    vp->hard_base = 0;
     vp->old_metrics->w[starting_state & 63] = 0; /* Bias known start state */
+    vp->old_smetrics->w[starting_state & 63] = 0;
     
     return 0;
 }
@@ -122,23 +137,87 @@ void set_viterbi_polynomial(int16_t polys[2])
     for (state = 0; state < 32; state++) {
         branchtab[0].c[state] = (polys[0] < 0) ^ parity((2 * state) & abs(polys[0])) ? 1 : 0;
         branchtab[1].c[state] = (polys[1] < 0) ^ parity((2 * state) & abs(polys[1])) ? 1 : 0;
+        soft_branchtab[0].c[state] = branchtab[0].c[state] ? VITERBI_SOFT_MAX : 0;
+        soft_branchtab[1].c[state] = branchtab[1].c[state] ? VITERBI_SOFT_MAX : 0;
     }
 
     init = true;
 }
 
+/* Check whether the running CPU can execute an implementation */
+static bool impl_supported(int i)
+{
+    if (i < 0 || i >= VITERBI_IMPL_COUNT || impls[i].update == NULL)
+        return false;
+
+#if defined(__x86_64__) || defined(__i386__)
+    __builtin_cpu_init();
+    if (i == VITERBI_IMPL_SSE2)
+        return __builtin_cpu_supports("sse2");
+    if (i == VITERBI_IMPL_AVX2)
+        return __builtin_cpu_supports("avx2");
+#endif
+
+    return true;
+}
+
+/* Build the lookup tables before any thread can touch them and pick
+ * the fastest butterfly implementation for this CPU */
+static void __attribute__((constructor)) viterbi_tables_init(void)
+{
+    int i;
+
+    if (!p_init)
+        partab_init();
+    if (!init)
+        set_viterbi_polynomial(polys);
+
+    for (i = VITERBI_IMPL_COUNT - 1; i > VITERBI_IMPL_PORT; i--)
+        if (impl_supported(i))
+            break;
+    impl = i;
+}
+
+/* Force a butterfly implementation, mainly for benchmarking.
+ * Returns -1 if the CPU cannot run it. Not thread safe. */
+int viterbi_set_impl(int i)
+{
+    if (!impl_supported(i))
+        return -1;
+
+    impl = i;
+    return 0;
+}
+
+int viterbi_get_impl(void)
+{
+    return impl;
+}
+
+const char *viterbi_impl_name(int i)
+{
+    if (i < 0 || i >= VITERBI_IMPL_COUNT)
+        return NULL;
+
+    return impls[i].name;
+}
+
 /* Create a new instance of a Viterbi decoder */
 void *create_viterbi(int16_t len)
 {
-    /* Keep state in internal RAM */
-    struct v27 *vp = &v27_local;
+    struct v27 *vp;
 
     if (!init)
         set_viterbi_polynomial(polys);
 
+    if ((vp = malloc(sizeof(struct v27))) == NULL)
+        return NULL;
+
     vp->dlen = (len + 6) * sizeof(decision_t);
-    if ((vp->decisions = malloc(vp->dlen)) == NULL)
+    if ((vp->decisions = malloc(vp->dlen)) == NULL) {
+        free(vp);
         return NULL;
+    }
 
     init_viterbi(vp, 0);
 
@@ -151,11 +230,19 @@ int chainback_viterbi(void *p, unsigned char *data, unsigned int nbits, unsigned
     int k;
     struct v27 *vp = p;
     decision_t *d;
-    int errors = vp->old_metrics->w[endstate];
+    int errors;
 
     if (unlikely(p == NULL))
         return -1;
 
+    /* Soft path metrics are scaled back to an equivalent number of bit
+     * errors: the cost of disagreeing with the symbols' own hard decisions,
+     * where a full confidence symbol counts as one */
+    if (vp->soft)
+        errors = (vp->old_smetrics->w[endstate % 64] - vp->soft_base + VITERBI_SOFT_MAX / 2) / VITERBI_SOFT_MAX;
+    else
+        errors = vp->old_metrics->w[endstate % 64] + vp->hard_base;
+
     d = vp->decisions;
 
     /* Make room beyond the end of the encoder register so we can
@@ -181,14 +268,18 @@ void delete_viterbi(void *p)
 {
     struct v27 *vp = p;
 
+    if (vp == NULL)
+        return;
+
     if (vp->decisions != NULL)
         free((void*)vp->decisions);
+    free(vp);
 }
 
 /* C-language butterfly */
 #define BFLY(b)                                                             \
     do {                                                                    \
-        metric = (branchtab[0].c[b] ^ sym0) + (branchtab[1].c[b] ^ sym1);   \
+        metric = (bt[0].c[b] ^ sym0) + (bt[1].c[b] ^ sym1);                 \
                                                                             \
         m0 = vp->old_metrics->w[b] + metric;                                \
         m1 = vp->old_metrics->w[b + 32] + (2 - metric);                     \
@@ -211,14 +302,40 @@ void delete_viterbi(void *p)
 int update_viterbi(void *p, uint8_t *syms, uint16_t nbits)
 {
     struct v27 *vp = p;
-    void *tmp;
-    decision_t *dp, *d = &decisions_local;
-    uint16_t i = 0;
-    uint8_t m0, m1, decision, metric, sym0, sym1;
+    uint16_t n;
+    uint8_t min;
+    int i;
 
     if (unlikely(p == NULL))
         return -1;
 
+    vp->soft = false;
+    while (nbits) {
+        n = MIN(nbits, VITERBI_RENORM);
+        impls[impl].update(vp, branchtab, syms, n);
+        syms += n * VITERBI_RATE / BITS_PER_BYTE;
+        nbits -= n;
+
+        /* Renormalize, keeping what was taken off for chainback_viterbi */
+        min = vp->old_metrics->w[0];
+        for (i = 1; i < 64; i++)
+            min = MIN(min, vp->old_metrics->w[i]);
+        for (i = 0; i < 64; i++)
+            vp->old_metrics->w[i] -= min;
+        vp->hard_base += min;
+    }
+
+    return 0;
+}
+
+/* Portable implementation of update_viterbi */
+int update_viterbi_port(struct v27 *vp, const branchtab_t *bt, const uint8_t *syms, uint16_t nbits)
+{
+    void *tmp;
+    decision_t local, *dp, *d = &local;
+    uint16_t i = 0;
+    uint8_t m0, m1, decision, metric, sym0, sym1;
+
     dp = vp->dp;
 
     while (likely(nbits--)) {
@@ -273,7 +390,101 @@ int update_viterbi(void *p, uint8_t *syms, uint16_t nbits)
         vp->new_metrics = tmp;
     }
 
-    vp->dp = d;
+    vp->dp = dp;
+    return 0;
+}
+
+/* C-language butterfly, soft decision metrics */
+#define BFLY_SOFT(b)                                                                \
+    do {                                                                            \
+        metric = (soft_branchtab[0].c[b] ^ sym0) + (soft_branchtab[1].c[b] ^ sym1); \
+                                                                                    \
+        m0 = vp->old_smetrics->w[b] + metric;                                       \
+        m1 = vp->old_smetrics->w[b + 32] + (2 * VITERBI_SOFT_MAX - metric);         \
+        decision = m0 > m1;                                                         \
+        vp->new_smetrics->w[(b << 1)] = decision ? m1 : m0;                         \
+        d->w[b >> 2] |= decision << (((b << 1)) & 7);                               \
+                                                                                    \
+        m0 -= (metric + metric - 2 * VITERBI_SOFT_MAX);                             \
+        m1 += (metric + metric - 2 * VITERBI_SOFT_MAX);                             \
+        decision = m0 > m1;                                                         \
+        vp->new_smetrics->w[(b << 1) + 1] = decision ? m1 : m0;                     \
+        d->w[b >> 2] |= decision << (((b << 1) + 1) & 7);                           \
+    } while (0)
+
+/*
+ * Update decoder with a block of soft decision symbols, one byte per
+ * channel symbol: 0 is a strong zero, VITERBI_SOFT_MAX a strong one and
+ * values in between express the demodulator confidence.
+ * As with update_viterbi, nbits is the number of decoded data bits.
+ */
+int update_viterbi_soft(void *p, uint8_t *syms, uint16_t nbits)
+{
+    struct v27 *vp = p;
+    void *tmp;
+    decision_t local, *dp, *d = &local;
+    uint32_t m0, m1, metric;
+    uint8_t decision, sym0, sym1;
+
+    if (unlikely(p == NULL))
+        return -1;
+
+    dp = vp->dp;
+    vp->soft = true;
+
+    while (likely(nbits--)) {
+        /* Cache decisions in internal memory */
+        memset(d, 0, sizeof(decision_t));
+
+        /* Read symbols */
+        sym0 = *syms++;
+        sym1 = *syms++;
+        vp->soft_base += MIN(sym0, VITERBI_SOFT_MAX - sym0) + MIN(sym1, VITERBI_SOFT_MAX - sym1);
+
+        /* Unrolled butterflies */
+        BFLY_SOFT(0);
+        BFLY_SOFT(1);
+        BFLY_SOFT(2);
+        BFLY_SOFT(3);
+        BFLY_SOFT(4);
+        BFLY_SOFT(5);
+        BFLY_SOFT(6);
+        BFLY_SOFT(7);
+        BFLY_SOFT(8);
+        BFLY_SOFT(9);
+        BFLY_SOFT(10);
+        BFLY_SOFT(11);
+        BFLY_SOFT(12);
+        BFLY_SOFT(13);
+        BFLY_SOFT(14);
+        BFLY_SOFT(15);
+        BFLY_SOFT(16);
+        BFLY_SOFT(17);
+        BFLY_SOFT(18);
+        BFLY_SOFT(19);
+        BFLY_SOFT(20);
+        BFLY_SOFT(21);
+        BFLY_SOFT(22);
+        BFLY_SOFT(23);
+        BFLY_SOFT(24);
+        BFLY_SOFT(25);
+        BFLY_SOFT(26);
+        BFLY_SOFT(27);
+        BFLY_SOFT(28);
+        BFLY_SOFT(29);
+        BFLY_SOFT(30);
+        BFLY_SOFT(31);
+
+        /* Writeback cached data */
+        memcpy(dp++, d, sizeof(decision_t));
+
+        /* Swap pointers to old and new metrics */
+        tmp = vp->old_smetrics;
+        vp->old_smetrics = vp->new_smetrics;
+        vp->new_smetrics = tmp;
+    }
+
+    vp->dp = dp;
     return 0;
 }
 
@@ -283,7 +494,8 @@ void encode_viterbi(unsigned char *channel, unsigned char *data, int framebits)
     unsigned char bit;
     unsigned char in_sr = 0;
     unsigned char out_sr = 0;
-    unsigned char temp[520];
+    /* channel may alias data, so encode to a scratch buffer first */
+    unsigned char temp[(framebits + 8) / 4 + 1];
 
     for (i = 0; i < framebits + 8; i++) {
         bit = (i >= framebits) ? 0 : get_bit(data, i);
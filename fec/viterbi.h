@@ -12,12 +12,23 @@
 #define VITERBI_CONSTRAINT	7
 #define VITERBI_TAIL		1
 #define VITERBI_RATE		2
+#define VITERBI_SOFT_MAX	255
+
+/* Butterfly implementations, the best supported one is picked at load time */
+#define VITERBI_IMPL_PORT	0
+#define VITERBI_IMPL_SSE2	1
+#define VITERBI_IMPL_AVX2	2
+#define VITERBI_IMPL_COUNT	3
 
 void *create_viterbi(int16_t len);
 int init_viterbi(void *vp,int starting_state);
 int update_viterbi(void *vp, unsigned char sym[], uint16_t npairs);
+int update_viterbi_soft(void *vp, unsigned char sym[], uint16_t npairs);
 int chainback_viterbi(void *vp, unsigned char *data, unsigned int nbits,unsigned int endstate);
 void delete_viterbi(void *vp);
+int viterbi_set_impl(int impl);
+int viterbi_get_impl(void);
+const char *viterbi_impl_name(int impl);
 void encode_viterbi(unsigned char * channel, unsigned char * data, int framebits);
 
 #endif // VITERBI_H_
@@ -0,0 +1,50 @@
+/*
+ * K=7 r=1/2 Viterbi decoder internals shared by the portable and
+ * vectorized implementations
+ * Copyright Feb 2004, Phil Karn, KA9Q
+ * May be used under the terms of the GNU Lesser General Public License (LGPL)
+ */
+
+#ifndef VITERBI_PRIV_H_
+#define VITERBI_PRIV_H_
+
+#include <stdint.h>
+#include <stdbool.h>
+
+#ifndef BITS_PER_BYTE
+#define BITS_PER_BYTE 8
+#endif
+
+#define likely(x)       __builtin_expect((x),1)
+#define unlikely(x)     __builtin_expect((x),0)
+
+typedef union { uint8_t w[64]; } metric_t;
+typedef union { uint32_t w[64]; } soft_metric_t;
+typedef union { uint8_t w[8];} decision_t;
+typedef union { uint8_t c[32]; } branchtab_t;
+
+/* State info for Viterbi decoder instance */
+struct v27 {
+    metric_t metrics1;                  /* path metric buffer 1 */
+    metric_t metrics2;                  /* path metric buffer 2 */
+    decision_t *dp;                     /* Pointer to current decision */
+    metric_t *old_metrics,*new_metrics; /* Pointers to path metrics, swapped on every bit */
+    uint32_t hard_base;                 /* Taken off the hard decision path metrics so far */
+    decision_t *decisions;              /* Beginning of decisions for block */
+    uint32_t dlen;                      /* Length of decisions array for block, in bytes */
+    soft_metric_t smetrics1;            /* Soft decision path metric buffer 1 */
+    soft_metric_t smetrics2;            /* Soft decision path metric buffer 2 */
+    soft_metric_t *old_smetrics,*new_smetrics;
+    bool soft;                          /* Last update used soft symbols */
+    uint32_t soft_base;                 /* Metric of the symbols' own hard decisions */
+};
+
+/* Hard decision add-compare-select kernels, bit-exact with each other.
+ * On return the newest path metrics are in vp->old_metrics. */
+int update_viterbi_port(struct v27 *vp, const branchtab_t *bt, const uint8_t *syms, uint16_t nbits);
+#if defined(__x86_64__) || defined(__i386__)
+int update_viterbi_sse2(struct v27 *vp, const branchtab_t *bt, const uint8_t *syms, uint16_t nbits);
+int update_viterbi_avx2(struct v27 *vp, const branchtab_t *bt, const uint8_t *syms, uint16_t nbits);
+#endif
+
+#endif // VITERBI_PRIV_H_
@@ -0,0 +1,147 @@
+/*
+ * K=7 r=1/2 Viterbi decoder, SSE2 and AVX2 add-compare-select kernels
+ * for the portable decoder by Phil Karn, KA9Q
+ * May be used under the terms of the GNU Lesser General Public License (LGPL)
+ *
+ * Both kernels keep all 64 path metrics in registers for the whole block
+ * and produce exactly the same metrics and decisions as the portable
+ * butterflies in viterbi.c. update_viterbi() hands them at most
+ * VITERBI_RENORM bits at a time, so their 8-bit metrics never wrap.
+ * They are compiled with target attributes so no special compiler flags
+ * are needed; viterbi.c only calls them when the CPU supports them.
+ */
+
+#if defined(__x86_64__) || defined(__i386__)
+
+#include <string.h>
+#include <immintrin.h>
+
+#include "viterbi_priv.h"
+
+/* Channel bits 2n and 2n+1 of a packed, MSB first, symbol buffer */
+#define SYM_SHIFT(_n)   (6 - (((_n) & 3) << 1))
+#define SYM0(_p, _n)    (((_p)[(_n) >> 2] >> (SYM_SHIFT(_n) + 1)) & 1)
+#define SYM1(_p, _n)    (((_p)[(_n) >> 2] >> SYM_SHIFT(_n)) & 1)
+
+/* Sixteen butterflies: old states b and b + 32 into new states 2b, 2b + 1.
+ * Leaves the new metrics for 32 states in _na/_nb and the inverted
+ * decisions for them in _mask. */
+#define ACS_SSE2(_oa, _ob, _bt0, _bt1, _na, _nb, _mask)                     \
+    do {                                                                    \
+        __m128i metric, m0, m1, m2, m3, sv0, sv1, d0, d1;                   \
+                                                                            \
+        metric = _mm_add_epi8(_mm_xor_si128(_bt0, sym0),                    \
+                              _mm_xor_si128(_bt1, sym1));                   \
+        m0 = _mm_add_epi8(_oa, metric);                                     \
+        m1 = _mm_add_epi8(_ob, _mm_sub_epi8(two, metric));                  \
+        m2 = _mm_add_epi8(_oa, _mm_sub_epi8(two, metric));                  \
+        m3 = _mm_add_epi8(_ob, metric);                                     \
+                                                                            \
+        sv0 = _mm_min_epu8(m0, m1);                                         \
+        sv1 = _mm_min_epu8(m2, m3);                                         \
+        d0 = _mm_cmpeq_epi8(sv0, m0);                                       \
+        d1 = _mm_cmpeq_epi8(sv1, m2);                                       \
+                                                                            \
+        _na = _mm_unpacklo_epi8(sv0, sv1);                                  \
+        _nb = _mm_unpackhi_epi8(sv0, sv1);                                  \
+        _mask = (uint32_t)_mm_movemask_epi8(_mm_unpacklo_epi8(d0, d1)) |    \
+                (uint32_t)_mm_movemask_epi8(_mm_unpackhi_epi8(d0, d1)) << 16; \
+    } while (0)
+
+__attribute__((target("sse2")))
+int update_viterbi_sse2(struct v27 *vp, const branchtab_t *bt, const uint8_t *syms, uint16_t nbits)
+{
+    const __m128i two = _mm_set1_epi8(2);
+    const __m128i bt0a = _mm_loadu_si128((const __m128i *)&bt[0].c[0]);
+    const __m128i bt0b = _mm_loadu_si128((const __m128i *)&bt[0].c[16]);
+    const __m128i bt1a = _mm_loadu_si128((const __m128i *)&bt[1].c[0]);
+    const __m128i bt1b = _mm_loadu_si128((const __m128i *)&bt[1].c[16]);
+    __m128i old0, old1, old2, old3, sym0, sym1;
+    decision_t *dp = vp->dp;
+    uint32_t lo, hi;
+    uint64_t decisions;
+    uint16_t n;
+
+    old0 = _mm_loadu_si128((const __m128i *)&vp->old_metrics->w[0]);
+    old1 = _mm_loadu_si128((const __m128i *)&vp->old_metrics->w[16]);
+    old2 = _mm_loadu_si128((const __m128i *)&vp->old_metrics->w[32]);
+    old3 = _mm_loadu_si128((const __m128i *)&vp->old_metrics->w[48]);
+
+    for (n = 0; n < nbits; n++) {
+        __m128i n0, n1, n2, n3;
+
+        sym0 = _mm_set1_epi8(SYM0(syms, n));
+        sym1 = _mm_set1_epi8(SYM1(syms, n));
+
+        ACS_SSE2(old0, old2, bt0a, bt1a, n0, n1, lo);
+        ACS_SSE2(old1, old3, bt0b, bt1b, n2, n3, hi);
+
+        decisions = ~((uint64_t)hi << 32 | lo);
+        memcpy(dp++, &decisions, sizeof(decision_t));
+
+        old0 = n0;
+        old1 = n1;
+        old2 = n2;
+        old3 = n3;
+    }
+
+    _mm_storeu_si128((__m128i *)&vp->old_metrics->w[0], old0);
+    _mm_storeu_si128((__m128i *)&vp->old_metrics->w[16], old1);
+    _mm_storeu_si128((__m128i *)&vp->old_metrics->w[32], old2);
+    _mm_storeu_si128((__m128i *)&vp->old_metrics->w[48], old3);
+
+    vp->dp = dp;
+    return 0;
+}
+
+__attribute__((target("avx2")))
+int update_viterbi_avx2(struct v27 *vp, const branchtab_t *bt, const uint8_t *syms, uint16_t nbits)
+{
+    const __m256i two = _mm256_set1_epi8(2);
+    const __m256i bt0 = _mm256_loadu_si256((const __m256i *)bt[0].c);
+    const __m256i bt1 = _mm256_loadu_si256((const __m256i *)bt[1].c);
+    __m256i old_lo, old_hi;
+    decision_t *dp = vp->dp;
+    uint64_t decisions;
+    uint16_t n;
+
+    old_lo = _mm256_loadu_si256((const __m256i *)&vp->old_metrics->w[0]);
+    old_hi = _mm256_loadu_si256((const __m256i *)&vp->old_metrics->w[32]);
+
+    for (n = 0; n < nbits; n++) {
+        __m256i metric, m0, m1, m2, m3, sv0, sv1, d0, d1, lo, hi;
+
+        /* All 32 butterflies at once */
+        metric = _mm256_add_epi8(_mm256_xor_si256(bt0, _mm256_set1_epi8(SYM0(syms, n))),
+                                 _mm256_xor_si256(bt1, _mm256_set1_epi8(SYM1(syms, n))));
+        m0 = _mm256_add_epi8(old_lo, metric);
+        m1 = _mm256_add_epi8(old_hi, _mm256_sub_epi8(two, metric));
+        m2 = _mm256_add_epi8(old_lo, _mm256_sub_epi8(two, metric));
+        m3 = _mm256_add_epi8(old_hi, metric);
+
+        sv0 = _mm256_min_epu8(m0, m1);
+        sv1 = _mm256_min_epu8(m2, m3);
+        d0 = _mm256_cmpeq_epi8(sv0, m0);
+        d1 = _mm256_cmpeq_epi8(sv1, m2);
+
+        /* Unpacks work within 128-bit lanes, put the states back in order */
+        lo = _mm256_unpacklo_epi8(sv0, sv1);
+        hi = _mm256_unpackhi_epi8(sv0, sv1);
+        old_lo = _mm256_permute2x128_si256(lo, hi, 0x20);
+        old_hi = _mm256_permute2x128_si256(lo, hi, 0x31);
+
+        lo = _mm256_unpacklo_epi8(d0, d1);
+        hi = _mm256_unpackhi_epi8(d0, d1);
+        decisions = ~((uint64_t)(uint32_t)_mm256_movemask_epi8(_mm256_permute2x128_si256(lo, hi, 0x31)) << 32 |
+                      (uint32_t)_mm256_movemask_epi8(_mm256_permute2x128_si256(lo, hi, 0x20)));
+        memcpy(dp++, &decisions, sizeof(decision_t));
+    }
+
+    _mm256_storeu_si256((__m256i *)&vp->old_metrics->w[0], old_lo);
+    _mm256_storeu_si256((__m256i *)&vp->old_metrics->w[32], old_hi);
+
+    vp->dp = dp;
+    return 0;
+}
+
+#endif /* __x86_64__ || __i386__ */
@@ -0,0 +1,76 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 18:31:52
+
+ Bounded LRU cache of decode results, keyed by a hash of the frame bits.
+
+ A repeated beacon, a retransmission, a tag firing twice on the same bits
+ or a second receiver sending the same frame would otherwise go through
+ Viterbi, RS and AES once more.
+ Keys are a 128-bit BLAKE2b digest of the hard bits of the frame, soft
+ symbols sliced first since their noise differs on every copy, with the
+ frame kind. Entries are dropped least recently used first once the cache
+ holds size entries. With a ttl they are also dropped after ttl seconds,
+ so a beacon that repeats the same bits later is decoded and printed
+ again; by default (ttl 0) only the size bounds them.
+
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+FRAME_CACHE_SIZE = 4096
+# Seconds an entry stays valid, 0 keeps it until evicted
+FRAME_CACHE_TTL = 0.0
+
+
+class FrameCache():
+    def __init__(self, size=FRAME_CACHE_SIZE, ttl=FRAME_CACHE_TTL):
+        if size <= 0:
+            raise ValueError("Frame cache size must be positive")
+        self.size = size
+        # Seconds an entry stays valid, 0 keeps it until evicted
+        self.ttl = ttl
+        # key -> (time stored, value), least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(frame, soft, kind):
+        if soft:
+            # Offset binary symbols, the top bit is the hard decision
+            frame = np.packbits(np.frombuffer(frame, dtype=np.uint8) >> 7).tobytes()
+        return kind, hashlib.blake2b(frame, digest_size=16).digest()
+
+    def get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is not None and self.ttl and now - entry[0] > self.ttl:
+            del self.entries[key]
+            self.evictions += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value, now):
+        self.entries[key] = (now, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def counts(self):
+        return self.hits, self.misses, self.evictions
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,362 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 17:48:30
+
+ Indexed, append-only store of decoded frames.
+
+ A store is a directory of segments. Every segment NNNNNN.seg is a list of
+ records, each a record header, the index entry of the record, the frame
+ data as it came out of Reed-Solomon (CSP header first, payload still
+ encrypted) and the decrypted payload:
+
+   record header: magic b"FR", frame data length, payload length
+
+ Next to it NNNNNN.idx holds the same index entries back to back, fixed
+ size, so a query maps the index with NumPy and only touches the records
+ that match:
+
+   offset  size  field
+   0       8     timestamp (seconds since epoch, double, the receiver's when known)
+   8       8     offset of the record in the segment
+   16      4     PDU sequence number
+   20      1     status (STATUS_OK, STATUS_CRC_MISMATCH, STATUS_NO_KEY)
+   21      1     key ID
+   22      6     CSP priority, source, destination, destination port, source port, flags
+   28      4     corrected bits
+   32      2     corrected bytes
+
+ Segments are written by a background thread through buffered files and
+ flushed every FLUSH_INTERVAL seconds, data before index, so an index
+ entry never points past the data. A new segment is started once one
+ reaches the segment size. After a crash the index of the last segment is
+ rebuilt from its records and a partial record at the end is dropped.
+
+   python3 frame_store.py query frames/ --start 2026-10-18T12:00 --port 10
+   python3 frame_store.py redecode frames/ --keyring keys.txt --key-id 5
+
+"""
+
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+
+RECORD_MAGIC = b"FR"
+RECORD_HEADER = struct.Struct("<2sHH")
+INDEX_ENTRY = struct.Struct("<dQIBB6BIH")
+INDEX_DTYPE = np.dtype([
+    ("timestamp", "<f8"), ("offset", "<u8"), ("seq", "<u4"), ("status", "u1"), ("key_id", "u1"),
+    ("prio", "u1"), ("src", "u1"), ("dst", "u1"), ("dport", "u1"), ("sport", "u1"), ("flags", "u1"),
+    ("bit_corr", "<u4"), ("byte_corr", "<u2"),
+])
+assert INDEX_DTYPE.itemsize == INDEX_ENTRY.size
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+FLUSH_INTERVAL = 1.0
+# Write buffer of the segment file
+WRITE_BUFFER = 1024 * 1024
+
+STATUS_OK = 0
+STATUS_CRC_MISMATCH = 1
+STATUS_NO_KEY = 2
+STATUS_NAMES = {STATUS_OK: "ok", STATUS_CRC_MISMATCH: "crc_mismatch", STATUS_NO_KEY: "no_key"}
+
+# What the decoder hands over for every frame that passed Reed-Solomon
+FrameRecord = namedtuple("FrameRecord", ["timestamp", "seq", "status", "key_id", "bit_corr", "byte_corr",
+                                         "frame", "payload"])
+
+# What a query returns
+StoredFrame = namedtuple("StoredFrame", ["timestamp", "seq", "status", "key_id", "prio", "src", "dst", "dport",
+                                         "sport", "flags", "bit_corr", "byte_corr", "frame", "payload"])
+
+
+def csp_fields(frame):
+    # CSP 1.x header in network byte order: priority, source, destination, ports and flags
+    header = int.from_bytes(frame[:4], byteorder='big')
+    return (header >> 30, (header >> 25) & 0x1F, (header >> 20) & 0x1F,
+            (header >> 14) & 0x3F, (header >> 8) & 0x3F, header & 0xFF)
+
+
+def segment_paths(path, number):
+    base = os.path.join(path, f"{number:06d}")
+    return base + ".seg", base + ".idx"
+
+
+def segment_numbers(path):
+    return sorted(int(name[:-4]) for name in os.listdir(path) if name.endswith(".seg") and name[:-4].isdigit())
+
+
+def parse_time(text):
+    # Seconds since epoch or an ISO 8601 date, local time unless it says otherwise
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+class FrameStore():
+    """Appends FrameRecords to the segments in path. Not thread safe, see FrameStoreWriter."""
+    def __init__(self, path, segment_size=SEGMENT_SIZE):
+        self.path = path
+        self.segment_size = segment_size
+        os.makedirs(path, exist_ok=True)
+        numbers = segment_numbers(path)
+        self.number = numbers[-1] if numbers else 0
+        self.count = 0
+        # Index entries of records not flushed yet
+        self.idx_pending = []
+        self.recover()
+        self.open_segment()
+
+    def recover(self):
+        """Bring the index of the last segment up to its complete records."""
+        seg_path, idx_path = segment_paths(self.path, self.number)
+        if not os.path.exists(seg_path):
+            return
+        seg_size = os.path.getsize(seg_path)
+        with open(idx_path, "ab+") as idx:
+            entries = idx.tell() // INDEX_ENTRY.size
+            idx.truncate(entries * INDEX_ENTRY.size)
+            end = 0
+            if entries:
+                idx.seek((entries - 1) * INDEX_ENTRY.size)
+                end = self.record_end(seg_path, INDEX_ENTRY.unpack(idx.read(INDEX_ENTRY.size))[1])
+            idx.seek(0, os.SEEK_END)
+            with open(seg_path, "rb") as seg:
+                while end + RECORD_HEADER.size + INDEX_ENTRY.size <= seg_size:
+                    seg.seek(end)
+                    magic, frame_len, payload_len = RECORD_HEADER.unpack(seg.read(RECORD_HEADER.size))
+                    next_end = end + RECORD_HEADER.size + INDEX_ENTRY.size + frame_len + payload_len
+                    if magic != RECORD_MAGIC or next_end > seg_size:
+                        break
+                    idx.write(seg.read(INDEX_ENTRY.size))
+                    end = next_end
+        if end < seg_size:
+            print(f"WARNING: dropping {seg_size - end} bytes of partial record at the end of {seg_path}",
+                  file=sys.stderr)
+            os.truncate(seg_path, end)
+
+    @staticmethod
+    def record_end(seg_path, offset):
+        with open(seg_path, "rb") as seg:
+            seg.seek(offset)
+            _, frame_len, payload_len = RECORD_HEADER.unpack(seg.read(RECORD_HEADER.size))
+        return offset + RECORD_HEADER.size + INDEX_ENTRY.size + frame_len + payload_len
+
+    def open_segment(self):
+        seg_path, idx_path = segment_paths(self.path, self.number)
+        self.seg = open(seg_path, "ab", buffering=WRITE_BUFFER)
+        self.idx = open(idx_path, "ab")
+        self.offset = self.seg.tell()
+
+    def rotate(self):
+        self.flush()
+        self.seg.close()
+        self.idx.close()
+        self.number += 1
+        self.open_segment()
+
+    def append(self, record):
+        frame = bytes(record.frame)
+        payload = bytes(record.payload)
+        entry = INDEX_ENTRY.pack(record.timestamp, self.offset, record.seq & 0xFFFFFFFF, record.status,
+                                 record.key_id & 0xFF, *csp_fields(frame),
+                                 min(record.bit_corr, 0xFFFFFFFF), min(record.byte_corr, 0xFFFF))
+        self.seg.write(RECORD_HEADER.pack(RECORD_MAGIC, len(frame), len(payload)))
+        self.seg.write(entry)
+        self.seg.write(frame)
+        self.seg.write(payload)
+        # Written on flush, after the data it points to
+        self.idx_pending.append(entry)
+        self.offset += RECORD_HEADER.size + len(entry) + len(frame) + len(payload)
+        self.count += 1
+        if self.offset >= self.segment_size:
+            self.rotate()
+
+    def flush(self):
+        self.seg.flush()
+        if self.idx_pending:
+            self.idx.write(b"".join(self.idx_pending))
+            self.idx_pending = []
+        self.idx.flush()
+
+    def close(self):
+        self.flush()
+        self.seg.close()
+        self.idx.close()
+
+
+class FrameStoreWriter():
+    """Appends the records put by the decoder from a background thread."""
+    def __init__(self, store, interval=FLUSH_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def put(self, records):
+        if records:
+            self.queue.put(records)
+
+    def run(self):
+        next_flush = time.monotonic() + self.interval
+        while 1:
+            try:
+                records = self.queue.get(timeout=self.interval)
+            except queue.Empty:
+                records = []
+            if records is None:
+                break
+            try:
+                for record in records:
+                    self.store.append(record)
+                if time.monotonic() >= next_flush:
+                    next_flush = time.monotonic() + self.interval
+                    self.store.flush()
+            except OSError as e:
+                print(f"ERROR: frame store write failed: {e}", file=sys.stderr)
+        self.store.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="frame-store", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        # Writes out everything queued so far
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join()
+
+
+class FrameStoreReader():
+    """Range queries over a store, also while it is being written."""
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            raise ValueError(f"{path} is not a frame store")
+
+    def query(self, start=None, end=None, key_id=None, port=None, status=None):
+        """Yields the StoredFrames with start <= timestamp < end, the key ID,
+        CSP source or destination port and status given, in store order."""
+        for number in segment_numbers(self.path):
+            seg_path, idx_path = segment_paths(self.path, number)
+            entries = os.path.getsize(idx_path) // INDEX_ENTRY.size if os.path.exists(idx_path) else 0
+            if not entries:
+                continue
+            index = np.memmap(idx_path, dtype=INDEX_DTYPE, mode="r", shape=(entries,))
+            mask = np.ones(entries, dtype=bool)
+            if start is not None:
+                mask &= index["timestamp"] >= start
+            if end is not None:
+                mask &= index["timestamp"] < end
+            if key_id is not None:
+                mask &= index["key_id"] == key_id
+            if port is not None:
+                mask &= (index["dport"] == port) | (index["sport"] == port)
+            if status is not None:
+                mask &= index["status"] == status
+            hits = np.flatnonzero(mask)
+            if not len(hits):
+                continue
+            with open(seg_path, "rb") as f:
+                seg = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+            try:
+                for i in hits:
+                    entry = index[i]
+                    offset = int(entry["offset"])
+                    _, frame_len, payload_len = RECORD_HEADER.unpack_from(seg, offset)
+                    data = offset + RECORD_HEADER.size + INDEX_ENTRY.size
+                    yield StoredFrame(*(entry[name].item() for name in INDEX_DTYPE.names if name != "offset"),
+                                      seg[data:data + frame_len], seg[data + frame_len:data + frame_len + payload_len])
+            finally:
+                seg.close()
+            del index
+
+
+def format_frame(frame):
+    when = datetime.fromtimestamp(frame.timestamp).isoformat(timespec="milliseconds")
+    return (f"{when} seq {frame.seq} {STATUS_NAMES.get(frame.status, frame.status)} key {frame.key_id} "
+            f"csp {frame.src}:{frame.sport} -> {frame.dst}:{frame.dport} prio {frame.prio} flags 0x{frame.flags:02X} "
+            f"corrected {frame.bit_corr} bits {frame.byte_corr} bytes, {len(frame.payload)} payload bytes")
+
+
+def query(args, reader):
+    count = 0
+    for frame in reader.query(args.start, args.end, args.key_id, args.port):
+        print(format_frame(frame))
+        if args.hexdump:
+            print(hexdump(frame.payload))
+        count += 1
+    print(f"INFO: {count} frames", file=sys.stderr)
+
+
+def redecode(args, reader, keyring):
+    # Imported here so queries do not load the decoder and its native library
+    from sdrp_pdu_decoder import PAYLOAD_DATA_IDX, PAYLOAD_LEN_IDX, payload_crc_idx
+
+    frames = list(reader.query(args.start, args.end, args.key_id, args.port))
+    decrypted = keyring.decrypt_batch([frame.frame[PAYLOAD_DATA_IDX:payload_crc_idx(len(frame.frame))]
+                                       for frame in frames],
+                                      [frame.key_id for frame in frames])
+    for frame, plain in zip(frames, decrypted):
+        print(format_frame(frame))
+        if plain is None:
+            print(f"ERROR: no key for key ID {frame.key_id}")
+            continue
+        payload_len = int.from_bytes(frame.frame[PAYLOAD_LEN_IDX:PAYLOAD_DATA_IDX], byteorder='little')
+        print(hexdump(plain[:payload_len]))
+    print(f"INFO: {len(frames)} frames", file=sys.stderr)
+
+
+def hexdump(data):
+    from fec import PacketHandler
+    return PacketHandler.hexdump(data)
+
+
+def main():
+    parser = ArgumentParser(description="Query the frames stored by sdrp_pdu_decoder --store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("query", "List the stored frames that match"),
+                            ("redecode", "Decrypt the stored frames that match again with another keyring")):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("store", help="Store directory")
+        sub.add_argument("--start", type=parse_time, default=None,
+                         help="First time, seconds since epoch or ISO 8601")
+        sub.add_argument("--end", type=parse_time, default=None, help="End time, excluded")
+        sub.add_argument("--key-id", type=int, default=None, help="Only frames with this key ID")
+        sub.add_argument("--port", type=int, default=None, help="Only frames with this CSP source or destination port")
+        if name == "query":
+            sub.add_argument("--hexdump", action="store_true", help="Print the decrypted payloads")
+        else:
+            sub.add_argument("--keyring", required=True, help="File of \"<key id> <key>\" lines")
+    args = parser.parse_args()
+    try:
+        reader = FrameStoreReader(args.store)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.command == "query":
+        query(args, reader)
+    else:
+        from crypto import Keyring
+        try:
+            keyring = Keyring.load(args.keyring)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot load keyring: {e}")
+        redecode(args, reader, keyring)
+
+
+if __name__ == '__main__':
+    main()
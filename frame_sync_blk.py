@@ -0,0 +1,70 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 14:05:31
+
+ Frame synchronizer: finds the access codes in the hard bit stream and
+ sends the frames that follow them, replacing correlate_access_code_tag_bb
+ and the tag handling of tag_to_pdu_udp_bb.
+
+"""
+
+import numpy as np
+from tag_to_pdu_blk import tag_to_pdu_udp_bb
+
+
+class frame_sync_udp_b(tag_to_pdu_udp_bb):
+    def __init__(self, codes, threshold=8, udp_ip="127.0.0.1", udp_port=52001, packed=True, soft=False, shm_name=None,
+                 margin=0):
+        # codes maps access codes, as '0'/'1' strings of equal length, to the PDU length of their frames,
+        # or to a tuple of lengths to also send the prefixes for the shortened frame kinds.
+        # A frame starts at the first bit of its access code, found with up to threshold wrong bits.
+        lengths = set(len(code) for code in codes)
+        if len(lengths) != 1:
+            raise ValueError("Access codes must all have the same length")
+        tag_to_pdu_udp_bb.__init__(self, udp_ip=udp_ip, udp_port=udp_port, packed=packed, soft=soft,
+                                   shm_name=shm_name, frame_lens=codes, margin=margin)
+        self.code_len = lengths.pop()
+        self.threshold = threshold
+
+        # Correlation kernels: the distance to a code is its number of ones
+        # plus the sum of the bits weighted -1 where the code has a one and
+        # +1 where it has a zero. Reversed, since np.convolve flips the kernel.
+        self.codes = []
+        for code, lengths in self.frame_lens.items():
+            bits = np.array([int(b) for b in code], dtype=np.float32)
+            self.codes.append(((1 - 2 * bits)[::-1].copy(), float(bits.sum()), lengths))
+
+        # Every access code found, including frames skipped at the start of the stream
+        self.hits = 0
+
+        # The last code_len - 1 bits of the previous call, so codes straddling two calls are found
+        self.history = np.zeros(0, dtype=np.uint8)
+
+    def general_work(self, input_items, output_items):
+        nread = self.nitems_read(0)
+        ninput = min(len(items) for items in input_items)
+
+        # One pass per code over the whole buffer, a distance for every start position
+        bits = np.concatenate((self.history, input_items[0][:ninput]))
+        first = nread - len(self.history)
+        if len(bits) >= self.code_len:
+            weights = bits.astype(np.float32)
+            for kernel, ones, lengths in self.codes:
+                distance = np.convolve(weights, kernel, 'valid') + ones
+                hits = np.flatnonzero(distance <= self.threshold)
+                self.hits += len(hits)
+                for pos in hits:
+                    start = first + int(pos) - self.margin
+                    if start < 0:
+                        # Start of stream, the margin before the code was never seen
+                        self.skipped += 1
+                        continue
+                    self.queue_frame(start, int(distance[pos]), lengths)
+        self.history = bits[max(0, len(bits) - self.code_len + 1):].copy()
+
+        self.collect(input_items, ninput)
+        self.consume_each(ninput)
+        return ninput if ninput > 0 else 1
@@ -0,0 +1,167 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 11:02:37
+
+ Batched frame ingest for the PDU decoder.
+
+ A dedicated thread waits on the transport and, on every wake-up, drains
+ all queued datagrams. Each drained batch is handed to the decode stage
+ through a bounded queue, so a busy decoder never stalls the transport:
+ when the queue is full the batch is dropped and counted.
+
+ SocketIngest reads UDP, counting kernel side overflows exactly through
+ SO_RXQ_OVFL. ShmIngest reads the shared-memory ring from shm_ring, which
+ counts overruns itself.
+
+"""
+
+import socket
+import struct
+import threading
+import queue
+
+from pdu_format import peek_seq
+from shm_ring import ShmRingReader
+
+
+# Requested socket receive buffer, the kernel caps it to net.core.rmem_max
+RCVBUF_SIZE = 8 * 1024 * 1024
+MAX_BATCH = 64
+QUEUE_LEN = 256
+
+# Linux only, not exported by the socket module
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40)
+
+
+class Ingest():
+    # Subclasses provide read_batch() and transport specific stats
+    def __init__(self, max_batch=MAX_BATCH, queue_len=QUEUE_LEN, batches=None, source=None):
+        self.max_batch = max_batch
+        # Several ingests can share one queue, their batches then come as (source, batch)
+        self.batches = batches if batches is not None else queue.Queue(maxsize=queue_len)
+        self.source = source
+        self.thread = None
+        self.lock = threading.Lock()
+
+        self.received = 0
+        self.batch_count = 0
+        self.max_batch_seen = 0
+        self.queue_drops = 0
+        self.seq_gaps = 0
+        self.last_seq = None
+
+    def count(self, batch):
+        with self.lock:
+            self.received += len(batch)
+            self.batch_count += 1
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            for datagram in batch:
+                seq = peek_seq(datagram)
+                if seq is None:
+                    continue
+                if self.last_seq is not None and seq > self.last_seq + 1:
+                    self.seq_gaps += seq - self.last_seq - 1
+                self.last_seq = seq
+
+    def run(self):
+        while 1:
+            try:
+                batch = self.read_batch()
+            except (OSError, ValueError):
+                # Transport closed
+                break
+            self.count(batch)
+            try:
+                self.batches.put_nowait(batch if self.source is None else (self.source, batch))
+            except queue.Full:
+                with self.lock:
+                    self.queue_drops += len(batch)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="ingest", daemon=True)
+        self.thread.start()
+        return self
+
+    def get(self, timeout=None):
+        """Next batch of datagrams, or None on timeout."""
+        try:
+            return self.batches.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def transport_stats(self):
+        return {}
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                "received": self.received,
+                "batches": self.batch_count,
+                "max_batch": self.max_batch_seen,
+                "queue_depth": self.batches.qsize(),
+                "queue_drops": self.queue_drops,
+                "seq_gaps": self.seq_gaps,
+            }
+        stats.update(self.transport_stats())
+        return stats
+
+    def format_stats(self):
+        name = "ingest" if self.source is None else f"ingest {self.source}"
+        return f"INFO: {name} " + " ".join(f"{key}={value}" for key, value in self.stats().items())
+
+
+class SocketIngest(Ingest):
+    def __init__(self, sock, max_datagram, max_batch=MAX_BATCH, queue_len=QUEUE_LEN, rcvbuf=RCVBUF_SIZE,
+                 batches=None, source=None):
+        Ingest.__init__(self, max_batch, queue_len, batches, source)
+        self.sock = sock
+        self.max_datagram = max_datagram
+
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            self.ovfl = True
+        except OSError:
+            self.ovfl = False
+        self.ancbuf = socket.CMSG_SPACE(4) if self.ovfl else 0
+        self.kernel_drops = 0
+
+    def recv(self, flags=0):
+        data, ancdata, msg_flags, addr = self.sock.recvmsg(self.max_datagram, self.ancbuf, flags)
+        for level, kind, value in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                # Running total of datagrams the kernel dropped on this socket
+                self.kernel_drops = struct.unpack("I", value[:4])[0]
+        return data
+
+    def read_batch(self):
+        # Block for the first datagram, then take whatever else is already queued
+        batch = [self.recv()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.recv(socket.MSG_DONTWAIT))
+            except (BlockingIOError, InterruptedError):
+                break
+        return batch
+
+    def transport_stats(self):
+        return {
+            "kernel_drops": self.kernel_drops,
+            "rcvbuf": self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+        }
+
+
+class ShmIngest(Ingest):
+    def __init__(self, name, max_batch=MAX_BATCH, queue_len=QUEUE_LEN, consumer=0, consumers=1,
+                 batches=None, source=None):
+        Ingest.__init__(self, max_batch, queue_len, batches, source)
+        self.ring = ShmRingReader(name, consumer, consumers)
+
+    def read_batch(self):
+        return self.ring.read_batch(self.max_batch)
+
+    def transport_stats(self):
+        return {"ring_overruns": self.ring.overruns, "ring_restarts": self.ring.restarts}
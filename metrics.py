@@ -0,0 +1,295 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 14:10:26
+
+ Decode pipeline instrumentation.
+
+ DecoderMetrics keeps per-stage latency histograms, a counter for every
+ frame outcome and the corrected bit and byte distributions. It is only
+ created when an exporter is requested; the decoder checks for None
+ before doing any timing, so a disabled pipeline pays a single test per
+ frame.
+
+ Metrics are exported as Prometheus text on a local HTTP endpoint
+ (MetricsServer) or as a JSON file rewritten periodically (JsonFlusher).
+ Decoder worker processes keep their own DecoderMetrics and hand the
+ parent a delta with every result batch (take() and merge()).
+
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+# Pipeline stages in decode order. viterbi to rs run inside decode_frames.
+STAGES = ("unpack", "viterbi", "asm", "resync", "derandomize", "rs", "crc", "decrypt")
+
+# Frame outcomes, prefix_miss for an early PDU of a frame that is not a shortened one
+RESULTS = ("ok", "parse_error", "asm_mismatch", "rs_failed", "crc_mismatch", "no_key", "payload_error", "duplicate",
+           "prefix_miss")
+CACHE_EVENTS = ("hit", "miss", "eviction")
+# Diversity combining: frames and copies received, copies decoded after the
+# best one failed, and frames saved by a fallback or by the combined copy
+DIVERSITY_EVENTS = ("frames", "copies", "fallbacks", "fallback_decoded", "combined_decoded")
+
+# Upper bounds: 1 us to about 1 s in powers of two, corrected bits in powers
+# of two up to the 32768 channel bits of 8 interleaved codewords, corrected
+# bytes one by one up to the 32 parity bytes of a codeword (erasure retries
+# correct up to 28), then coarser up to 8 codewords summed
+LATENCY_BUCKETS = tuple(1e-6 * 2 ** k for k in range(21))
+BIT_BUCKETS = (0,) + tuple(2 ** k for k in range(16))
+BYTE_BUCKETS = tuple(range(33)) + (48, 64, 96, 128, 192, 256)
+
+METRICS_INTERVAL = 10.0
+
+
+class Histogram():
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # Last bucket catches everything above the largest bound
+        self.counts = np.zeros(len(bounds) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_many(self, values):
+        values = np.asarray(values)
+        if not len(values):
+            return
+        self.counts += np.bincount(np.searchsorted(self.bounds, values), minlength=len(self.counts))
+        self.sum += float(values.sum())
+        self.count += len(values)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.sum += other.sum
+        self.count += other.count
+
+    def to_dict(self):
+        return {
+            "buckets": {str(b): int(c) for b, c in zip(self.bounds + ("+Inf",), np.cumsum(self.counts))},
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+class DecoderMetrics():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+        # Callable returning extra gauges, e.g. the ingest stats
+        self.gauges = None
+
+    def reset(self):
+        self.stages = {stage: Histogram(LATENCY_BUCKETS) for stage in STAGES}
+        self.results = dict.fromkeys(RESULTS, 0)
+        self.bit_corr = Histogram(BIT_BUCKETS)
+        self.byte_corr = Histogram(BYTE_BUCKETS)
+        self.frames = 0
+        self.batches = 0
+        # Frames recovered by realigning them after a failed ASM check
+        self.resynced = 0
+        # Frame cache lookups and entries dropped
+        self.cache = dict.fromkeys(CACHE_EVENTS, 0)
+        self.diversity = dict.fromkeys(DIVERSITY_EVENTS, 0)
+
+    def observe_batch(self, nframes):
+        with self.lock:
+            self.frames += nframes
+            self.batches += 1
+
+    def observe_stage(self, stage, seconds):
+        with self.lock:
+            self.stages[stage].observe(seconds)
+
+    def observe_native(self, names, stage_ns, bit_corr, byte_corr):
+        # One decode_batch call: a stage_ns column per name, corrections of the
+        # frames that reached Viterbi and RS decoding respectively
+        with self.lock:
+            for k, name in enumerate(names):
+                stage = stage_ns[:, k]
+                # Zero when the frame stopped before this stage
+                self.stages[name].observe_many(stage[stage > 0] * 1e-9)
+            self.bit_corr.observe_many(bit_corr)
+            self.byte_corr.observe_many(byte_corr)
+
+    def count(self, result):
+        with self.lock:
+            self.results[result] += 1
+
+    def count_resynced(self, n=1):
+        with self.lock:
+            self.resynced += n
+
+    def count_cache(self, hits, misses, evictions):
+        with self.lock:
+            for event, n in zip(CACHE_EVENTS, (hits, misses, evictions)):
+                self.cache[event] += n
+
+    def count_diversity(self, event, n=1):
+        with self.lock:
+            self.diversity[event] += n
+
+    def take(self):
+        """Detach the metrics gathered so far and start over, for merging elsewhere."""
+        with self.lock:
+            delta = DecoderMetrics.__new__(DecoderMetrics)
+            delta.__dict__.update({k: v for k, v in self.__dict__.items() if k not in ("lock", "gauges")})
+            self.reset()
+        return delta
+
+    def merge(self, other):
+        with self.lock:
+            for stage in STAGES:
+                self.stages[stage].merge(other.stages[stage])
+            for result in RESULTS:
+                self.results[result] += other.results[result]
+            self.bit_corr.merge(other.bit_corr)
+            self.byte_corr.merge(other.byte_corr)
+            self.frames += other.frames
+            self.batches += other.batches
+            self.resynced += other.resynced
+            for event in CACHE_EVENTS:
+                self.cache[event] += other.cache[event]
+            for event in DIVERSITY_EVENTS:
+                self.diversity[event] += other.diversity[event]
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k not in ("lock", "gauges")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.gauges = None
+
+    def to_dict(self):
+        with self.lock:
+            data = {
+                "timestamp": time.time(),
+                "frames": self.frames,
+                "batches": self.batches,
+                "results": dict(self.results),
+                "resynced": self.resynced,
+                "frame_cache": dict(self.cache),
+                "diversity": dict(self.diversity),
+                "stage_seconds": {stage: hist.to_dict() for stage, hist in self.stages.items()},
+                "corrected_bits": self.bit_corr.to_dict(),
+                "corrected_bytes": self.byte_corr.to_dict(),
+            }
+        if self.gauges:
+            data["gauges"] = self.gauges()
+        return data
+
+    def to_prometheus(self):
+        lines = []
+
+        def histogram(name, hist, labels=""):
+            sep = "," if labels else ""
+            suffix = f"{{{labels}}}" if labels else ""
+            for bound, count in zip(hist.bounds + ("+Inf",), np.cumsum(hist.counts)):
+                lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{suffix} {hist.sum}")
+            lines.append(f"{name}_count{suffix} {hist.count}")
+
+        with self.lock:
+            lines += ["# HELP sdrp_frames_total Frames handed to the decoder",
+                      "# TYPE sdrp_frames_total counter",
+                      f"sdrp_frames_total {self.frames}",
+                      "# HELP sdrp_batches_total Decoder batches",
+                      "# TYPE sdrp_batches_total counter",
+                      f"sdrp_batches_total {self.batches}",
+                      "# HELP sdrp_frame_results_total Frames by decode outcome",
+                      "# TYPE sdrp_frame_results_total counter"]
+            lines += [f'sdrp_frame_results_total{{result="{result}"}} {count}'
+                      for result, count in self.results.items()]
+            lines += ["# HELP sdrp_resynced_frames_total Frames realigned to another bit offset or polarity",
+                      "# TYPE sdrp_resynced_frames_total counter",
+                      f"sdrp_resynced_frames_total {self.resynced}"]
+            lines += ["# HELP sdrp_frame_cache_total Frame cache hits, misses and evictions",
+                      "# TYPE sdrp_frame_cache_total counter"]
+            lines += [f'sdrp_frame_cache_total{{event="{event}"}} {count}' for event, count in self.cache.items()]
+            lines += ["# HELP sdrp_diversity_total Diversity combining frames, copies and fallback decodes",
+                      "# TYPE sdrp_diversity_total counter"]
+            lines += [f'sdrp_diversity_total{{event="{event}"}} {count}' for event, count in self.diversity.items()]
+
+            lines += ["# HELP sdrp_stage_seconds Time spent per frame in each decode stage",
+                      "# TYPE sdrp_stage_seconds histogram"]
+            for stage, hist in self.stages.items():
+                histogram("sdrp_stage_seconds", hist, f'stage="{stage}"')
+
+            lines += ["# HELP sdrp_corrected_bits Bit errors corrected by Viterbi per frame",
+                      "# TYPE sdrp_corrected_bits histogram"]
+            histogram("sdrp_corrected_bits", self.bit_corr)
+            lines += ["# HELP sdrp_corrected_bytes Byte errors corrected by Reed-Solomon per frame",
+                      "# TYPE sdrp_corrected_bytes histogram"]
+            histogram("sdrp_corrected_bytes", self.byte_corr)
+
+        for key, value in (self.gauges() if self.gauges else {}).items():
+            lines += [f"# TYPE sdrp_{key} gauge", f"sdrp_{key} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer():
+    """Prometheus text endpoint at http://ip:port/metrics."""
+    def __init__(self, metrics, port, ip="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((ip, port), Handler)
+        self.server.daemon_threads = True
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        return self
+
+
+class JsonFlusher():
+    """Rewrites path with the current metrics every interval seconds."""
+    def __init__(self, metrics, path, interval=METRICS_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+
+    def flush(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.metrics.to_dict(), f, indent=1)
+        # Readers never see a partial file
+        os.replace(tmp, self.path)
+
+    def run(self):
+        while 1:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"ERROR: metrics flush failed: {e}")
+
+    def start(self):
+        threading.Thread(target=self.run, name="metrics-json", daemon=True).start()
+        return self
@@ -0,0 +1,282 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 13:05:12
+
+ Record PDU datagrams to a capture file and replay them into the decoder.
+
+ A capture file is a memory-mapped, append-only list of datagrams exactly
+ as received (any pdu_format version), each with its arrival time:
+
+   file header (16 bytes): magic b"SFCP", version, end of the last record
+   record: arrival time (seconds since epoch, double), length, datagram
+
+ The header is updated after every record, so a capture cut short by a
+ crash is still readable up to the last complete frame.
+
+   python3 pdu_capture.py record pass.cap
+   python3 pdu_capture.py replay pass.cap --realtime
+
+ Replay decodes in this process with the same code as sdrp_pdu_decoder and
+ reports frames/s, decode latency percentiles and the decode success rate,
+ so decoder changes can be measured on the same pass. With --send the
+ datagrams go to a running decoder over UDP instead.
+
+"""
+
+import mmap
+import os
+import socket
+import struct
+import sys
+import time
+from argparse import ArgumentParser
+from collections import Counter
+
+import numpy as np
+
+from ingest import SocketIngest, MAX_BATCH
+from pdu_format import MAX_DATAGRAM_LEN
+from shm_ring import ShmRingReader
+
+
+CAPTURE_MAGIC = b"SFCP"
+CAPTURE_VERSION = 1
+
+CAPTURE_HEADER = struct.Struct("<4sIQ")
+RECORD_HEADER = struct.Struct("<dI")
+
+# The file grows by this much whenever the mapping is full
+CAPTURE_CHUNK = 16 * 1024 * 1024
+
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class CaptureWriter():
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.size = 0
+        self.mm = None
+        self.end = CAPTURE_HEADER.size
+        self.count = 0
+        self.grow(CAPTURE_CHUNK)
+        CAPTURE_HEADER.pack_into(self.mm, 0, CAPTURE_MAGIC, CAPTURE_VERSION, self.end)
+
+    def grow(self, needed):
+        size = self.size
+        while size < needed:
+            size += CAPTURE_CHUNK
+        os.ftruncate(self.fd, size)
+        if self.mm:
+            self.mm.resize(size)
+        else:
+            self.mm = mmap.mmap(self.fd, size)
+        self.size = size
+
+    def append(self, datagram, timestamp):
+        end = self.end + RECORD_HEADER.size + len(datagram)
+        if end > self.size:
+            self.grow(end)
+        RECORD_HEADER.pack_into(self.mm, self.end, timestamp, len(datagram))
+        self.mm[self.end + RECORD_HEADER.size:end] = datagram
+        self.end = end
+        self.count += 1
+        struct.pack_into("<Q", self.mm, 8, end)
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        # Drop the unused tail of the last chunk
+        os.ftruncate(self.fd, self.end)
+        os.close(self.fd)
+
+
+class CaptureReader():
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # Empty or cut short before its header, mmap would fail on it
+            if size < CAPTURE_HEADER.size:
+                raise ValueError(f"{path} is not a PDU capture")
+            self.mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        magic, version, self.end = CAPTURE_HEADER.unpack_from(self.mm, 0)
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION or self.end > size:
+            self.mm.close()
+            raise ValueError(f"{path} is not a PDU capture")
+
+    def __iter__(self):
+        # Yields (arrival time, datagram)
+        offset = CAPTURE_HEADER.size
+        while offset + RECORD_HEADER.size <= self.end:
+            timestamp, length = RECORD_HEADER.unpack_from(self.mm, offset)
+            offset += RECORD_HEADER.size
+            yield timestamp, self.mm[offset:offset + length]
+            offset += length
+
+    def close(self):
+        self.mm.close()
+
+
+def record(args):
+    if args.shm:
+        ring = ShmRingReader(args.shm)
+        read_batch = lambda: ring.read_batch(MAX_BATCH)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((args.ip, args.port))
+        read_batch = SocketIngest(sock, MAX_DATAGRAM_LEN).read_batch
+
+    capture = CaptureWriter(args.file)
+    print(f"INFO: recording to {args.file}, Ctrl-C to stop", file=sys.stderr)
+    try:
+        while args.count <= 0 or capture.count < args.count:
+            batch = read_batch()
+            # Datagrams drained together were already queued, they share the wake-up time
+            now = time.time()
+            for datagram in batch:
+                capture.append(datagram, now)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.close()
+    print(f"INFO: recorded {capture.count} PDUs, {capture.end} bytes", file=sys.stderr)
+
+
+def replay(args):
+    # Imported here so recording does not load the decoder and its native library
+    import sdrp_pdu_decoder
+    from sdrp_pdu_decoder import decode_messages
+    from metrics import DecoderMetrics, STAGES
+    from frame_cache import FrameCache
+
+    try:
+        capture = CaptureReader(args.file)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return
+    records = list(capture)
+    if not records:
+        print("ERROR: empty capture", file=sys.stderr)
+        return
+    first = records[0][0]
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if args.send else None
+    if sock:
+        host, port = args.send.rsplit(":", 1)
+        dest = (host, int(port))
+
+    sdrp_pdu_decoder.rs_erasures = args.erasures
+    sdrp_pdu_decoder.rs_interleave = args.interleave
+    sdrp_pdu_decoder.decode_threads = args.decode_threads
+    if args.frame_cache > 0:
+        sdrp_pdu_decoder.frame_cache = FrameCache(args.frame_cache)
+    metrics = DecoderMetrics() if args.stages else None
+    latencies = []
+    results = Counter()
+    start = time.monotonic()
+    i = 0
+    while i < len(records):
+        now = time.monotonic()
+        if args.realtime:
+            due = start + (records[i][0] - first) / args.speed
+            if due > now:
+                time.sleep(due - now)
+                now = time.monotonic()
+            # Everything that is due by now, each released at its own recorded time
+            j = i
+            while j < len(records) and j - i < args.max_batch and \
+                    start + (records[j][0] - first) / args.speed <= now:
+                j += 1
+            released = [start + (t - first) / args.speed for t, _ in records[i:j]]
+        else:
+            j = min(i + args.max_batch, len(records))
+            released = [now] * (j - i)
+
+        batch = [datagram for _, datagram in records[i:j]]
+        if sock:
+            for datagram in batch:
+                sock.sendto(datagram, dest)
+        else:
+            outputs = decode_messages(batch, metrics)
+            done = time.monotonic()
+            latencies += [done - t for t in released]
+            results.update(result for _, result, _ in outputs)
+            if args.verbose:
+                for _, _, output in outputs:
+                    print(output)
+        i = j
+
+    elapsed = time.monotonic() - start
+    capture.close()
+
+    span = records[-1][0] - first
+    print(f"Frames:    {len(records)} in {elapsed:.3f} s, {len(records) / elapsed:.1f} frames/s "
+          f"(recorded span {span:.3f} s)")
+    if sock:
+        print(f"Sent to {args.send}")
+        return
+
+    lat = np.array(latencies) * 1000
+    pct = np.percentile(lat, LATENCY_PERCENTILES)
+    print("Latency:   " + ", ".join(f"p{p} {v:.3f} ms" for p, v in zip(LATENCY_PERCENTILES, pct)) +
+          f", max {lat.max():.3f} ms, mean {lat.mean():.3f} ms")
+    print(f"Decoded:   {results['ok']}/{len(records)} ({100 * results['ok'] / len(records):.1f}%)")
+    for kind, count in sorted(results.items()):
+        if kind != "ok":
+            print(f"  {kind}: {count}")
+    cache = sdrp_pdu_decoder.frame_cache
+    if cache:
+        hits, misses, evictions = cache.counts()
+        print(f"Cache:     {hits} hits, {misses} misses, {evictions} evictions")
+    if metrics:
+        print(f"Resynced:  {metrics.resynced} frames realigned after a failed ASM check")
+        print("Stages:    mean per frame")
+        for stage in STAGES:
+            hist = metrics.stages[stage]
+            if hist.count:
+                print(f"  {stage:<12} {1e6 * hist.sum / hist.count:9.2f} us  ({hist.count} frames)")
+
+
+def main():
+    parser = ArgumentParser(description="Record and replay SDRP PDU datagrams")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="Append received PDUs to a capture file")
+    rec.add_argument("file", help="Capture file, overwritten")
+    rec.add_argument("--ip", type=str, default="0.0.0.0", help="Address to listen on (default: %(default)s)")
+    rec.add_argument("--port", type=int, default=52001, help="UDP port to listen on (default: %(default)s)")
+    rec.add_argument("--shm", type=str, default=None, help="Record from the shared-memory ring NAME instead of UDP")
+    rec.add_argument("--count", type=int, default=0, help="Stop after N PDUs, 0 records until Ctrl-C")
+
+    rep = commands.add_parser("replay", help="Decode a capture file and report throughput and latency")
+    rep.add_argument("file", help="Capture file")
+    rep.add_argument("--realtime", action="store_true",
+                     help="Release frames at their recorded arrival times instead of as fast as possible")
+    rep.add_argument("--speed", type=float, default=1.0, help="Time scale for --realtime (default: %(default)s)")
+    rep.add_argument("--max-batch", type=int, default=MAX_BATCH,
+                     help="Frames decoded per call (default: %(default)s)")
+    rep.add_argument("--send", type=str, default=None, metavar="IP:PORT",
+                     help="Send the datagrams to a running decoder instead of decoding them here")
+    rep.add_argument("--erasures", action="store_true", help="Decode with erasure-assisted Reed-Solomon retries")
+    rep.add_argument("--interleave", type=int, default=1, choices=range(1, 9), metavar="I",
+                     help="Reed-Solomon interleaving depth of the frames, 1 to 8 (default: %(default)s)")
+    rep.add_argument("--decode-threads", type=int, default=1,
+                     help="Threads decoding every batch (default: %(default)s)")
+    rep.add_argument("--frame-cache", type=int, default=0, metavar="N",
+                     help="Skip decoding frames with the same bits as one of the last N, 0 disables")
+    rep.add_argument("--stages", action="store_true", help="Also report the mean time spent in each decode stage")
+    rep.add_argument("--verbose", action="store_true", help="Print the decoder output")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    else:
+        replay(args)
+
+
+if __name__ == '__main__':
+    main()
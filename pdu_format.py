@@ -0,0 +1,117 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 09:12:05
+
+ Wire format of the PDU datagrams sent from tag_to_pdu_udp_bb to the decoder.
+
+ Legacy datagrams carry one bit per byte (PDU_LEN bytes, values 0/1).
+ Versioned datagrams start with a fixed header followed by the frame
+ already bit-packed MSB first, or as one soft symbol byte per bit
+ (0 strong zero, 255 strong one) when FLAG_SOFT is set. With FLAG_MARGIN
+ the frame bits are framed by SLIP_MARGIN bits of context on both sides,
+ so the decoder can realign frames whose tag was off by a few bits.
+ FLAG_SHORTENED marks the PDUs of a receiver that also tries the
+ shortened frame kinds: a PDU of a shortened length is an early prefix
+ of the frame, sent as soon as its bits are in, and the PDU of the full
+ length follows it:
+
+   offset  size  field
+   0       2     magic b"SF"
+   2       1     version
+   3       1     flags
+   4       4     sequence number
+   8       8     absolute sample offset of the first frame bit (after the margin)
+   16      8     host timestamp (seconds since epoch, double)
+   24      2     ASM correlation score (wrong bits in the access code)
+   26      2     number of frame bits, margins included
+   28      ...   frame bits, packed or soft
+
+"""
+
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+
+PDU_MAGIC = b"SF"
+PDU_VERSION = 1
+
+# Header flags
+FLAG_PACKED = 0x01
+FLAG_SOFT = 0x02
+FLAG_MARGIN = 0x04
+FLAG_SHORTENED = 0x08
+
+# Channel bits of context before and after FLAG_MARGIN frames, whole bytes
+# so the packed frame itself stays byte aligned
+SLIP_MARGIN = 16
+
+PDU_HEADER = struct.Struct("<2sBBIQdHH")
+PDU_HEADER_SIZE = PDU_HEADER.size
+
+# Largest datagram accepted by the decoder socket
+MAX_DATAGRAM_LEN = 65535
+
+ASM_SCORE_UNKNOWN = 0xFFFF
+
+PduMeta = namedtuple("PduMeta", ["version", "flags", "seq", "offset", "timestamp", "asm_score", "nbits"])
+
+LEGACY_META = PduMeta(0, 0, 0, 0, 0.0, ASM_SCORE_UNKNOWN, 0)
+
+
+def pack_pdu(bits, seq, offset, timestamp, asm_score=ASM_SCORE_UNKNOWN, soft=None, margin=0, shortened=False):
+    """Build a versioned datagram from an array of unpacked bits (one per byte).
+
+    When soft symbols (uint8, one per bit) are given they are sent instead
+    of the packed hard bits. margin is 0 or SLIP_MARGIN, the context bits
+    included on both sides of the frame. shortened sets FLAG_SHORTENED.
+    """
+    if margin not in (0, SLIP_MARGIN):
+        raise ValueError(f"Margin must be 0 or {SLIP_MARGIN} bits")
+    nbits = len(bits)
+    flags = FLAG_SOFT if soft is not None else FLAG_PACKED
+    if margin:
+        flags |= FLAG_MARGIN
+    if shortened:
+        flags |= FLAG_SHORTENED
+    header = PDU_HEADER.pack(PDU_MAGIC, PDU_VERSION, flags, seq & 0xFFFFFFFF,
+                             offset, timestamp, min(asm_score, ASM_SCORE_UNKNOWN), nbits)
+    if soft is not None:
+        return header + np.asarray(soft, dtype=np.uint8).tobytes()
+    return header + np.packbits(bits).tobytes()
+
+
+def peek_seq(datagram):
+    """Sequence number of a versioned datagram without parsing the rest, None for legacy ones."""
+    if datagram[:2] != PDU_MAGIC or len(datagram) < PDU_HEADER_SIZE:
+        return None
+    return struct.unpack_from("<I", datagram, 4)[0]
+
+
+def unpack_pdu(datagram):
+    """Split a received datagram into (PduMeta, packed frame bytes).
+
+    For FLAG_SOFT datagrams the frame holds one soft symbol byte per bit.
+
+    Both the legacy one-bit-per-byte datagrams and the versioned format are
+    accepted. Raises ValueError for datagrams that are neither.
+    """
+    if datagram[:2] == PDU_MAGIC and len(datagram) >= PDU_HEADER_SIZE:
+        magic, version, flags, seq, offset, timestamp, asm_score, nbits = PDU_HEADER.unpack_from(datagram)
+        if version != PDU_VERSION:
+            raise ValueError(f"Unsupported PDU version {version}")
+        frame = datagram[PDU_HEADER_SIZE:]
+        available = len(frame) if flags & FLAG_SOFT else len(frame) * 8
+        if available < nbits:
+            raise ValueError(f"Truncated PDU, {available} bits of {nbits}")
+        return PduMeta(version, flags, seq, offset, timestamp, asm_score, nbits), frame
+
+    # Legacy datagram: one bit per byte
+    bits = np.frombuffer(datagram, dtype=np.uint8)
+    if bits.max(initial=0) > 1:
+        raise ValueError("Datagram is neither a versioned nor a legacy PDU")
+    return LEGACY_META._replace(nbits=len(bits)), np.packbits(bits).tobytes()
@@ -0,0 +1,85 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 15:20:44
+
+ Low-rate receiver monitoring for headless operation.
+
+ Instead of the Qt sinks, the flowgraph keeps one vector of filtered
+ samples and one of symbols now and then in probe_signal_vc blocks.
+ SnapshotMonitor reads them every interval seconds and rewrites a JSON
+ file with the spectrum (dB per FFT bin, DC in the middle), the latest
+ constellation points and the frame sync counters. The flowgraph only
+ pays for the vector copies, the FFT runs once per interval.
+
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Samples per snapshot, as the Qt sinks
+SNAPSHOT_LEN = 1024
+MONITOR_INTERVAL = 5.0
+
+
+def keep_one_in(rate, interval):
+    # Vectors to skip so the probes get about one vector per interval
+    return max(1, int(rate * interval / SNAPSHOT_LEN))
+
+
+class SnapshotMonitor():
+    """Rewrites path with the current spectrum and constellation every interval seconds."""
+    def __init__(self, spectrum_probe, symbol_probe, path, samp_rate, interval=MONITOR_INTERVAL, stats=None):
+        self.spectrum_probe = spectrum_probe
+        self.symbol_probe = symbol_probe
+        self.path = path
+        self.samp_rate = samp_rate
+        self.interval = interval
+        # Callable returning extra counters, e.g. frames sent
+        self.stats = stats
+        # Blackman-Harris like the Qt sinks, normalized to unit gain
+        n = np.arange(SNAPSHOT_LEN)
+        self.window = (0.35875 - 0.48829 * np.cos(2 * np.pi * n / (SNAPSHOT_LEN - 1)) +
+                       0.14128 * np.cos(4 * np.pi * n / (SNAPSHOT_LEN - 1)) -
+                       0.01168 * np.cos(6 * np.pi * n / (SNAPSHOT_LEN - 1)))
+        self.window /= self.window.sum()
+
+    def snapshot(self):
+        samples = np.asarray(self.spectrum_probe.level(), dtype=np.complex64)
+        symbols = np.asarray(self.symbol_probe.level(), dtype=np.complex64)
+        spectrum = np.fft.fftshift(np.fft.fft(samples * self.window))
+        power = 20 * np.log10(np.abs(spectrum) + 1e-12)
+        data = {
+            "timestamp": time.time(),
+            "samp_rate": self.samp_rate,
+            "spectrum_db": np.round(power, 2).tolist(),
+            "constellation": np.round(np.column_stack((symbols.real, symbols.imag)), 4).tolist(),
+        }
+        if self.stats:
+            data["stats"] = self.stats()
+        return data
+
+    def flush(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        # Readers never see a partial file
+        os.replace(tmp, self.path)
+
+    def run(self):
+        while 1:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"ERROR: monitor snapshot failed: {e}")
+
+    def start(self):
+        threading.Thread(target=self.run, name="rx-monitor", daemon=True).start()
+        return self
@@ -0,0 +1,127 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 17:12:06
+
+ Multi-channel receiver: one wideband capture split into channels.
+
+ The source runs at channels * SAMPLE_RATE around LO_FREQ and a polyphase
+ filter bank splits it into channels SAMPLE_RATE wide, SAMPLE_RATE apart.
+ Channel k is centred on LO_FREQ + k * SAMPLE_RATE, the upper half of the
+ bank being the negative offsets as in pfb.channelizer_ccf. Every channel
+ picked gets its own bpsk_channel, the demodulator chain sdrp_receiver is
+ built from, sending to UDP_PORT + k or to the shared-memory ring NAME-k. The scheduler runs every block in its
+ own thread, so the chains already decode in parallel; pin_cores also ties
+ each chain to one core.
+
+"""
+
+import os
+import threading
+
+from gnuradio import blocks
+from gnuradio.filter import pfb
+from gnuradio import gr
+from sdrp_receiver import (LO_FREQ, SAMPLE_RATE, SPS, UDP_IP, UDP_PORT, bpsk_channel, frame_codes, rx_source,
+                           source_defaults)
+
+
+def channel_offset(channel, channels):
+    # Centre of a filter bank channel relative to the capture centre, Hz
+    if channel >= (channels + 1) // 2:
+        channel -= channels
+    return channel * SAMPLE_RATE
+
+
+class sdrp_multichannel_receiver(gr.top_block):
+    # Polyphase channelizer feeding one bpsk_channel per selected channel, headless only
+
+    def __init__(self, channels, select=None, source="pluto", packed_pdu=True, soft=False, shm_name=None,
+                 interleave=1, short_frames=False, recording=None, throttle=False, sps=SPS, pin_cores=False):
+        gr.top_block.__init__(self, "Multi-channel receiver", catch_exceptions=True)
+        self.flowgraph_started = threading.Event()
+
+        ##################################################
+        # Variables
+        ##################################################
+        rf_gain, sync_loop, costas_loop = source_defaults(source)
+        self.channels = channels
+        self.select = select = sorted(set(range(channels) if select is None else select))
+        self.samp_rate = samp_rate = SAMPLE_RATE * channels
+        self.freq = freq = LO_FREQ
+        # The analog filter takes the whole band
+        self.bw = bw = samp_rate
+
+        ##################################################
+        # Blocks
+        ##################################################
+        self.source_out = rx_source(self, source, samp_rate, freq, bw, rf_gain, recording, throttle)
+        self.pfb_channelizer_ccf_0 = pfb.channelizer_ccf(channels, None, 1, 100)
+        codes = frame_codes(interleave, short_frames)
+        self.chains = {}
+        for channel in select:
+            self.chains[channel] = bpsk_channel(
+                freq + channel_offset(channel, channels),
+                codes,
+                udp_port=UDP_PORT + channel,
+                shm_name=f"{shm_name}-{channel}" if shm_name else None,
+                packed_pdu=packed_pdu,
+                soft=soft,
+                sps=sps,
+                sync_loop=sync_loop,
+                costas_loop=costas_loop
+            )
+        if pin_cores:
+            # One core per chain, round robin over the cores this process may use
+            cores = sorted(os.sched_getaffinity(0))
+            for i, channel in enumerate(select):
+                self.chains[channel].set_processor_affinity([cores[i % len(cores)]])
+        # Every channelizer output must be connected, those not picked go nowhere
+        self.blocks_null_sinks = {channel: blocks.null_sink(gr.sizeof_gr_complex*1)
+                                  for channel in range(channels) if channel not in self.chains}
+
+        ##################################################
+        # Connections
+        ##################################################
+        self.connect((self.source_out, 0), (self.pfb_channelizer_ccf_0, 0))
+        for channel, chain in self.chains.items():
+            self.connect((self.pfb_channelizer_ccf_0, channel), (chain, 0))
+        for channel, sink in self.blocks_null_sinks.items():
+            self.connect((self.pfb_channelizer_ccf_0, channel), (sink, 0))
+
+    def channel_plan(self):
+        lines = []
+        for channel, chain in self.chains.items():
+            out = f"ring {chain.shm_name}" if chain.shm_name else f"udp {UDP_IP}:{chain.udp_port}"
+            lines.append(f"Channel {channel}: {chain.freq / 1e6:.3f} MHz -> {out}")
+        return "\n".join(lines)
+
+    def start_monitor(self):
+        # No snapshots, the channel plan is printed instead
+        print(self.channel_plan())
+
+    def frame_stats(self):
+        return {channel: {"asm_hits": chain.frame_sync.hits, "frames_sent": chain.frame_sync.counter,
+                          "frames_skipped": chain.frame_sync.skipped}
+                for channel, chain in self.chains.items()}
+
+    def file_report(self, elapsed):
+        # Summary of a recording played to the end in elapsed seconds, per channel
+        samples = self.source.pos
+        rate = samples / elapsed if elapsed > 0 else 0.0
+        lines = [f"Samples:   {samples} in {elapsed:.3f} s, {rate / 1e6:.3f} Msamples/s "
+                 f"({rate / self.samp_rate:.1f}x real time)"]
+        for channel, stats in self.frame_stats().items():
+            lines.append(f"Channel {channel}: {stats['asm_hits']} ASM hits, {stats['frames_sent']} PDUs sent, "
+                         f"{stats['frames_skipped']} skipped at the start")
+        return "\n".join(lines)
+
+    def set_sync_loop(self, sync_loop):
+        for chain in self.chains.values():
+            chain.set_sync_loop(sync_loop)
+
+    def set_costas_loop(self, costas_loop):
+        for chain in self.chains.values():
+            chain.set_costas_loop(costas_loop)
@@ -10,9 +10,28 @@
 """
 
 import socket
-from fec import PacketHandler
-from crypto import decrypt_aes
+import threading
+import heapq
+import queue
+import signal
+import time
+import multiprocessing
+import sys
+from argparse import ArgumentParser
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from collections import namedtuple
+from fec import PacketHandler, FRAME_OK, FRAME_ASM_MISMATCH, FRAME_RS_FAILED, FRAME_STAGES, FRAME_STAGE_NAMES, RS_MAX_DEPTH
+from crypto import Keyring
 from zlib import crc32
+from pdu_format import unpack_pdu, MAX_DATAGRAM_LEN, FLAG_SOFT, FLAG_MARGIN, FLAG_SHORTENED, SLIP_MARGIN
+from ingest import SocketIngest, ShmIngest, MAX_BATCH, QUEUE_LEN
+from shm_ring import ShmRingReader
+from metrics import DecoderMetrics, MetricsServer, JsonFlusher, METRICS_INTERVAL
+from frame_cache import FrameCache, FRAME_CACHE_TTL
+from diversity import DiversityCombiner, COMBINE_WINDOW
+from frame_store import (FrameStore, FrameStoreWriter, FrameRecord, SEGMENT_SIZE, STATUS_OK, STATUS_CRC_MISMATCH,
+                         STATUS_NO_KEY)
 
 
 VITERBI_RATE = 2
@@ -33,6 +52,8 @@ LONG_FRAME_LIMIT = 86
 TOTAL_FRAME_BIT_LEN = (RS_BLOCK_LENGTH + RAW_ASM_BYTE_LEN)*VITERBI_RATE*8
 TOTAL_FRAME_BYTE_LEN = (RS_BLOCK_LENGTH + RAW_ASM_BYTE_LEN)*VITERBI_RATE
 ACCESS_KEY_32B = 0xe15ae893
+LONG_FRAME_DATA_LEN = SIZE_LENGTH+CSP_OVERHEAD+LONG_FRAME_LIMIT
+SHORT_FRAME_DATA_LEN = SIZE_LENGTH+CSP_OVERHEAD+SHORT_FRAME_LIMIT
 ACCES_KEY_CONVOLVED_64B = bytes([0xB9,0xF8,0xB2,0x20,0xB1,0xCF,0x12,0xBC])
 THRESHOLD64 = 50
 THRESHOLD32 = 26
@@ -51,82 +72,854 @@ PAYLOAD_DATA_SIZE           = 208
 CRC_IDX                     = PAYLOAD_DATA_IDX+PAYLOAD_DATA_SIZE
 CRC_SIZE                    = 4
 TOTAL_PAYLOAD_SIZE          = CRC_IDX+CRC_SIZE
+AES_BLOCK_SIZE              = 16
 
 
 aes_key = "5a749388c2e7d195e630517a9699f2d4"
 
-def decoder(message):
-    ec = PacketHandler(None)
-    # print(f"INFO: Decoding message len {len(message)}")
-    
-    byte_array = bytes((sum(message[k * 8 + j] << (7 - j) for j in range(8)) for k in range(TOTAL_FRAME_BYTE_LEN)))
+# Payload keys, replaced by --keyring. The key ID of a frame comes from
+# the CSP source address or the first control header byte.
+KEY_SELECT_CSP_SRC = "csp-src"
+KEY_SELECT_CONTROL = "control"
+keyring = Keyring.single(aes_key)
+key_select = KEY_SELECT_CSP_SRC
+
+# Erasure-assisted RS retries, set by --erasures
+rs_erasures = False
+
+# RS codewords per frame and threads per decode batch, set by --interleave and --decode-threads
+rs_interleave = 1
+decode_threads = 1
+
+# Results of frames decoded before, set by --frame-cache
+frame_cache = None
+
+# Hexdump of every decrypted payload in the output, off with --quiet
+print_payloads = True
+
+# UDP server config
+UDP_IP = "0.0.0.0"
+UDP_PORT = 52001
+
+# Output reordering, frames are held until their predecessors are out,
+# at most REORDER_WINDOW frames or REORDER_TIMEOUT seconds
+REORDER_WINDOW = 64
+REORDER_TIMEOUT = 0.5
+
+_local = threading.local()
+
+
+def get_handler():
+    # One PacketHandler (and Viterbi instance) per thread, reused across frames
+    if not hasattr(_local, "ec"):
+        _local.ec = PacketHandler(None, erasures=rs_erasures, interleave=rs_interleave)
+    return _local.ec
+
+
+# A frame kind: its ASM before and after the convolutional code, RS codewords,
+# data bytes and Viterbi tail bytes
+FrameFormat = namedtuple("FrameFormat", ["name", "asm_word", "asm_convolved", "depth", "data_len", "tail"])
+
+
+def frame_formats():
+    # Full frames of rs_interleave codewords, and the shortened single
+    # codeword frames. Only those carry the Viterbi tail, so their last
+    # byte decodes like the others. All kinds follow the same ASM, only
+    # the decode tells a shortened frame from a full one.
+    return [
+        FrameFormat("full", ACCESS_KEY_32B, ACCES_KEY_CONVOLVED_64B, rs_interleave,
+                    (RS_BLOCK_LENGTH - RS_LENGTH)*rs_interleave, 0),
+        FrameFormat("long", ACCESS_KEY_32B, ACCES_KEY_CONVOLVED_64B, 1, LONG_FRAME_DATA_LEN, VITERBI_TAIL),
+        FrameFormat("short", ACCESS_KEY_32B, ACCES_KEY_CONVOLVED_64B, 1, SHORT_FRAME_DATA_LEN, VITERBI_TAIL),
+    ]
+
 
+def shortened_formats():
+    # The shortened kinds, shortest first
+    return sorted((fmt for fmt in frame_formats() if fmt.tail), key=frame_bit_len)
 
-    ##### DEBUGGING PRINTING #####
-    # print("Original data:\n{0}\n".format(ec.hexdump(byte_array)))
-    # segment = byte_array[:8]
-    # result = bytes([x ^ y for x, y in zip(segment, ACCES_KEY_CONVOLVED_64B)])
-    # print(result)
-    # print(result.hex())
-    ##############################
 
+def frame_bit_len(fmt):
+    # Channel bits of a frame of the given format
+    block_len = fmt.data_len + RS_LENGTH*fmt.depth
+    return (RAW_ASM_BYTE_LEN + block_len + fmt.tail)*VITERBI_RATE*8
 
+
+def payload_crc_idx(data_len):
+    # Frames carry as many whole AES blocks of payload data as fit in their
+    # data bytes after the headers and the CRC, the CRC right after
+    data_size = data_len - PAYLOAD_DATA_IDX - CRC_SIZE
+    return PAYLOAD_DATA_IDX + data_size // AES_BLOCK_SIZE * AES_BLOCK_SIZE
+
+
+def parse_message(message):
+    # Returns (meta, frame, soft, format, received bits) or an error string
     try:
-        # Unconvolve data to check ASM
-        data, bit_corr, byte_corr = ec.decode_viterbi(byte_array)
+        meta, frame = unpack_pdu(message)
+    except ValueError as e:
+        return f"ERROR: {e}, data_len {len(message)}"
 
+    # The receiver sends exactly the bits of the frame kind it found,
+    # otherwise the longest kind that fits, as for legacy PDUs
+    margin = SLIP_MARGIN if meta.flags & FLAG_MARGIN else 0
+    nbits = meta.nbits - 2*margin
+    formats = [fmt for fmt in frame_formats() if frame_bit_len(fmt) <= nbits]
+    if not formats:
+        return f"ERROR: PDU too short, {nbits} bits, seq {meta.seq}"
+    exact = [fmt for fmt in formats if frame_bit_len(fmt) == nbits]
+    fmt = exact[0] if exact else max(formats, key=frame_bit_len)
+    return meta, frame_bits(meta, frame, fmt), bool(meta.flags & FLAG_SOFT), fmt, frame
+
+
+def frame_bits(meta, received, fmt):
+    # The bits of a frame of the given format at the nominal alignment, packed or soft
+    margin = SLIP_MARGIN if meta.flags & FLAG_MARGIN else 0
+    nbits = frame_bit_len(fmt)
+    if meta.flags & FLAG_SOFT:
+        return bytes(received[margin:margin + nbits])
+    return bytes(received[margin // 8:(margin + nbits) // 8])
+
+
+def is_prefix(meta, fmt):
+    # An early PDU for the shortened kinds, the full one of the same frame follows
+    return bool(meta.flags & FLAG_SHORTENED) and fmt.tail > 0
+
+
+def resync_frame(meta, received, fmt):
+    """Realign a frame whose ASM check failed.
+
+    Correlates the convolved ASM with the received channel bits at every
+    offset up to SLIP_MARGIN bits either way, in both polarities, and
+    returns the frame at the best match, or None when nothing but the
+    nominal alignment clears THRESHOLD64. Bits before the margin or past
+    the end of the PDU are unknown: zero, or neutral soft symbols.
+    """
+    soft = bool(meta.flags & FLAG_SOFT)
+    margin = SLIP_MARGIN if meta.flags & FLAG_MARGIN else 0
+    lo = -margin
+    hi = min(SLIP_MARGIN, meta.nbits - margin - ASM_BIT_LEN)
+    if hi < lo:
+        return None
+
+    # Only the bits the ASM can be in, the rest once a match is found
+    if soft:
+        symbols = np.frombuffer(received, dtype=np.uint8, count=meta.nbits)
+        bits = symbols >> 7
+    else:
+        packed = np.frombuffer(received, dtype=np.uint8)
+        bits = np.unpackbits(packed, count=margin + hi + ASM_BIT_LEN)
+    pattern = np.unpackbits(np.frombuffer(fmt.asm_convolved, dtype=np.uint8))
+    windows = sliding_window_view(bits[margin + lo:margin + hi + ASM_BIT_LEN], ASM_BIT_LEN)
+    matches = np.count_nonzero(windows == pattern, axis=1)
+    # An inverted stream matches wherever the bits differ
+    matches = np.concatenate((matches, ASM_BIT_LEN - matches))
+    best = int(np.argmax(matches))
+    inverted = best >= hi - lo + 1
+    shift = lo + best % (hi - lo + 1)
+    if matches[best] < THRESHOLD64 or (shift == 0 and not inverted):
+        return None
+
+    frame_bits = frame_bit_len(fmt)
+    start = margin + shift
+    if not soft:
+        bits = np.unpackbits(packed, count=meta.nbits)
+    frame = np.full(frame_bits, 128 if soft else 0, dtype=np.uint8)
+    available = min(frame_bits, meta.nbits - start)
+    frame[:available] = symbols[start:start + available] if soft else bits[start:start + available]
+    if inverted:
+        frame[:available] ^= 0xFF if soft else 1
+    return frame.tobytes() if soft else np.packbits(frame).tobytes()
 
-        ##### DEBUGGING PRINTING #####
-        # print("Decoded data: ({0},{1})\n{2}\n".format(bit_corr, byte_corr, ec.hexdump(data)))
-        # asm_found = data[0:4][::-1].hex()
-        # print(f"ASM found: 0x{asm_found}")
-        ##############################
 
+def payload_key_id(payload):
+    if key_select == KEY_SELECT_CONTROL:
+        return payload[CONTROL_HEADER_IDX]
+    # CSP 1.x header in network byte order, source address in bits 29..25
+    return (int.from_bytes(payload[CSP_HEADER_IDX:CONTROL_HEADER_IDX], byteorder='big') >> 25) & 0x1F
 
-        # Check Attached Sync Marker after viterbi processing
-        found_asm = int.from_bytes(data[:ASM_SIZE], byteorder='little')
-        diff = found_asm ^ ACCESS_KEY_32B
-        matches32 = 32 - bin(diff).count('1')
+
+def payload_crc_ok(payload):
+    crc_idx = payload_crc_idx(len(payload))
+    payload_crc = crc32(payload[CSP_HEADER_IDX:crc_idx]) & 0xFFFFFFFF
+    received_crc = int.from_bytes(payload[crc_idx:crc_idx + CRC_SIZE], byteorder='little')  # or 'little'
+    return payload_crc == received_crc
+
+
+def payload_data_len(payload):
+    return int.from_bytes(payload[PAYLOAD_LEN_IDX:PAYLOAD_DATA_IDX], byteorder='little')
+
+
+def handle_payload(ec, payload, decrypted, metrics=None):
+    output = []
+    start = time.perf_counter() if metrics else 0
+    payload_len = payload_data_len(payload)
+    # print(f"payload_len {payload_len}")
+    # print("Decoded data: \n{0}\n".format(ec.hexdump(payload[:TOTAL_PAYLOAD_SIZE])))
+    crc_ok = payload_crc_ok(payload)
+    if not crc_ok:
+        output.append("ERROR: payload CRC missmatch")
+    if metrics:
+        metrics.observe_stage("crc", time.perf_counter() - start)
+    if decrypted is None:
+        result = "no_key"
+        output.append(f"ERROR: no key for key ID {payload_key_id(payload)}")
+    else:
+        result = "ok" if crc_ok else "crc_mismatch"
+        # print("Decrypted payload data:")
+        if print_payloads:
+            output.append("{0}".format(ec.hexdump(decrypted[:payload_len])))
+    if metrics:
+        metrics.count(result)
+    return result, "\n".join(output)
+
+
+def frame_record(meta, payload, decrypted, bit_corr, byte_corr):
+    # What the frame store keeps of a frame that passed Reed-Solomon
+    if decrypted is None:
+        status = STATUS_NO_KEY
+    else:
+        status = STATUS_OK if payload_crc_ok(payload) else STATUS_CRC_MISMATCH
+    return FrameRecord(meta.timestamp if meta.version else time.time(), meta.seq, status,
+                       payload_key_id(payload), int(bit_corr), int(byte_corr), payload,
+                       b"" if decrypted is None else bytes(decrypted[:payload_data_len(payload)]))
+
+
+def decode_group(ec, frames, soft, fmt, metrics=None):
+    # Frames of one kind in one native call, a result tuple per frame
+    frames = np.frombuffer(b"".join(frames), dtype=np.uint8).reshape(len(frames), -1)
+    stage_ns = np.empty((len(frames), FRAME_STAGES), dtype=np.uint64) if metrics else None
+    blocks, bit_corr, byte_corr, matches32, status = ec.decode_batch(
+        frames, soft=soft, asm_word=fmt.asm_word, asm_threshold=THRESHOLD32,
+        block_len=fmt.data_len + RS_LENGTH*fmt.depth, stage_ns=stage_ns, threads=decode_threads,
+        depth=fmt.depth)
+    if metrics:
+        metrics.observe_native(FRAME_STAGE_NAMES, stage_ns, bit_corr, byte_corr[status == FRAME_OK])
+    # Only the data bytes, the parity follows them
+    return [(blocks[k][:fmt.data_len], bit_corr[k], byte_corr[k], matches32[k], status[k])
+            for k in range(len(frames))]
+
+
+def decode_messages(messages, metrics=None, records=None):
+    """Decode a batch of datagrams.
+
+    Returns one (seq, result, output) tuple per datagram, in order. seq is
+    None when the datagram could not be parsed or carries no sequence
+    number, result is one of metrics.RESULTS.
+    Per-stage timings and outcomes go to metrics when given, and the
+    FrameRecord of every frame that passed Reed-Solomon to the records
+    dict under its index in messages.
+    """
+    ec = get_handler()
+    if metrics:
+        metrics.observe_batch(len(messages))
+        parsed = []
+        for message in messages:
+            start = time.perf_counter()
+            parsed.append(parse_message(message))
+            metrics.observe_stage("unpack", time.perf_counter() - start)
+    else:
+        parsed = [parse_message(message) for message in messages]
+
+    # Frames with the same bits as one decoded before, or earlier in this
+    # batch, take its result instead of being decoded again
+    results = [None] * len(parsed)
+    duplicates = set()
+    keys = {}
+    same = {}
+    if frame_cache is not None:
+        now = time.monotonic()
+        cache_before = frame_cache.counts()
+        first = {}
+        for i, p in enumerate(parsed):
+            if isinstance(p, str):
+                continue
+            key = frame_cache.key(p[1], p[2], p[3].name)
+            if key in first:
+                # Looked up once the first copy in this batch is decoded and stored
+                same[i] = key
+                continue
+            result = frame_cache.get(key, now)
+            if result is not None:
+                results[i] = result
+                duplicates.add(i)
+            else:
+                first[key] = i
+                keys[i] = key
+
+    # Hard and soft frames of every kind have different lengths, decode each in one native call
+    groups = {}
+    for i, p in enumerate(parsed):
+        if not isinstance(p, str) and results[i] is None and i not in same:
+            groups.setdefault((p[2], p[3]), []).append(i)
+    for (soft, fmt), idx in groups.items():
+        for i, result in zip(idx, decode_group(ec, [parsed[i][1] for i in idx], soft, fmt, metrics)):
+            results[i] = result
+
+    # Frames that failed the ASM check get one more try at the best other
+    # bit offset or polarity, in case their tag slipped
+    retries = {}
+    for i, result in enumerate(results):
+        if result is None or result[4] != FRAME_ASM_MISMATCH or i in duplicates:
+            continue
+        meta, _, soft, fmt, received = parsed[i]
+        start = time.perf_counter() if metrics else 0
+        frame = resync_frame(meta, received, fmt)
+        if metrics:
+            metrics.observe_stage("resync", time.perf_counter() - start)
+        if frame is not None:
+            retries.setdefault((soft, fmt), []).append((i, frame))
+    for (soft, fmt), items in retries.items():
+        for (i, _), result in zip(items, decode_group(ec, [frame for _, frame in items], soft, fmt, metrics)):
+            if result[4] != FRAME_ASM_MISMATCH:
+                results[i] = result
+                if metrics:
+                    metrics.count_resynced()
+
+    # A full frame that fails Reed-Solomon, from a receiver that sent its
+    # prefixes, may have been a shortened one, decoded and output from its
+    # prefix already. Tried on the same bits, short kind first, and only
+    # counted as a duplicate when one decodes.
+    shortened = set()
+    failed = [i for i, result in enumerate(results)
+              if result is not None and result[4] == FRAME_RS_FAILED and i not in duplicates
+              and parsed[i][0].flags & FLAG_SHORTENED and not parsed[i][3].tail]
+    for fmt in shortened_formats():
+        tries = {}
+        for i in failed:
+            if i not in shortened:
+                tries.setdefault(parsed[i][2], []).append(i)
+        for soft, idx in tries.items():
+            frames = [frame_bits(parsed[i][0], parsed[i][4], fmt) for i in idx]
+            for i, result in zip(idx, decode_group(ec, frames, soft, fmt, metrics)):
+                if result[4] == FRAME_OK:
+                    results[i] = result
+                    shortened.add(i)
+
+    if frame_cache is not None:
+        for i, key in keys.items():
+            # Only frames that passed RS: soft copies with the same hard bits may still differ in the rest
+            if results[i][4] == FRAME_OK:
+                # A copy, the result is a view of the whole batch
+                frame_cache.put(key, (results[i][0].copy(),) + tuple(results[i][1:]), now)
+        for i, key in same.items():
+            result = frame_cache.get(key, now)
+            if result is not None:
+                results[i] = result
+                duplicates.add(i)
+            else:
+                # The first copy failed, so does this one
+                results[i] = results[first[key]]
+        if metrics:
+            metrics.count_cache(*(after - before for after, before in zip(frame_cache.counts(), cache_before)))
+
+    outputs = []
+    # Frames that passed RS, decrypted together once all are known
+    pending = []
+    for i, (p, result) in enumerate(zip(parsed, results)):
+        if result is None:
+            if metrics:
+                metrics.count("parse_error")
+            outputs.append((None, "parse_error", p))
+            continue
+        meta = p[0]
+        seq = meta.seq if meta.version else None
+        payload, bit_corr, byte_corr, matches32, status = result
+        if status != FRAME_OK and is_prefix(meta, p[3]):
+            # Not a shortened frame, or not decodable yet: its full PDU reports it
+            if metrics:
+                metrics.count("prefix_miss")
+            outputs.append((seq, "prefix_miss", ""))
+            continue
 
         ##### DEBUGGING PRINTING #####
-        # print(f"Matching bits: {matches32}.")
+        # print(f"Matching bits: {matches32}, corrected bits {bit_corr}, corrected bytes {byte_corr}.")
         ##############################
 
-        if matches32 >= THRESHOLD32:
-            # Decode payload 
-            payload, bit_corr, byte_corr = ec.decode_fec(data[ASM_SIZE:ASM_SIZE+RS_BLOCK_LENGTH])
-            payload_len = int.from_bytes(payload[PAYLOAD_LEN_IDX:PAYLOAD_DATA_IDX], byteorder='little')
-            # print(f"payload_len {payload_len}")
-            # print("INFO: Decode success with {} corrected bits, payload_len {} payload: \n{}\n".
-            #         format(bit_corr, payload_len, payload[2:payload_len].decode('utf-8', errors='replace')))
-            # print("Decoded data: \n{0}\n".format(ec.hexdump(payload[:TOTAL_PAYLOAD_SIZE])))
-            payload_crc = crc32(payload[CSP_HEADER_IDX:CRC_IDX]) & 0xFFFFFFFF
-            received_crc = int.from_bytes(payload[CRC_IDX:TOTAL_PAYLOAD_SIZE], byteorder='little')  # or 'little'
-            if payload_crc != received_crc:
-                print("ERROR: payload CRC missmatch")
-            decrypted = decrypt_aes(payload[PAYLOAD_DATA_IDX:CRC_IDX], aes_key)
-            # print("Decrypted payload data:")
-            print("{0}".format(ec.hexdump(decrypted[:payload_len])))
+        if status == FRAME_ASM_MISMATCH:
+            if metrics:
+                metrics.count("asm_mismatch")
+            outputs.append((seq, "asm_mismatch", f"ERROR: Matches below threshold {matches32}"))
+        elif status == FRAME_RS_FAILED:
+            if metrics:
+                metrics.count("rs_failed")
+            outputs.append((seq, "rs_failed", f"ERROR: Reed-Solomon decoding error, seq {meta.seq}"))
+        elif i in duplicates or i in shortened:
+            # Already decoded and output once
+            if metrics:
+                metrics.count("duplicate")
+            outputs.append((seq, "duplicate", ""))
         else:
-            print(f"ERROR: Matches below threshold {matches32}")
+            pending.append((len(outputs), meta, payload.tobytes(), bit_corr, byte_corr))
+            outputs.append(None)
 
+    if pending:
+        payloads = [payload for _, _, payload, _, _ in pending]
+        start = time.perf_counter() if metrics else 0
+        decrypted = keyring.decrypt_batch([payload[PAYLOAD_DATA_IDX:payload_crc_idx(len(payload))]
+                                           for payload in payloads],
+                                          [payload_key_id(payload) for payload in payloads])
+        if metrics:
+            per_frame = (time.perf_counter() - start) / len(pending)
+            for _ in pending:
+                metrics.observe_stage("decrypt", per_frame)
 
-    except Exception as e:
+        for (k, meta, payload, bit_corr, byte_corr), plain in zip(pending, decrypted):
+            seq = meta.seq if meta.version else None
+            if records is not None:
+                records[k] = frame_record(meta, payload, plain, bit_corr, byte_corr)
+            try:
+                outputs[k] = (seq,) + handle_payload(ec, payload, plain, metrics)
+            except Exception as e:
+                if metrics:
+                    metrics.count("payload_error")
+                outputs[k] = (seq, "payload_error", f"ERROR: {e}, seq {meta.seq}")
 
-        ##### DEBUGGING PRINTING #####
-        # print("WARNING: Unable to decode original data:\n{0}".format(ec.hexdump(byte_array)))
-        print(f"ERROR: {e}, idx {0}, data_len {0}")
-        ##############################
-    
+    return outputs
 
-def main():
+
+def decoder_batch(messages, metrics=None, store=None):
+    records = {} if store else None
+    for _, _, output in decode_messages(messages, metrics, records):
+        if output:
+            print(output)
+    if store:
+        store.put(list(records.values()))
+
+
+def decoder(message):
+    decoder_batch([message])
+
+
+# Results a better copy of the frame may fix, a missing key or a bad payload is the same on every copy
+COPY_RETRY = ("parse_error", "asm_mismatch", "rs_failed", "crc_mismatch", "prefix_miss")
+
+
+def decode_copies(groups, metrics=None, records=None):
+    """Decode one frame per group of copies from several receivers.
+
+    groups holds (datagrams, copies) pairs from DiversityCombiner: the
+    copies best first, then the combined copy if there is one. A datagram
+    is only decoded when those before it failed, all groups at the same
+    attempt in one batch. Only the results in COPY_RETRY, errors of the
+    channel bits, move on to the next copy. Returns one (seq, result,
+    output) tuple per group: the first copy that decoded, else the error
+    of the best copy.
+    """
+    outputs = [None] * len(groups)
+    pending = list(range(len(groups)))
+    attempt = 0
+    while pending:
+        batch_records = {} if records is not None else None
+        decoded = decode_messages([groups[g][0][attempt] for g in pending], metrics, batch_records)
+        failed = []
+        for n, (g, (seq, result, output)) in enumerate(zip(pending, decoded)):
+            datagrams, copies = groups[g]
+            if attempt and metrics:
+                metrics.count_diversity("fallbacks")
+            if result not in COPY_RETRY:
+                outputs[g] = (seq, result, output)
+                if records is not None and n in batch_records:
+                    records[g] = batch_records[n]
+                if attempt and metrics and result in ("ok", "duplicate"):
+                    metrics.count_diversity("combined_decoded" if attempt >= copies else "fallback_decoded")
+                continue
+            if outputs[g] is None:
+                outputs[g] = (seq, result, output)
+            if attempt + 1 < len(datagrams):
+                failed.append(g)
+        pending = failed
+        attempt += 1
+    return outputs
+
+
+def combiner_batch(groups, metrics=None, store=None):
+    records = {} if store else None
+    if metrics:
+        metrics.count_diversity("frames", len(groups))
+        metrics.count_diversity("copies", sum(copies for _, copies in groups))
+    for _, _, output in decode_copies(groups, metrics, records):
+        if output:
+            print(output)
+    if store:
+        store.put(list(records.values()))
+
+
+class ReorderBuffer():
+    """Releases decoder outputs in frame sequence order.
+
+    Outputs without a sequence number, and late ones whose successors were
+    already released, pass straight through. A gap left by a lost frame is
+    skipped once `window` outputs are waiting or the oldest has waited for
+    `timeout` seconds; the first sequence number is picked the same way.
+    A sequence number far behind the current one (receiver restart)
+    starts over.
+    """
+    def __init__(self, window=REORDER_WINDOW, timeout=REORDER_TIMEOUT):
+        self.window = window
+        self.timeout = timeout
+        self.heap = []
+        self.next_seq = None
+        self.count = 0
+
+    def push(self, seq, output, now):
+        if seq is None:
+            return [output]
+        ready = []
+        if self.next_seq is not None and seq < self.next_seq:
+            if self.next_seq - seq <= self.window:
+                return [output]
+            ready = self.flush()
+        heapq.heappush(self.heap, (seq, self.count, now, output))
+        self.count += 1
+        return ready + self.release(now)
+
+    def release(self, now):
+        ready = []
+        while self.heap:
+            seq, _, arrival, output = self.heap[0]
+            if self.next_seq is not None and seq <= self.next_seq:
+                heapq.heappop(self.heap)
+                ready.append(output)
+                self.next_seq = max(self.next_seq, seq + 1)
+            elif len(self.heap) > self.window or now - arrival >= self.timeout:
+                # Give up on the missing frames
+                self.next_seq = seq
+            else:
+                break
+        return ready
+
+    def flush(self):
+        ready = [output for _, _, _, output in sorted(self.heap)]
+        self.heap = []
+        self.next_seq = None
+        return ready
+
+
+def bind_socket(ip, port, reuseport=False):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind(("0.0.0.0", 52001))
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((ip, port))
+    return sock
+
+
+def decode_settings(args):
+    # The command line options of the decode stage, plain values a worker process can be started with
+    return {"keyring": args.keyring, "key_select": args.key_select, "erasures": args.erasures,
+            "interleave": args.interleave, "decode_threads": args.decode_threads, "quiet": args.quiet,
+            "frame_cache": args.frame_cache, "frame_cache_ttl": args.frame_cache_ttl}
+
+
+def configure(settings):
+    """Set up decoding from decode_settings(), in the main process and in every worker.
+
+    Raises OSError or ValueError if the keyring cannot be loaded.
+    """
+    global keyring, key_select, rs_erasures, rs_interleave, decode_threads, print_payloads, frame_cache
+    if settings["keyring"]:
+        keyring = Keyring.load(settings["keyring"])
+    key_select = settings["key_select"]
+    rs_erasures = settings["erasures"]
+    rs_interleave = settings["interleave"]
+    decode_threads = max(1, settings["decode_threads"])
+    print_payloads = not settings["quiet"]
+    # Every worker process gets its own cache
+    frame_cache = FrameCache(settings["frame_cache"], settings["frame_cache_ttl"]) if settings["frame_cache"] else None
+
+
+def decode_worker(jobs, results, settings, ip=None, port=None, shm=None, consumer=0, consumers=1,
+                  with_metrics=False, with_store=False):
+    # The parent process handles Ctrl-C and tears the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Nothing is inherited with the spawn start method, set up from the settings passed
+    configure(settings)
+    metrics = DecoderMetrics() if with_metrics else None
+
+    def decode(messages):
+        # Metrics and frame records of this batch travel with its outputs
+        records = {} if with_store else None
+        outputs = decode_messages(messages, metrics, records)
+        results.put((outputs, metrics.take() if metrics else None,
+                     list(records.values()) if with_store else None))
+
+    if shm is not None:
+        # Every worker maps the ring itself and takes every consumers-th frame
+        ring = ShmRingReader(shm, consumer, consumers)
+        while 1:
+            decode(ring.read_batch(MAX_BATCH))
+    elif port is not None:
+        # Own socket, the kernel spreads datagrams over the workers by flow hash
+        ingest = SocketIngest(bind_socket(ip, port, reuseport=True), MAX_DATAGRAM_LEN)
+        while 1:
+            decode(ingest.read_batch())
+    else:
+        for messages in iter(jobs.get, None):
+            decode(messages)
+
+
+def output_stage(results, ordered, window=REORDER_WINDOW, timeout=REORDER_TIMEOUT, metrics=None, store=None):
+    reorder = ReorderBuffer(window, timeout) if ordered else None
+    while 1:
+        try:
+            outputs, delta, records = results.get(timeout=timeout / 2)
+            if delta and metrics:
+                metrics.merge(delta)
+            if store:
+                store.put(records)
+        except queue.Empty:
+            outputs = None
+        if outputs is None and reorder is None:
+            continue
+
+        now = time.monotonic()
+        ready = []
+        for seq, _, output in outputs or []:
+            ready += reorder.push(seq, output, now) if reorder else [output]
+        if reorder:
+            ready += reorder.release(now)
+        for output in ready:
+            if output:
+                print(output)
+
+
+class StatsReporter():
+    def __init__(self, ingest, interval):
+        self.ingest = ingest
+        self.interval = interval
+        self.next = time.monotonic() + interval
+
+    def poll(self):
+        if self.interval <= 0 or time.monotonic() < self.next:
+            return
+        self.next += self.interval
+        print(self.ingest.format_stats(), file=sys.stderr)
+
+
+def open_ingest(args):
+    if args.shm:
+        return ShmIngest(args.shm, args.max_batch).start()
+    return SocketIngest(bind_socket(args.ip, args.port), MAX_DATAGRAM_LEN, args.max_batch).start()
+
+
+def open_metrics(args, ingest=None):
+    # None unless an exporter was asked for, which keeps instrumentation off
+    if not args.metrics_port and not args.metrics_json:
+        return None
+    metrics = DecoderMetrics()
+    if ingest:
+        metrics.gauges = lambda: {f"ingest_{key}": value for key, value in ingest.stats().items()}
+    if args.metrics_port:
+        MetricsServer(metrics, args.metrics_port).start()
+    if args.metrics_json:
+        JsonFlusher(metrics, args.metrics_json, args.metrics_interval).start()
+    return metrics
+
+
+def open_store(args):
+    if not args.store:
+        return None
+    return FrameStoreWriter(FrameStore(args.store, args.segment_size * 1024 * 1024)).start()
+
+
+def serve_inline(args, store=None):
+    ingest = open_ingest(args)
+    stats = StatsReporter(ingest, args.stats_interval)
+    metrics = open_metrics(args, ingest)
 
     while 1:
-        data, addr = sock.recvfrom(4144)
-        decoder(data)
+        batch = ingest.get(timeout=1.0)
+        if batch:
+            decoder_batch(batch, metrics, store)
+        stats.poll()
+
+
+def serve_combined(args, store=None):
+    # One ingest per receiver, all feeding one queue with the receiver index
+    batches = queue.Queue(maxsize=QUEUE_LEN)
+    if args.combine_shm:
+        ingests = [ShmIngest(name, args.max_batch, batches=batches, source=k).start()
+                   for k, name in enumerate(args.combine_shm)]
+    else:
+        ingests = [SocketIngest(bind_socket(args.ip, port), MAX_DATAGRAM_LEN, args.max_batch,
+                                batches=batches, source=k).start()
+                   for k, port in enumerate(args.combine_ports)]
+    reporters = [StatsReporter(ingest, args.stats_interval) for ingest in ingests]
+    metrics = open_metrics(args)
+    combiner = DiversityCombiner(len(ingests), args.combine_window)
+
+    while 1:
+        # Wake up for the next group running out of time
+        deadline = combiner.next_deadline()
+        timeout = 1.0 if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            source, batch = batches.get(timeout=timeout)
+        except queue.Empty:
+            batch = None
+        now = time.monotonic()
+        for datagram in batch or []:
+            combiner.push(source, datagram, now)
+        groups = combiner.pop_ready(now)
+        if groups:
+            combiner_batch(groups, metrics, store)
+        for reporter in reporters:
+            reporter.poll()
+
+
+def serve_workers(args, store=None):
+    jobs = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=decode_worker, daemon=True,
+                                       args=(jobs, results, decode_settings(args), args.ip,
+                                             args.port if args.reuseport else None,
+                                             args.shm, k, args.workers, bool(args.metrics_port or args.metrics_json),
+                                             store is not None))
+               for k in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
+    # Started after forking the workers
+    ingest = None if args.reuseport or args.shm else open_ingest(args)
+    metrics = open_metrics(args, ingest)
+    threading.Thread(target=output_stage, daemon=True,
+                     args=(results, args.ordered, args.reorder_window, args.reorder_timeout, metrics, store)).start()
+
+    try:
+        if ingest is None:
+            for worker in workers:
+                worker.join()
+        else:
+            # Dispatcher, workers take frames from the shared queue as they become free
+            stats = StatsReporter(ingest, args.stats_interval)
+            while 1:
+                batch = ingest.get(timeout=1.0)
+                if batch:
+                    # Split a burst so every worker gets a share
+                    step = -(-len(batch) // args.workers)
+                    for i in range(0, len(batch), step):
+                        jobs.put(batch[i:i + step])
+                stats.poll()
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+def main():
+    parser = ArgumentParser(description="SDRP PDU decoder")
+    parser.add_argument("--ip", type=str, default=UDP_IP, help="Address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=UDP_PORT, help="UDP port to listen on (default: %(default)s)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Number of decoder processes, 0 decodes inline in the receiving process (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--reuseport",
+        action="store_true",
+        help="Workers bind their own SO_REUSEPORT socket instead of reading from a dispatcher. "
+             "The kernel balances by sender address, so this only spreads load over several senders"
+    )
+    parser.add_argument(
+        "--shm",
+        type=str,
+        default=None,
+        help="Read frames from the shared-memory ring NAME (in /dev/shm) written by the receiver instead of UDP. "
+             "With --workers every worker reads its share of the ring directly"
+    )
+    parser.add_argument("--combine-ports", type=str, default=None, metavar="PORT,PORT,...",
+                        help="Diversity combining: one UDP port per receiver, copies of the same frame are "
+                             "grouped and decoded best first, one output per frame")
+    parser.add_argument("--combine-shm", type=str, default=None, metavar="NAME,NAME,...",
+                        help="Diversity combining from one shared-memory ring per receiver")
+    parser.add_argument("--combine-window", type=float, default=COMBINE_WINDOW, metavar="SECONDS",
+                        help="Seconds to wait for the copies of the other receivers (default: %(default)s)")
+    parser.add_argument("--ordered", action="store_true", help="Print worker results in frame sequence order")
+    parser.add_argument("--reorder-window", type=int, default=REORDER_WINDOW,
+                        help="Frames held back waiting for a missing one (default: %(default)s)")
+    parser.add_argument("--reorder-timeout", type=float, default=REORDER_TIMEOUT,
+                        help="Seconds a frame is held back waiting for a missing one (default: %(default)s)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH,
+                        help="Datagrams drained from the socket per wake-up (default: %(default)s)")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="Print ingest queue depth and drop counters every N seconds, 0 disables")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Serve per-stage timings and decode counters as Prometheus text on "
+                             "http://127.0.0.1:PORT/metrics, 0 disables")
+    parser.add_argument("--metrics-json", type=str, default=None,
+                        help="Periodically write the same metrics as JSON to this file")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL,
+                        help="Seconds between --metrics-json updates (default: %(default)s)")
+    parser.add_argument("--keyring", type=str, default=None,
+                        help="File of \"<key id> <key>\" lines, replaces the built-in key")
+    parser.add_argument("--key-select", choices=[KEY_SELECT_CSP_SRC, KEY_SELECT_CONTROL], default=KEY_SELECT_CSP_SRC,
+                        help="Frame field holding the key ID: CSP source address or first control header byte "
+                             "(default: %(default)s)")
+    parser.add_argument("--erasures", action="store_true",
+                        help="Retry frames Reed-Solomon cannot decode with the least reliable bytes "
+                             "(from the Viterbi metrics or soft symbols) marked as erasures")
+    parser.add_argument("--interleave", type=int, default=1, choices=range(1, RS_MAX_DEPTH + 1), metavar="I",
+                        help="Reed-Solomon interleaving depth of the frames, 1 to %d (default: %%(default)s)" % RS_MAX_DEPTH)
+    parser.add_argument("--decode-threads", type=int, default=1,
+                        help="Threads decoding every batch, each with its own Viterbi decoder (default: %(default)s)")
+    parser.add_argument("--store", type=str, default=None, metavar="DIR",
+                        help="Append every frame that passed Reed-Solomon to the indexed frame store in DIR, "
+                             "see frame_store.py")
+    parser.add_argument("--segment-size", type=int, default=SEGMENT_SIZE // (1024 * 1024), metavar="MB",
+                        help="Start a new store segment once one reaches this size (default: %(default)s)")
+    parser.add_argument("--frame-cache", type=int, default=0, metavar="N",
+                        help="Keep the results of the last N frames and skip decoding frames with the same bits, "
+                             "printing them once, 0 disables (default: %(default)s). With --workers every worker "
+                             "has its own cache and copies of a frame rarely reach the same one")
+    parser.add_argument("--frame-cache-ttl", type=float, default=FRAME_CACHE_TTL, metavar="SECONDS",
+                        help="Forget cached frames after this many seconds, so repeated beacons are printed "
+                             "again, 0 keeps them until evicted (default: %(default)s)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Do not print the hexdump of every decrypted payload, errors are still printed")
+    args = parser.parse_args()
+    if args.shm and args.reuseport:
+        parser.error("--reuseport and --shm are mutually exclusive")
+    if args.combine_ports and args.combine_shm:
+        parser.error("--combine-ports and --combine-shm are mutually exclusive")
+    if args.combine_ports or args.combine_shm:
+        if args.workers or args.reuseport or args.shm:
+            parser.error("diversity combining decodes inline, without --workers, --reuseport or --shm")
+        if args.combine_window < 0:
+            parser.error("--combine-window must not be negative")
+        if args.combine_ports:
+            try:
+                args.combine_ports = [int(port) for port in args.combine_ports.split(",")]
+            except ValueError:
+                parser.error("--combine-ports takes port numbers separated by commas")
+        else:
+            args.combine_shm = args.combine_shm.split(",")
+
+    if args.frame_cache < 0 or args.frame_cache_ttl < 0:
+        parser.error("--frame-cache and --frame-cache-ttl must not be negative")
+    # Workers set themselves up the same way, loading the keyring here first catches its errors
+    try:
+        configure(decode_settings(args))
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot load keyring: {e}")
+    if args.segment_size <= 0:
+        parser.error("--segment-size must be positive")
+
+    try:
+        store = open_store(args)
+    except OSError as e:
+        parser.error(f"cannot open frame store: {e}")
+    try:
+        if args.combine_ports or args.combine_shm:
+            serve_combined(args, store)
+        elif args.workers > 0:
+            serve_workers(args, store)
+        else:
+            serve_inline(args, store)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if store:
+            store.close()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
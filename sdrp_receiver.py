@@ -9,9 +9,6 @@
 
 """
 
-from PyQt5 import Qt
-from gnuradio import qtgui
-from PyQt5 import QtCore
 from gnuradio import analog
 from gnuradio import blocks
 from gnuradio import digital
@@ -20,15 +17,19 @@ from gnuradio.filter import firdes
 from gnuradio import iio
 from gnuradio import uhd
 import pmt
-import sip
 import threading
 from gnuradio import gr
 from gnuradio.filter import firdes
 from gnuradio.fft import window
 import sys
 import signal
+import time
+from fractions import Fraction
 from argparse import ArgumentParser
-from tag_to_pdu_blk import tag_to_pdu_udp_bb
+from frame_sync_blk import frame_sync_udp_b
+from pdu_format import SLIP_MARGIN
+from iq_file_source import IqRecording, iq_file_source_c
+from rx_monitor import SnapshotMonitor, SNAPSHOT_LEN, MONITOR_INTERVAL, keep_one_in
 
 
 
@@ -37,9 +38,17 @@ LO_FREQ = 2.23e9
 SAMPLE_RATE = 1000000
 BW = 250000
 SPS = 8
+# Symbols per second of the downlink
+SYMBOL_RATE = SAMPLE_RATE // SPS
+# Samples per symbol the loops may run at after the front-end
+MIN_SPS = 2
+# Front-end low-pass transition width, Hz
+LPF_TRANSITION = 50000
 TED_GAIN = 0.02
 ASM_bin = '1011100111111000101100100010000010110001110011110001001010111100'
 ASM_thr = 8
+# Soft symbol quantization, int8 counts per unit of differentially decoded symbol energy
+SOFT_SCALE = 64
 # To tune
 RF_GAIN = 45
 SYNC_LOOP = 0.02
@@ -48,56 +57,220 @@ COSTAS_LOOP = 0.025
 
 # PDU and UDP client config
 PDU_LEN = 4144  #(RS_BLOCK_LENGTH + RAW_ASM_BYTE_LEN)*VITERBI_RATE*8
+# Added for every further interleaved RS codeword
+PDU_LEN_PER_CODEWORD = 4080  #RS_BLOCK_LENGTH*VITERBI_RATE*8
+# Shortened frames, with the Viterbi tail
+PDU_LEN_LONG = 2064  #(RAW_ASM_BYTE_LEN + LONG_FRAME_DATA_LEN + RS_LENGTH + VITERBI_TAIL)*VITERBI_RATE*8
+PDU_LEN_SHORT = 1088  #(RAW_ASM_BYTE_LEN + SHORT_FRAME_DATA_LEN + RS_LENGTH + VITERBI_TAIL)*VITERBI_RATE*8
 UDP_IP = '127.0.0.1'
 UDP_PORT = 52001
 
 
-class sdrp_receiver(gr.top_block, Qt.QWidget):
+def front_end(samp_rate, bwidth, sps):
+    """Interpolation, decimation and taps of the resampler taking samp_rate
+    down to sps samples per symbol.
+
+    The low-pass follows the receiver bandwidth like the original filter,
+    narrowed when needed so its transition band stays clear of what folds
+    back onto the passband after decimation.
+    """
+    ratio = Fraction(SYMBOL_RATE * sps, int(samp_rate))
+    interp, decim = ratio.numerator, ratio.denominator
+    out_rate = SYMBOL_RATE * sps
+    cutoff = min(bwidth*1.2, (out_rate - LPF_TRANSITION) / 2)
+    # The taps run at the interpolated rate, with the interpolation gain
+    taps = firdes.low_pass(interp, samp_rate*interp, cutoff, LPF_TRANSITION, window.WIN_HAMMING, 0.35)
+    return interp, decim, taps
+
+
+def source_defaults(source):
+    # RF gain, symbol sync and Costas loop bandwidths tuned for each source
+    if source.lower() == "usrp":
+        return 30, 0.008, 0.01
+    return 45, 0.02, 0.025
+
+
+def frame_codes(interleave=1, short_frames=False):
+    # Access codes to look for, with the PDU length of their frames
+    pdu_len = PDU_LEN + (interleave - 1)*PDU_LEN_PER_CODEWORD
+    if short_frames:
+        # All kinds share the ASM, the short and long prefixes go out early for the decoder to try
+        return {ASM_bin: (PDU_LEN_SHORT, PDU_LEN_LONG, pdu_len)}
+    return {ASM_bin: pdu_len}
+
+
+def rx_source(tb, source, samp_rate, freq, bw, rf_gain, recording=None, throttle=False):
+    """Creates the source blocks of tb as tb.source and what follows it.
+
+    Returns the block whose output carries the complex samples.
+    """
+    if source.lower() == "usrp":
+        tb.source = uhd.usrp_source(
+            ",".join(("", '')),
+            uhd.stream_args(
+                cpu_format="sc16",
+                args='',
+                channels=list(range(0,1)),
+            ),
+        )
+        tb.source.set_samp_rate(samp_rate)
+        tb.source.set_center_freq(freq, 0)
+        tb.source.set_antenna("RX2", 0)
+        tb.source.set_bandwidth(bw, 0)
+        tb.source.set_gain(rf_gain, 0)
+        tb.source.set_auto_dc_offset(True, 0)
+        tb.source.set_auto_iq_balance(True, 0)
+        tb.blocks_interleaved_short_to_complex_0 = blocks.interleaved_short_to_complex(True, False,2047)
+        tb.connect((tb.source, 0), (tb.blocks_interleaved_short_to_complex_0, 0))
+        return tb.blocks_interleaved_short_to_complex_0
+    elif source.lower() == "file":
+        # Recorded IQ, at the real sample rate with throttle or as fast as the chain runs
+        tb.source = iq_file_source_c(recording)
+        if throttle:
+            tb.blocks_throttle_0 = blocks.throttle(gr.sizeof_gr_complex*1, samp_rate, True)
+            tb.connect((tb.source, 0), (tb.blocks_throttle_0, 0))
+            return tb.blocks_throttle_0
+        return tb.source
+    else:
+        tb.source = iio.fmcomms2_source_fc32('' if '' else iio.get_pluto_uri(), [True, True], 32768)
+        tb.source.set_len_tag_key('packet_len')
+        tb.source.set_frequency(freq)
+        tb.source.set_samplerate(samp_rate)
+        tb.source.set_gain_mode(0, 'manual')
+        tb.source.set_gain(0, rf_gain)
+        tb.source.set_quadrature(True)
+        tb.source.set_rfdc(True)
+        tb.source.set_bbdc(True)
+        tb.source.set_filter_params('Auto', '', 0, 0)
+        return tb.source
+
+
+class bpsk_channel(gr.hier_block2):
+    """The demodulator chain from complex samples at samp_rate to the frame sync.
+
+    Front-end resampler, IQ correction, Costas loop, symbol sync, slicer,
+    differential decoder and, with soft, the soft symbol path, ending at a
+    frame_sync_udp_b that sends to udp_port or to the ring shm_name. With
+    taps the filtered samples and the symbols come out on outputs 0 and 1,
+    for the monitor and the GUI sinks.
+    """
+
+    def __init__(self, freq, codes, udp_port=UDP_PORT, shm_name=None, packed_pdu=True, soft=False, sps=SPS,
+                 samp_rate=SAMPLE_RATE, bwidth=BW, sync_loop=SYNC_LOOP, costas_loop=COSTAS_LOOP, taps=False):
+        gr.hier_block2.__init__(
+            self, "bpsk_channel",
+            gr.io_signature(1, 1, gr.sizeof_gr_complex*1),
+            gr.io_signature(2, 2, gr.sizeof_gr_complex*1) if taps else gr.io_signature(0, 0, 0)
+        )
+        self.freq = freq
+        # Where the frames go, the ring if named
+        self.udp_port = udp_port
+        self.shm_name = shm_name
+        # The loops run at sps samples per symbol, chain_rate samples per second
+        self.sps = sps
+        self.chain_rate = chain_rate = SYMBOL_RATE * sps
+        # Per sample loop bandwidths are tuned at SPS, scaled to keep the same bandwidth in Hz
+        self.loop_scale = SPS / sps
 
-    def __init__(self, source="pluto"):
-        gr.top_block.__init__(self, "Not titled yet", catch_exceptions=True)
-        Qt.QWidget.__init__(self)
-        self.setWindowTitle("Not titled yet")
-        qtgui.util.check_set_qss()
-        try:
-            self.setWindowIcon(Qt.QIcon.fromTheme('gnuradio-grc'))
-        except BaseException as exc:
-            print(f"Qt GUI: Could not set Icon: {str(exc)}", file=sys.stderr)
-        self.top_scroll_layout = Qt.QVBoxLayout()
-        self.setLayout(self.top_scroll_layout)
-        self.top_scroll = Qt.QScrollArea()
-        self.top_scroll.setFrameStyle(Qt.QFrame.NoFrame)
-        self.top_scroll_layout.addWidget(self.top_scroll)
-        self.top_scroll.setWidgetResizable(True)
-        self.top_widget = Qt.QWidget()
-        self.top_scroll.setWidget(self.top_widget)
-        self.top_layout = Qt.QVBoxLayout(self.top_widget)
-        self.top_grid_layout = Qt.QGridLayout()
-        self.top_layout.addLayout(self.top_grid_layout)
-
-        self.settings = Qt.QSettings("gnuradio/flowgraphs", "pluto")
+        ##################################################
+        # Blocks
+        ##################################################
 
-        try:
-            geometry = self.settings.value("geometry")
-            if geometry:
-                self.restoreGeometry(geometry)
-        except BaseException as exc:
-            print(f"Qt GUI: Could not restore geometry: {str(exc)}", file=sys.stderr)
+        # Polyphase low-pass and resampler down to sps samples per symbol
+        interp, decim, taps_lpf = front_end(samp_rate, bwidth, sps)
+        self.rational_resampler_xxx_0 = filter.rational_resampler_ccf(
+            interpolation=interp,
+            decimation=decim,
+            taps=taps_lpf,
+            fractional_bw=0)
+        self.blocks_correctiq_auto_0_0_0 = blocks.correctiq_auto(chain_rate, freq, 1.5, 2)
+        self.digital_costas_loop_cc_0_0 = digital.costas_loop_cc(costas_loop*self.loop_scale, 2, False)
+        self.digital_symbol_sync_xx_0_0 = digital.symbol_sync_cc(
+            digital.TED_MUELLER_AND_MULLER,
+            sps,
+            sync_loop,
+            1.0,
+            0.1,
+            1.5,
+            1,
+            digital.constellation_bpsk().base(),
+            digital.IR_MMSE_8TAP,
+            128,
+            [])
+        self.blocks_complex_to_float_0 = blocks.complex_to_float(1)
+        self.digital_binary_slicer_fb_0 = digital.binary_slicer_fb()
+        self.digital_diff_decoder_bb_0 = digital.diff_decoder_bb(2, digital.DIFF_DIFFERENTIAL)
+        # Finds the access codes and sends the frames, with the number of wrong code bits as sync quality
+        self.frame_sync = frame_sync_udp_b(
+            codes,
+            threshold=ASM_thr,
+            udp_ip=UDP_IP,
+            udp_port=udp_port,
+            packed=packed_pdu,
+            soft=soft,
+            shm_name=shm_name,
+            # Context around every frame for the decoder to realign slipped frames
+            margin=SLIP_MARGIN if packed_pdu else 0
+        )
+        if soft:
+            # Soft differential decoding: bit is one when consecutive symbols change sign,
+            # so -x[k]*x[k-1] is the soft counterpart of diff_decoder_bb
+            self.blocks_delay_soft = blocks.delay(gr.sizeof_float*1, 1)
+            self.blocks_multiply_soft = blocks.multiply_vff(1)
+            self.blocks_float_to_char_soft = blocks.float_to_char(1, -SOFT_SCALE)
+
+        ##################################################
+        # Connections
+        ##################################################
+        self.connect((self, 0), (self.rational_resampler_xxx_0, 0))
+        self.connect((self.rational_resampler_xxx_0, 0), (self.blocks_correctiq_auto_0_0_0, 0))
+        self.connect((self.blocks_correctiq_auto_0_0_0, 0), (self.digital_costas_loop_cc_0_0, 0))
+        self.connect((self.digital_costas_loop_cc_0_0, 0), (self.digital_symbol_sync_xx_0_0, 0))
+        self.connect((self.digital_symbol_sync_xx_0_0, 0), (self.blocks_complex_to_float_0, 0))
+        self.connect((self.blocks_complex_to_float_0, 0), (self.digital_binary_slicer_fb_0, 0))
+        self.connect((self.digital_binary_slicer_fb_0, 0), (self.digital_diff_decoder_bb_0, 0))
+        self.connect((self.digital_diff_decoder_bb_0, 0), (self.frame_sync, 0))
+        if soft:
+            self.connect((self.blocks_complex_to_float_0, 0), (self.blocks_delay_soft, 0))
+            self.connect((self.blocks_complex_to_float_0, 0), (self.blocks_multiply_soft, 0))
+            self.connect((self.blocks_delay_soft, 0), (self.blocks_multiply_soft, 1))
+            self.connect((self.blocks_multiply_soft, 0), (self.blocks_float_to_char_soft, 0))
+            self.connect((self.blocks_float_to_char_soft, 0), (self.frame_sync, 1))
+        if taps:
+            self.connect((self.rational_resampler_xxx_0, 0), (self, 0))
+            self.connect((self.digital_symbol_sync_xx_0_0, 0), (self, 1))
+
+    def set_front_end(self, samp_rate, bwidth):
+        self.rational_resampler_xxx_0.set_taps(front_end(samp_rate, bwidth, self.sps)[2])
+
+    def set_freq(self, freq):
+        self.freq = freq
+        self.blocks_correctiq_auto_0_0_0.set_freq(freq)
+
+    def set_sync_loop(self, sync_loop):
+        self.digital_symbol_sync_xx_0_0.set_loop_bandwidth(sync_loop)
+
+    def set_costas_loop(self, costas_loop):
+        self.digital_costas_loop_cc_0_0.set_loop_bandwidth(costas_loop*self.loop_scale)
+
+
+class sdrp_receiver(gr.top_block):
+    # The DSP chain alone, without Qt. sdrp_receiver_gui adds the widgets and sinks on the chain's taps.
+
+    def __init__(self, source="pluto", packed_pdu=True, soft=False, shm_name=None, interleave=1, short_frames=False,
+                 monitor=None, monitor_interval=MONITOR_INTERVAL, recording=None, throttle=False, sps=SPS,
+                 taps=False):
+        gr.top_block.__init__(self, "Not titled yet", catch_exceptions=True)
         self.flowgraph_started = threading.Event()
+        # Snapshot file path, see rx_monitor
+        self.monitor = monitor
+        self.monitor_interval = monitor_interval
 
         ##################################################
         # Variables
         ##################################################
-        if source.lower() == "usrp":
-            #self.SOURCE = SOURCE_USRP
-            RF_GAIN = 30
-            SYNC_LOOP = 0.008
-            COSTAS_LOOP = 0.01
-        else:
-            RF_GAIN = 45
-            SYNC_LOOP = 0.02
-            COSTAS_LOOP = 0.025
-            
+        RF_GAIN, SYNC_LOOP, COSTAS_LOOP = source_defaults(source)
+
         self.bw = bw = BW
         self.variable_tag_object_0 = variable_tag_object_0 = gr.tag_utils.python_to_tag((0, pmt.intern("key"), pmt.intern("value"), pmt.intern("src")))
         self.sync_loop = sync_loop = SYNC_LOOP
@@ -112,218 +285,42 @@ class sdrp_receiver(gr.top_block, Qt.QWidget):
         self.bpsk_o = bpsk_o = digital.constellation_bpsk().base()
         # self.bpsk_o.set_npwr(1.0)
         self.TED_gain = TED_gain = TED_GAIN
+        self.sps = sps
+        self.chain_rate = chain_rate = SYMBOL_RATE * sps
 
         ##################################################
         # Blocks
         ##################################################
 
-        self._sync_loop_range = qtgui.Range(0.001, 0.05, 0.001, sync_loop, 200)
-        self._sync_loop_win = qtgui.RangeWidget(self._sync_loop_range, self.set_sync_loop, "'sync_loop'", "counter_slider", float, QtCore.Qt.Horizontal)
-        self.top_layout.addWidget(self._sync_loop_win)
-        self._rf_gain_range = qtgui.Range(0, 150, 10, rf_gain, 200)
-        self._rf_gain_win = qtgui.RangeWidget(self._rf_gain_range, self.set_rf_gain, "'rf_gain'", "counter_slider", float, QtCore.Qt.Horizontal)
-        self.top_layout.addWidget(self._rf_gain_win)
-        self._freq_range = qtgui.Range(2e9, 2.5e9, 2e3, freq, 200)
-        self._freq_win = qtgui.RangeWidget(self._freq_range, self.set_freq, "'freq'", "counter_slider", float, QtCore.Qt.Horizontal)
-        self.top_layout.addWidget(self._freq_win)
-        self._costas_loop_range = qtgui.Range(0, 0.1, 0.01, costas_loop, 200)
-        self._costas_loop_win = qtgui.RangeWidget(self._costas_loop_range, self.set_costas_loop, "'costas_loop'", "counter_slider", float, QtCore.Qt.Horizontal)
-        self.top_layout.addWidget(self._costas_loop_win)
-        self._bwidth_range = qtgui.Range(200e3, 10e6, 10000, bw, 200)
-        self._bwidth_win = qtgui.RangeWidget(self._bwidth_range, self.set_bwidth, "'bwidth'", "counter_slider", float, QtCore.Qt.Horizontal)
-        self.top_layout.addWidget(self._bwidth_win)
-        self.qtgui_waterfall_sink_x_0 = qtgui.waterfall_sink_c(
-            1024, #size
-            window.WIN_BLACKMAN_hARRIS, #wintype
-            0, #fc
-            bw, #bw
-            "", #name
-            1, #number of inputs
-            None # parent
-        )
-        self.qtgui_waterfall_sink_x_0.set_update_time(0.10)
-        self.qtgui_waterfall_sink_x_0.enable_grid(False)
-        self.qtgui_waterfall_sink_x_0.enable_axis_labels(True)
-
-
-
-        labels = ['', '', '', '', '',
-                  '', '', '', '', '']
-        colors = [0, 0, 0, 0, 0,
-                  0, 0, 0, 0, 0]
-        alphas = [1.0, 1.0, 1.0, 1.0, 1.0,
-                  1.0, 1.0, 1.0, 1.0, 1.0]
-
-        for i in range(1):
-            if len(labels[i]) == 0:
-                self.qtgui_waterfall_sink_x_0.set_line_label(i, "Data {0}".format(i))
-            else:
-                self.qtgui_waterfall_sink_x_0.set_line_label(i, labels[i])
-            self.qtgui_waterfall_sink_x_0.set_color_map(i, colors[i])
-            self.qtgui_waterfall_sink_x_0.set_line_alpha(i, alphas[i])
-
-        self.qtgui_waterfall_sink_x_0.set_intensity_range(-140, 10)
-
-        self._qtgui_waterfall_sink_x_0_win = sip.wrapinstance(self.qtgui_waterfall_sink_x_0.qwidget(), Qt.QWidget)
-
-        self.top_layout.addWidget(self._qtgui_waterfall_sink_x_0_win)
-        self.qtgui_freq_sink_x_0 = qtgui.freq_sink_c(
-            1024, #size
-            window.WIN_BLACKMAN_hARRIS, #wintype
-            0, #fc
-            samp_rate, #bw
-            "", #name
-            1,
-            None # parent
-        )
-        self.qtgui_freq_sink_x_0.set_update_time(0.10)
-        self.qtgui_freq_sink_x_0.set_y_axis((-140), 10)
-        self.qtgui_freq_sink_x_0.set_y_label('Relative Gain', 'dB')
-        self.qtgui_freq_sink_x_0.set_trigger_mode(qtgui.TRIG_MODE_FREE, 0.0, 0, "")
-        self.qtgui_freq_sink_x_0.enable_autoscale(False)
-        self.qtgui_freq_sink_x_0.enable_grid(True)
-        self.qtgui_freq_sink_x_0.set_fft_average(1.0)
-        self.qtgui_freq_sink_x_0.enable_axis_labels(True)
-        self.qtgui_freq_sink_x_0.enable_control_panel(False)
-        self.qtgui_freq_sink_x_0.set_fft_window_normalized(False)
-
-
-
-        labels = ['', '', '', '', '',
-            '', '', '', '', '']
-        widths = [1, 1, 1, 1, 1,
-            1, 1, 1, 1, 1]
-        colors = ["blue", "red", "green", "black", "cyan",
-            "magenta", "yellow", "dark red", "dark green", "dark blue"]
-        alphas = [1.0, 1.0, 1.0, 1.0, 1.0,
-            1.0, 1.0, 1.0, 1.0, 1.0]
-
-        for i in range(1):
-            if len(labels[i]) == 0:
-                self.qtgui_freq_sink_x_0.set_line_label(i, "Data {0}".format(i))
-            else:
-                self.qtgui_freq_sink_x_0.set_line_label(i, labels[i])
-            self.qtgui_freq_sink_x_0.set_line_width(i, widths[i])
-            self.qtgui_freq_sink_x_0.set_line_color(i, colors[i])
-            self.qtgui_freq_sink_x_0.set_line_alpha(i, alphas[i])
-
-        self._qtgui_freq_sink_x_0_win = sip.wrapinstance(self.qtgui_freq_sink_x_0.qwidget(), Qt.QWidget)
-        self.top_layout.addWidget(self._qtgui_freq_sink_x_0_win)
-        self.qtgui_const_sink_x_0_0 = qtgui.const_sink_c(
-            1024, #size
-            "", #name
-            1, #number of inputs
-            None # parent
-        )
-        self.qtgui_const_sink_x_0_0.set_update_time(0.10)
-        self.qtgui_const_sink_x_0_0.set_y_axis((-2), 2)
-        self.qtgui_const_sink_x_0_0.set_x_axis((-2), 2)
-        self.qtgui_const_sink_x_0_0.set_trigger_mode(qtgui.TRIG_MODE_FREE, qtgui.TRIG_SLOPE_POS, 0.0, 0, "")
-        self.qtgui_const_sink_x_0_0.enable_autoscale(False)
-        self.qtgui_const_sink_x_0_0.enable_grid(False)
-        self.qtgui_const_sink_x_0_0.enable_axis_labels(True)
-
-
-        labels = ['', '', '', '', '',
-            '', '', '', '', '']
-        widths = [1, 1, 1, 1, 1,
-            1, 1, 1, 1, 1]
-        colors = ["blue", "red", "red", "red", "red",
-            "red", "red", "red", "red", "red"]
-        styles = [0, 0, 0, 0, 0,
-            0, 0, 0, 0, 0]
-        markers = [0, 0, 0, 0, 0,
-            0, 0, 0, 0, 0]
-        alphas = [1.0, 1.0, 1.0, 1.0, 1.0,
-            1.0, 1.0, 1.0, 1.0, 1.0]
-
-        for i in range(1):
-            if len(labels[i]) == 0:
-                self.qtgui_const_sink_x_0_0.set_line_label(i, "Data {0}".format(i))
-            else:
-                self.qtgui_const_sink_x_0_0.set_line_label(i, labels[i])
-            self.qtgui_const_sink_x_0_0.set_line_width(i, widths[i])
-            self.qtgui_const_sink_x_0_0.set_line_color(i, colors[i])
-            self.qtgui_const_sink_x_0_0.set_line_style(i, styles[i])
-            self.qtgui_const_sink_x_0_0.set_line_marker(i, markers[i])
-            self.qtgui_const_sink_x_0_0.set_line_alpha(i, alphas[i])
-
-        self._qtgui_const_sink_x_0_0_win = sip.wrapinstance(self.qtgui_const_sink_x_0_0.qwidget(), Qt.QWidget)
-        self.top_layout.addWidget(self._qtgui_const_sink_x_0_0_win)
-        self.low_pass_filter_0 = filter.fir_filter_ccf(
-            1,
-            firdes.low_pass(
-                1,
-                samp_rate,
-                (bwidth*1.2),
-                50000,
-                window.WIN_HAMMING,
-                0.35))
-
         # Rx source config
-        if source.lower() == "usrp":
-            RF_GAIN = 30
-            SYNC_LOOP = 0.008
-            COSTAS_LOOP = 0.01
-            self.source = uhd.usrp_source(
-                ",".join(("", '')),
-                uhd.stream_args(
-                    cpu_format="sc16",
-                    args='',
-                    channels=list(range(0,1)),
-                ),
-            )
-            self.source.set_samp_rate(samp_rate)
-            self.source.set_center_freq(freq, 0)
-            self.source.set_antenna("RX2", 0)
-            self.source.set_bandwidth(bw, 0)
-            self.source.set_gain(rf_gain, 0)
-            self.source.set_auto_dc_offset(True, 0)
-            self.source.set_auto_iq_balance(True, 0)
-            self.blocks_interleaved_short_to_complex_0 = blocks.interleaved_short_to_complex(True, False,2047)
-        else:
-            RF_GAIN = 45
-            SYNC_LOOP = 0.02
-            COSTAS_LOOP = 0.025
-            self.source = iio.fmcomms2_source_fc32('' if '' else iio.get_pluto_uri(), [True, True], 32768)
-            self.source.set_len_tag_key('packet_len')
-            self.source.set_frequency(LO_FREQ)
-            self.source.set_samplerate(SAMPLE_RATE)
-            self.source.set_gain_mode(0, 'manual')
-            self.source.set_gain(0, rf_gain)
-            self.source.set_quadrature(True)
-            self.source.set_rfdc(True)
-            self.source.set_bbdc(True)
-            self.source.set_filter_params('Auto', '', 0, 0)
-
-        self.digital_symbol_sync_xx_0_0 = digital.symbol_sync_cc(
-            digital.TED_MUELLER_AND_MULLER,
-            SPS,
-            sync_loop,
-            1.0,
-            0.1,
-            1.5,
-            1,
-            digital.constellation_bpsk().base(),
-            digital.IR_MMSE_8TAP,
-            128,
-            [])
-        self.digital_diff_decoder_bb_0 = digital.diff_decoder_bb(2, digital.DIFF_DIFFERENTIAL)
-        self.digital_costas_loop_cc_0_0 = digital.costas_loop_cc(costas_loop, 2, False)
-        self.digital_correlate_access_code_tag_xx_0 = digital.correlate_access_code_tag_bb(ASM_bin, ASM_thr, 'ac_found')
-        self.digital_binary_slicer_fb_0 = digital.binary_slicer_fb()
-        self.blocks_correctiq_auto_0_0_0 = blocks.correctiq_auto(samp_rate, freq, 1.5, 2)
-        self.blocks_complex_to_float_0 = blocks.complex_to_float(1)
-        self._TED_gain_range = qtgui.Range(0.01, 0.1, 0.01, 0.02, 200)
-        self._TED_gain_win = qtgui.RangeWidget(self._TED_gain_range, self.set_TED_gain, "'TED_gain'", "counter_slider", float, QtCore.Qt.Horizontal)
-        self.top_layout.addWidget(self._TED_gain_win)
-        self.tag_to_pdu = tag_to_pdu_udp_bb(
-            tag_key='ac_found',
-            pdu_len=PDU_LEN,
-            # marker_len=64,
-            udp_ip=UDP_IP,
-            udp_port=UDP_PORT
+        self.source_out = rx_source(self, source, samp_rate, freq, bw, rf_gain, recording, throttle)
+
+        # Demodulator, the same chain as every channel of sdrp_multichannel
+        self.chain = bpsk_channel(
+            freq,
+            frame_codes(interleave, short_frames),
+            udp_port=UDP_PORT,
+            shm_name=shm_name,
+            packed_pdu=packed_pdu,
+            soft=soft,
+            sps=sps,
+            samp_rate=samp_rate,
+            bwidth=bwidth,
+            sync_loop=sync_loop,
+            costas_loop=costas_loop,
+            taps=bool(monitor or taps)
         )
+        self.frame_sync = self.chain.frame_sync
+        if monitor:
+            # Now and then a vector of filtered samples and of symbols for SnapshotMonitor
+            self.blocks_stream_to_vector_spectrum = blocks.stream_to_vector(gr.sizeof_gr_complex, SNAPSHOT_LEN)
+            self.blocks_keep_one_in_n_spectrum = blocks.keep_one_in_n(gr.sizeof_gr_complex*SNAPSHOT_LEN,
+                                                                      keep_one_in(chain_rate, monitor_interval))
+            self.blocks_probe_spectrum = blocks.probe_signal_vc(SNAPSHOT_LEN)
+            self.blocks_stream_to_vector_symbols = blocks.stream_to_vector(gr.sizeof_gr_complex, SNAPSHOT_LEN)
+            self.blocks_keep_one_in_n_symbols = blocks.keep_one_in_n(gr.sizeof_gr_complex*SNAPSHOT_LEN,
+                                                                     keep_one_in(SYMBOL_RATE, monitor_interval))
+            self.blocks_probe_symbols = blocks.probe_signal_vc(SNAPSHOT_LEN)
 
 
 
@@ -332,36 +329,39 @@ class sdrp_receiver(gr.top_block, Qt.QWidget):
         ##################################################
         # Connections
         ##################################################
-        if source.lower() == "usrp":
-            self.connect((self.source, 0), (self.blocks_interleaved_short_to_complex_0, 0))
-            self.connect((self.blocks_interleaved_short_to_complex_0, 0), (self.low_pass_filter_0, 0))
-        else:
-            self.connect((self.source, 0), (self.low_pass_filter_0, 0))
-        # self.connect((self.low_pass_filter_0, 0), (self.analog_pwr_squelch_xx_0, 0))
-        self.connect((self.low_pass_filter_0, 0), (self.qtgui_freq_sink_x_0, 0))
-        self.connect((self.low_pass_filter_0, 0), (self.qtgui_waterfall_sink_x_0, 0))
-        self.connect((self.low_pass_filter_0, 0), (self.blocks_correctiq_auto_0_0_0, 0))
-        self.connect((self.blocks_correctiq_auto_0_0_0, 0), (self.digital_costas_loop_cc_0_0, 0))
-        self.connect((self.digital_costas_loop_cc_0_0, 0), (self.digital_symbol_sync_xx_0_0, 0))
-        self.connect((self.digital_symbol_sync_xx_0_0, 0), (self.blocks_complex_to_float_0, 0))
-        self.connect((self.digital_symbol_sync_xx_0_0, 0), (self.qtgui_const_sink_x_0_0, 0))
-        self.connect((self.blocks_complex_to_float_0, 0), (self.digital_binary_slicer_fb_0, 0))
-        self.connect((self.digital_binary_slicer_fb_0, 0), (self.digital_diff_decoder_bb_0, 0))
-        self.connect((self.digital_diff_decoder_bb_0, 0), (self.digital_correlate_access_code_tag_xx_0, 0))
-        self.connect((self.digital_correlate_access_code_tag_xx_0, 0), (self.tag_to_pdu, 0))
-        # self.connect((self.digital_correlate_access_code_tag_xx_0, 0), (self.tag_printer, 0))
-        # self.connect((self.digital_correlate_access_code_tag_xx_0, 0), (self.pdu_printer, 0))
-
-
-
-
-    def closeEvent(self, event):
-        self.settings = Qt.QSettings("gnuradio/flowgraphs", "pluto")
-        self.settings.setValue("geometry", self.saveGeometry())
-        self.stop()
-        self.wait()
-
-        event.accept()
+        self.connect((self.source_out, 0), (self.chain, 0))
+        if monitor:
+            self.connect((self.chain, 0), (self.blocks_stream_to_vector_spectrum, 0))
+            self.connect((self.blocks_stream_to_vector_spectrum, 0), (self.blocks_keep_one_in_n_spectrum, 0))
+            self.connect((self.blocks_keep_one_in_n_spectrum, 0), (self.blocks_probe_spectrum, 0))
+            self.connect((self.chain, 1), (self.blocks_stream_to_vector_symbols, 0))
+            self.connect((self.blocks_stream_to_vector_symbols, 0), (self.blocks_keep_one_in_n_symbols, 0))
+            self.connect((self.blocks_keep_one_in_n_symbols, 0), (self.blocks_probe_symbols, 0))
+
+
+
+
+    def start_monitor(self):
+        # Once the flowgraph runs
+        if self.monitor:
+            SnapshotMonitor(self.blocks_probe_spectrum, self.blocks_probe_symbols, self.monitor, self.chain_rate,
+                            self.monitor_interval, self.frame_stats).start()
+
+    def frame_stats(self):
+        return {"asm_hits": self.frame_sync.hits, "frames_sent": self.frame_sync.counter,
+                "frames_skipped": self.frame_sync.skipped}
+
+    def file_report(self, elapsed):
+        # Summary of a recording played to the end in elapsed seconds
+        samples = self.source.pos
+        rate = samples / elapsed if elapsed > 0 else 0.0
+        stats = self.frame_stats()
+        return "\n".join([
+            f"Samples:   {samples} in {elapsed:.3f} s, {rate / 1e6:.3f} Msamples/s "
+            f"({rate / self.samp_rate:.1f}x real time)",
+            f"ASM hits:  {stats['asm_hits']}",
+            f"PDUs:      {stats['frames_sent']} sent, {stats['frames_skipped']} skipped at the start",
+        ])
 
     def get_bw(self):
         return self.bw
@@ -369,7 +369,6 @@ class sdrp_receiver(gr.top_block, Qt.QWidget):
     def set_bw(self, bw):
         self.bw = bw
         self.set_bwidth(self.bw)
-        self.qtgui_waterfall_sink_x_0.set_frequency_range(0, self.bw)
 
     def get_variable_tag_object_0(self):
         return self.variable_tag_object_0
@@ -382,15 +381,14 @@ class sdrp_receiver(gr.top_block, Qt.QWidget):
 
     def set_sync_loop(self, sync_loop):
         self.sync_loop = sync_loop
-        self.digital_symbol_sync_xx_0_0.set_loop_bandwidth(self.sync_loop)
+        self.chain.set_sync_loop(self.sync_loop)
 
     def get_samp_rate(self):
         return self.samp_rate
 
     def set_samp_rate(self, samp_rate):
         self.samp_rate = samp_rate
-        self.low_pass_filter_0.set_taps(firdes.low_pass(1, self.samp_rate, (self.bwidth*1.2), 50000, window.WIN_HAMMING, 0.35))
-        self.qtgui_freq_sink_x_0.set_frequency_range(0, self.samp_rate)
+        self.chain.set_front_end(self.samp_rate, self.bwidth)
 
     def get_rf_gain(self):
         return self.rf_gain
@@ -404,21 +402,21 @@ class sdrp_receiver(gr.top_block, Qt.QWidget):
 
     def set_freq(self, freq):
         self.freq = freq
-        self.blocks_correctiq_auto_0_0_0.set_freq(self.freq)
+        self.chain.set_freq(self.freq)
 
     def get_costas_loop(self):
         return self.costas_loop
 
     def set_costas_loop(self, costas_loop):
         self.costas_loop = costas_loop
-        self.digital_costas_loop_cc_0_0.set_loop_bandwidth(self.costas_loop)
+        self.chain.set_costas_loop(self.costas_loop)
 
     def get_bwidth(self):
         return self.bwidth
 
     def set_bwidth(self, bwidth):
         self.bwidth = bwidth
-        self.low_pass_filter_0.set_taps(firdes.low_pass(1, self.samp_rate, (self.bwidth*1.2), 50000, window.WIN_HAMMING, 0.35))
+        self.chain.set_front_end(self.samp_rate, self.bwidth)
 
     def get_bpsk_o_2(self):
         return self.bpsk_o_2
@@ -441,41 +439,181 @@ class sdrp_receiver(gr.top_block, Qt.QWidget):
 
 
 
-def main(top_block_cls=sdrp_receiver, options=None):
-
-    parser = ArgumentParser(description="SDR RX")
-    parser.add_argument(
-        "--source",
-        type=str,
-        default="pluto",
-        choices=["pluto", "usrp"],
-        help="Select SDR source (default: pluto)"
-    )
-    args = parser.parse_args()
-
-    qapp = Qt.QApplication(sys.argv)
-
-    tb = top_block_cls(source=args.source)
-
-    tb.start()
-    tb.flowgraph_started.set()
-
-    tb.show()
+def run_headless(top_block_cls, kwargs):
+    tb = top_block_cls(**kwargs)
 
     def sig_handler(sig=None, frame=None):
         tb.stop()
         tb.wait()
 
-        Qt.QApplication.quit()
+        sys.exit(0)
 
     signal.signal(signal.SIGINT, sig_handler)
     signal.signal(signal.SIGTERM, sig_handler)
 
-    timer = Qt.QTimer()
-    timer.start(500)
-    timer.timeout.connect(lambda: None)
+    start = time.perf_counter()
+    tb.start()
+    tb.flowgraph_started.set()
+    tb.start_monitor()
+
+    tb.wait()
+    # Only a file source ever finishes, once every block is done with the last sample
+    if isinstance(tb.source, iq_file_source_c):
+        print(tb.file_report(time.perf_counter() - start))
 
-    qapp.exec_()
+
+def main(top_block_cls=None, options=None):
+
+    parser = ArgumentParser(description="SDR RX")
+    parser.add_argument(
+        "--source",
+        type=str,
+        default="pluto",
+        choices=["pluto", "usrp", "file"],
+        help="Select SDR source, or a recording with --file (default: pluto)"
+    )
+    parser.add_argument(
+        "--file",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="IQ recording for --source file: raw cf32, or SigMF (.sigmf-meta/.sigmf-data, cf32_le or ci16_le)"
+    )
+    parser.add_argument(
+        "--throttle",
+        action="store_true",
+        help="Play the recording at its real sample rate instead of as fast as possible"
+    )
+    parser.add_argument(
+        "--legacy-pdu",
+        action="store_true",
+        help="Send PDUs as one bit per byte instead of the packed format with header"
+    )
+    parser.add_argument(
+        "--soft",
+        action="store_true",
+        help="Send 8-bit soft symbols for soft-decision Viterbi decoding"
+    )
+    parser.add_argument(
+        "--shm",
+        type=str,
+        default=None,
+        help="Write PDUs to the shared-memory ring NAME (in /dev/shm) instead of UDP, for a decoder on the same host"
+    )
+    parser.add_argument(
+        "--interleave",
+        type=int,
+        default=1,
+        choices=range(1, 9),
+        metavar="I",
+        help="Reed-Solomon interleaving depth of the frames, 1 to 8, sets the PDU length (default: 1)"
+    )
+    parser.add_argument(
+        "--short-frames",
+        action="store_true",
+        help="Also send the bits of a short and a long frame after every ASM as soon as they are in, "
+             "for the decoder to try the shortened frame kinds early"
+    )
+    parser.add_argument(
+        "--sps",
+        type=int,
+        default=SPS,
+        choices=range(MIN_SPS, SPS + 1),
+        metavar="N",
+        help=f"Samples per symbol after the decimating front-end, {MIN_SPS} to {SPS}, "
+             f"lower takes less CPU (default: {SPS}, no decimation)"
+    )
+    parser.add_argument(
+        "--channels",
+        type=int,
+        default=1,
+        metavar="N",
+        help=f"Capture N * {SAMPLE_RATE/1e6:g} MHz and demodulate up to N channels {SAMPLE_RATE/1e6:g} MHz apart, "
+             f"channel k sending to UDP port {UDP_PORT} + k or to the ring NAME-k (headless only, default: 1)"
+    )
+    parser.add_argument(
+        "--channel-select",
+        type=str,
+        default=None,
+        metavar="K,K,...",
+        help="Channels to demodulate with --channels, 0 at the centre frequency (default: all)"
+    )
+    parser.add_argument(
+        "--pin-cores",
+        action="store_true",
+        help="With --channels, pin the chain of every channel to its own CPU core"
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Run the DSP chain without the Qt GUI and sinks, Qt is not even imported"
+    )
+    parser.add_argument(
+        "--monitor",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Rewrite FILE with a JSON spectrum and constellation snapshot every --monitor-interval seconds"
+    )
+    parser.add_argument(
+        "--monitor-interval",
+        type=float,
+        default=MONITOR_INTERVAL,
+        metavar="SECONDS",
+        help=f"Seconds between monitor snapshots (default: {MONITOR_INTERVAL:g})"
+    )
+    args = parser.parse_args()
+    if args.soft and args.legacy_pdu:
+        parser.error("--soft needs the packed PDU format")
+    if args.short_frames and args.legacy_pdu:
+        parser.error("--short-frames needs the packed PDU format")
+    if args.monitor_interval <= 0:
+        parser.error("--monitor-interval must be positive")
+    if args.channels < 1:
+        parser.error("--channels must be at least 1")
+    select = None
+    if args.channels > 1:
+        if not args.headless:
+            parser.error("--channels needs --headless")
+        if args.monitor:
+            parser.error("--monitor is not supported with --channels")
+        if args.channel_select:
+            try:
+                select = [int(k) for k in args.channel_select.split(",")]
+            except ValueError:
+                parser.error("--channel-select takes channel numbers separated by commas")
+            if any(k < 0 or k >= args.channels for k in select):
+                parser.error(f"--channel-select channels must be 0 to {args.channels - 1}")
+    elif args.channel_select or args.pin_cores:
+        parser.error("--channel-select and --pin-cores need --channels")
+    samp_rate = SAMPLE_RATE * args.channels
+    recording = None
+    if args.source == "file":
+        if not args.file:
+            parser.error("--source file needs --file")
+        try:
+            recording = IqRecording(args.file)
+        except (OSError, ValueError) as e:
+            parser.error(f"Cannot read {args.file}: {e}")
+        if recording.sample_rate and recording.sample_rate != samp_rate:
+            parser.error(f"{args.file} is recorded at {recording.sample_rate:g} samples/s, "
+                         f"the receiver runs at {samp_rate:g}")
+
+    kwargs = dict(source=args.source, packed_pdu=not args.legacy_pdu, soft=args.soft, shm_name=args.shm,
+                  interleave=args.interleave, short_frames=args.short_frames,
+                  monitor=args.monitor, monitor_interval=args.monitor_interval,
+                  recording=recording, throttle=args.throttle, sps=args.sps)
+    if args.channels > 1:
+        from sdrp_multichannel import sdrp_multichannel_receiver
+        for key in ("monitor", "monitor_interval"):
+            del kwargs[key]
+        kwargs.update(channels=args.channels, select=select, pin_cores=args.pin_cores)
+        run_headless(top_block_cls or sdrp_multichannel_receiver, kwargs)
+    elif args.headless:
+        run_headless(top_block_cls or sdrp_receiver, kwargs)
+    else:
+        from sdrp_receiver_gui import sdrp_receiver_gui, run_gui
+        run_gui(top_block_cls or sdrp_receiver_gui, kwargs)
 
 if __name__ == '__main__':
     main()
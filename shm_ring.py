@@ -0,0 +1,245 @@
+"""
+
+ Author: OMARF
+ Email: omarf@fossa.systems
+
+ Creation Date: 2026-10-18 12:20:41
+
+ Shared-memory frame transport between tag_to_pdu_udp_bb and the decoder.
+
+ A memory-mapped file in /dev/shm holds a single-producer ring of fixed
+ size frame slots. Every slot carries one datagram in the pdu_format wire
+ format, so the decoder handles it exactly like a UDP datagram.
+
+   ring header (64 bytes): magic b"SFRG", version, slot count, slot size,
+                           write sequence (frames written so far), epoch
+   slot: sequence + 1 (0 while being written), length, datagram
+
+ Readers never block the writer. Each one keeps its own cursor and detects
+ frames overwritten before it got to them, so overruns are counted exactly.
+ Several readers can share the work by taking every n-th frame.
+
+ The transport is lossy and copies: a reader that falls more than a ring
+ behind loses the oldest frames (counted as overruns), and every frame is
+ copied out of its slot, which the writer may reuse right after.
+
+ A mapped file is never resized. Every writer creates a new file, renames
+ it over the ring name and then bumps the epoch of the file it replaced.
+ Readers check the epoch once they have read the old file to its end and,
+ when it changed, map the new file and read it from its first frame.
+
+"""
+
+import mmap
+import os
+import struct
+import time
+
+
+SHM_DIR = "/dev/shm"
+RING_MAGIC = b"SFRG"
+RING_VERSION = 2
+
+RING_HEADER = struct.Struct("<4sIIIQQ")
+RING_HEADER_SIZE = 64
+WRITE_SEQ_OFFSET = 16
+EPOCH_OFFSET = 24
+
+SLOT_HEADER = struct.Struct("<QI")
+SLOT_ALIGN = 64
+
+RING_SLOTS = 1024
+SLOT_SIZE = 8192
+
+# Consumer poll period when the ring is empty
+POLL_INTERVAL = 0.001
+
+
+def ring_path(name):
+    return name if os.path.isabs(name) else os.path.join(SHM_DIR, name)
+
+
+def slot_stride(slot_size):
+    return -(-(SLOT_HEADER.size + slot_size) // SLOT_ALIGN) * SLOT_ALIGN
+
+
+def count_mine(start, end, consumer, consumers):
+    # Sequence numbers in [start, end) that belong to this consumer
+    def below(n):
+        return (n - consumer + consumers - 1) // consumers if n > consumer else 0
+    return max(0, below(end) - below(start))
+
+
+def map_header(path):
+    # The header of an existing ring, None if there is none
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return None
+    try:
+        if os.fstat(fd).st_size < RING_HEADER_SIZE:
+            return None
+        mm = mmap.mmap(fd, RING_HEADER_SIZE)
+    finally:
+        os.close(fd)
+    magic, version = RING_HEADER.unpack_from(mm, 0)[:2]
+    if magic != RING_MAGIC or version != RING_VERSION:
+        mm.close()
+        return None
+    return mm
+
+
+class ShmRingWriter():
+    def __init__(self, name, slots=RING_SLOTS, slot_size=SLOT_SIZE):
+        self.path = ring_path(name)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = slot_stride(slot_size)
+        size = RING_HEADER_SIZE + slots * self.stride
+
+        # Readers may still map the ring of a previous writer. It must not shrink under them,
+        # so a new file replaces it and the old one is only told that it is retired.
+        old = map_header(self.path)
+        self.epoch = RING_HEADER.unpack_from(old, 0)[5] + 1 if old is not None else 1
+        tmp_path = f"{self.path}.{os.getpid()}.new"
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+            RING_HEADER.pack_into(self.mm, 0, RING_MAGIC, RING_VERSION, slots, slot_size, 0, self.epoch)
+            os.rename(tmp_path, self.path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+        finally:
+            os.close(fd)
+        if old is not None:
+            # Readers of the old ring move to the new one once they see this
+            struct.pack_into("<Q", old, EPOCH_OFFSET, self.epoch)
+            old.close()
+        self.seq = 0
+        self.truncated = 0
+
+    def write(self, datagram):
+        length = len(datagram)
+        if length > self.slot_size:
+            self.truncated += 1
+            length = self.slot_size
+            datagram = datagram[:length]
+
+        offset = RING_HEADER_SIZE + (self.seq % self.slots) * self.stride
+        SLOT_HEADER.pack_into(self.mm, offset, 0, length)
+        self.mm[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + length] = datagram
+        SLOT_HEADER.pack_into(self.mm, offset, self.seq + 1, length)
+
+        self.seq += 1
+        struct.pack_into("<Q", self.mm, WRITE_SEQ_OFFSET, self.seq)
+
+    def close(self):
+        self.mm.close()
+
+
+class ShmRingReader():
+    def __init__(self, name, consumer=0, consumers=1, wait=True):
+        self.path = ring_path(name)
+        self.consumer = consumer
+        self.consumers = consumers
+        self.wait = wait
+        self.mm = None
+        self.attach()
+
+        # Start with new frames only
+        self.next = self.write_seq()
+        self.received = 0
+        self.overruns = 0
+        self.restarts = 0
+
+    def attach(self):
+        # Map the ring now at self.path, waiting for a writer if there is none yet
+        while 1:
+            try:
+                fd = os.open(self.path, os.O_RDONLY)
+                break
+            except FileNotFoundError:
+                if not self.wait:
+                    raise
+                time.sleep(0.5)
+        try:
+            while os.fstat(fd).st_size < RING_HEADER_SIZE:
+                time.sleep(0.1)
+            mm = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+        magic, version, slots, slot_size, _, epoch = RING_HEADER.unpack_from(mm, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            mm.close()
+            raise ValueError(f"{self.path} is not a frame ring")
+        if self.mm is not None:
+            self.mm.close()
+        self.mm = mm
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = slot_stride(slot_size)
+        self.epoch = epoch
+
+    def write_seq(self):
+        return struct.unpack_from("<Q", self.mm, WRITE_SEQ_OFFSET)[0]
+
+    def current_epoch(self):
+        return struct.unpack_from("<Q", self.mm, EPOCH_OFFSET)[0]
+
+    def restart(self):
+        # The writer restarted: map its ring and read it from the first frame
+        self.attach()
+        self.next = 0
+        self.restarts += 1
+
+    def read_slot(self, seq):
+        offset = RING_HEADER_SIZE + (seq % self.slots) * self.stride
+        stamp, length = SLOT_HEADER.unpack_from(self.mm, offset)
+        if stamp != seq + 1:
+            return None
+        # Copied, the writer may reuse the slot as soon as it is read
+        data = self.mm[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + min(length, self.slot_size)]
+        # Overwritten while copying
+        if SLOT_HEADER.unpack_from(self.mm, offset)[0] != seq + 1:
+            return None
+        return data
+
+    def poll(self, max_batch):
+        """Frames written since the last call, at most max_batch of them."""
+        write_seq = self.write_seq()
+        if self.next >= write_seq and self.current_epoch() != self.epoch:
+            # Retired and read to its end, go on with the ring that replaced it
+            self.restart()
+            write_seq = self.write_seq()
+        if write_seq - self.next > self.slots:
+            lost_to = write_seq - self.slots
+            self.overruns += count_mine(self.next, lost_to, self.consumer, self.consumers)
+            self.next = lost_to
+
+        batch = []
+        while self.next < write_seq and len(batch) < max_batch:
+            seq = self.next
+            self.next += 1
+            if seq % self.consumers != self.consumer:
+                continue
+            data = self.read_slot(seq)
+            if data is None:
+                self.overruns += 1
+            else:
+                batch.append(data)
+        self.received += len(batch)
+        return batch
+
+    def read_batch(self, max_batch):
+        # Block until at least one frame is available
+        while 1:
+            batch = self.poll(max_batch)
+            if batch:
+                return batch
+            time.sleep(POLL_INTERVAL)
+
+    def close(self):
+        self.mm.close()
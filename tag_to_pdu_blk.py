@@ -5,97 +5,169 @@
 
  Creation Date: 2025-09-08 11:48:44
 
- 
+
 
 """
 
+from collections import deque
 from gnuradio import gr
 import numpy as np
 import pmt
 import socket
+import time
+from pdu_format import pack_pdu, ASM_SCORE_UNKNOWN, PDU_HEADER_SIZE
+from shm_ring import ShmRingWriter, SLOT_SIZE
+
+# Smallest circular buffer, in items
+MIN_RING_LEN = 16384
+
 
 class tag_to_pdu_udp_bb(gr.basic_block):
-    def __init__(self, tag_key="ac_found", pdu_len=1441, udp_ip="127.0.0.1", udp_port=52001):
+    def __init__(self, tag_key="ac_found", pdu_len=1441, udp_ip="127.0.0.1", udp_port=52001, packed=True, soft=False, shm_name=None,
+                 frame_lens=None, margin=0):
+        # With soft enabled a second input carries int8 soft symbols aligned with the hard bits.
+        # frame_lens maps tag keys to PDU lengths for several frame kinds, replacing tag_key and pdu_len.
+        # A tuple of lengths sends a PDU of each length, shortest first, as soon as its bits are in:
+        # the shorter ones are prefixes for the shortened frame kinds, flagged FLAG_SHORTENED.
+        # margin (0 or SLIP_MARGIN) bits of context are sent on both sides of every frame, packed PDUs only.
         gr.basic_block.__init__(
             self,
             name="tag_to_pdu_udp_bb",
-            in_sig=[np.uint8],
+            in_sig=[np.uint8, np.int8] if soft else [np.uint8],
             out_sig=[]
         )
-        self.tag_key = pmt.intern(tag_key)
-        self.pdu_len = pdu_len
-        self.buffer = np.array([], dtype=np.uint8)
-        self.waiting_for_pdu = False
-
-         # Keep only last 64 samples
+        self.soft = soft
+        if margin and not packed:
+            raise ValueError("Legacy PDUs cannot carry a margin")
+        self.margin = margin
+        self.frame_lens = {key: tuple(sorted(lengths)) if isinstance(lengths, (tuple, list)) else (lengths,)
+                           for key, lengths in (frame_lens or {tag_key: pdu_len}).items()}
+        self.shortened = any(len(lengths) > 1 for lengths in self.frame_lens.values())
+        if self.shortened and not packed:
+            raise ValueError("Legacy PDUs cannot carry the prefixes of shortened frames")
+        # The longest frame and its margins size the buffers
+        self.pdu_len = max(max(lengths) for lengths in self.frame_lens.values()) + 2 * margin
+
+        # Frames start this many samples before the tag
         self.pre_tag_len = 64
-        self.last_64 = np.array([], dtype=np.uint8)
 
-        # Setup UDP socket
+        # Circular buffer indexed by absolute item offset. Row 0 hard bits and, with
+        # soft enabled, row 1 soft symbols as offset binary (0 strong zero, 255 strong one).
+        # Input is written in pieces small enough that no pending frame is ever
+        # overwritten, so memory stays constant however long the stream runs.
+        self.ring_len = MIN_RING_LEN
+        while self.ring_len < 2 * (self.pdu_len + self.pre_tag_len):
+            self.ring_len *= 2
+        self.ring = np.zeros((2 if soft else 1, self.ring_len), dtype=np.uint8)
+        self.max_piece = self.ring_len - self.pdu_len - self.pre_tag_len
+        self.frame = np.empty((self.ring.shape[0], self.pdu_len), dtype=np.uint8)
+        self.written = 0
+
+        # Start offset, ASM score and length of every frame or prefix still being collected
+        self.pending = deque()
+
+        # Setup UDP socket, or the shared-memory ring when a name is given
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.udp_ip = udp_ip
         self.udp_port = udp_port
+        # Slots sized for the largest datagram, soft or legacy PDUs take a byte per bit
+        self.shm = ShmRingWriter(shm_name, slot_size=max(SLOT_SIZE, PDU_HEADER_SIZE + self.pdu_len)) if shm_name else None
         self.counter = 0
+        self.skipped = 0
+
+        # Send bit-packed frames with a metadata header instead of one bit per byte
+        self.packed = packed
+
+    def write(self, input_items, start, count):
+        # Copy input items [start, start + count) into the ring, wrapping once at most
+        pos = self.written % self.ring_len
+        first = min(count, self.ring_len - pos)
+        for dst, src in ((slice(pos, pos + first), slice(start, start + first)),
+                         (slice(0, count - first), slice(start + first, start + count))):
+            self.ring[0, dst] = input_items[0][src]
+            if self.soft:
+                np.bitwise_xor(input_items[1][src].view(np.uint8), 0x80, out=self.ring[1, dst])
+        self.written += count
+
+    def extract(self, start, length):
+        # View of the frame starting at absolute offset start, copied only when it wraps
+        pos = start % self.ring_len
+        if pos + length <= self.ring_len:
+            return self.ring[:, pos:pos + length]
+        first = self.ring_len - pos
+        self.frame[:, :first] = self.ring[:, pos:]
+        self.frame[:, first:length] = self.ring[:, :length - first]
+        return self.frame[:, :length]
+
+    def send(self, frame, offset, asm_score):
+        # offset is the first frame bit, after the margin
+        pdu_bytes = frame[0]
+        soft_bytes = frame[1] if self.soft else None
+
+        # Print (optional)
+        # print(f"\n🔔 PDU ready: {len(pdu_bytes)} bytes")
+        # print(list(pdu_bytes[:20]), "...")
+
+        # Send over UDP
+        try:
+            if self.packed:
+                datagram = pack_pdu(pdu_bytes, self.counter, offset, time.time(), asm_score, soft_bytes, self.margin,
+                                    self.shortened)
+            else:
+                datagram = pdu_bytes.tobytes()
+            if self.shm:
+                self.shm.write(datagram)
+                self.counter += 1
+                print(f"Wrote PDU to {self.shm.path}, ctr {self.counter}")
+                return
+            self.sock.sendto(datagram, (self.udp_ip, self.udp_port))
+            self.counter += 1
+            print(f"Sent PDU to {self.udp_ip}:{self.udp_port}, ctr {self.counter}")
+        except Exception as e:
+            print(f"UDP send failed: {e}")
 
     def general_work(self, input_items, output_items):
-        in0 = input_items[0]
         nread = self.nitems_read(0)
-        ninput = len(in0)
-
-        # If not buffering, look for tag
-        if not self.waiting_for_pdu:
-            tags = self.get_tags_in_range(0, nread, nread + ninput)
-            for tag in tags:
-                if tag.key == self.tag_key:
-                    relative_offset = tag.offset - nread - 64
-                    # print(f"[INFO] Tag found at offset {tag.offset}, relative offset {relative_offset} start buffering.")
-                    if 0 <= relative_offset < ninput:
-                        self.buffer = in0[relative_offset:].copy()
-                        self.waiting_for_pdu = True
-                        break
-                    elif relative_offset < 0:
-                        self.buffer = np.concatenate((self.last_64[relative_offset:], in0[0:]))
-                        self.waiting_for_pdu = True
-                        break
-
-        else:
-            # Continue buffering
-            self.buffer = np.concatenate((self.buffer, in0))
-
-        # If full PDU is ready
-        if self.waiting_for_pdu and len(self.buffer) >= self.pdu_len:
-            pdu_bytes = self.buffer[:self.pdu_len]
-            meta = pmt.make_dict()
-            vec = pmt.init_u8vector(self.pdu_len, list(pdu_bytes))
-            pdu = pmt.cons(meta, vec)
-
-            # Print (optional)
-            # print(f"\n🔔 PDU ready: {self.pdu_len} bytes")
-            # print(list(pdu_bytes[:20]), "...")
-
-            # Send over UDP
-            try:
-                self.sock.sendto(pdu_bytes.tobytes(), (self.udp_ip, self.udp_port))
-                self.counter += 1
-                print(f"Sent PDU to {self.udp_ip}:{self.udp_port}, ctr {self.counter}")
-            except Exception as e:
-                print(f"UDP send failed: {e}")
-
-            # Reset
-            self.buffer = np.array([], dtype=np.uint8)
-            self.waiting_for_pdu = False
-        
-        # Save last 64 symbols for next execution
-        if len(in0) >= self.pre_tag_len:
-            self.last_64 = in0[-self.pre_tag_len:].copy()
-        else:
-            self.last_64 = np.concatenate((self.last_64, in0))
-            if len(self.last_64) > self.pre_tag_len:
-                self.last_64 = self.last_64[-self.pre_tag_len:]
-
-        self.consume(0, ninput)
+        ninput = min(len(items) for items in input_items)
+
+        # Every tag in range starts a frame, even while earlier ones are still being collected
+        for tag in self.get_tags_in_range(0, nread, nread + ninput):
+            lengths = self.frame_lens.get(pmt.symbol_to_string(tag.key))
+            if lengths is not None:
+                start = tag.offset - self.pre_tag_len - self.margin
+                asm_score = pmt.to_long(tag.value) if pmt.is_integer(tag.value) else ASM_SCORE_UNKNOWN
+                # print(f"[INFO] Tag found at offset {tag.offset}, start buffering at {start}.")
+                if start < 0:
+                    # Start of stream, the samples before the tag were never seen
+                    self.skipped += 1
+                    continue
+                self.queue_frame(start, asm_score, lengths)
+
+        self.collect(input_items, ninput)
+        self.consume_each(ninput)
         return ninput if ninput > 0 else 1
 
+    def queue_frame(self, start, asm_score, lengths):
+        # One PDU per length, the prefixes go out first as their bits come in
+        for length in lengths:
+            self.pending.append((start, asm_score, length + 2 * self.margin))
+
+    def collect(self, input_items, ninput):
+        # Store the input and send the pending frames it completes
+        done = 0
+        while done < ninput:
+            count = min(ninput - done, self.max_piece)
+            self.write(input_items, done, count)
+            done += count
+
+            # Send every frame that is complete, short frames do not wait for longer ones started earlier
+            for item in [item for item in self.pending if item[0] + item[2] <= self.written]:
+                self.pending.remove(item)
+                start, asm_score, length = item
+                self.send(self.extract(start, length), start + self.margin, asm_score)
+
     def stop(self):
         self.sock.close()
+        if self.shm:
+            self.shm.close()
         return True